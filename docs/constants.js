@@ -8,6 +8,7 @@ const COLUMNS = 5;
 const NORTH_PLAYER = "north";
 const SOUTH_PLAYER = "south";
 const SOLO_MODE = "solo";
+const SPECTATOR_MODE = "spectator";
 const PLAYERS = [NORTH_PLAYER, SOUTH_PLAYER];
 
 // must match css classes
@@ -106,6 +107,7 @@ export {
   NORTH_PLAYER,
   SOUTH_PLAYER,
   SOLO_MODE,
+  SPECTATOR_MODE,
   PLAYERS,
   HIGHLIGHT,
   CHOSEN_START,
@@ -5,6 +5,7 @@ import {
   NORTH_PLAYER,
   SOUTH_PLAYER,
   SOLO_MODE,
+  SPECTATOR_MODE,
 } from "./constants.js";
 
 import {
@@ -37,21 +38,99 @@ import {
 // 0 means we aren't waiting for any input.
 let CHOICE_ID = 0;
 
+// The player view from the server, kept up to date by applying each STATE_DELTA
+// to the last full STATE_CHANGE.  STATE_VERSION is the version of PLAYER_VIEW.
+let PLAYER_VIEW = null;
+let STATE_VERSION = 0;
+
+// The token for resuming the match if the connection drops, from the SESSION event.
+// Kept in sessionStorage so that reloading the page resumes the match too.
+const RESUME_TOKEN_KEY = "resumeToken";
+
+// Close code for a server restart; see server/session.py.
+const SERVICE_RESTART = 1012;
+
+// How long to wait before reconnecting after the connection drops.
+const RECONNECT_DELAY_MS = 1000;
+
+class Connection extends EventTarget {
+  // A websocket that reconnects when the connection drops during a match.
+  // Passes on the current websocket's "open" and "message" events.
+  constructor(url) {
+    super();
+    this.url = url;
+    this.connect();
+  }
+
+  connect() {
+    this.socket = new WebSocket(this.url);
+    this.socket.addEventListener("open", () => {
+      this.dispatchEvent(new Event("open"));
+    });
+    this.socket.addEventListener("message", ({ data }) => {
+      this.dispatchEvent(new MessageEvent("message", { data }));
+    });
+    this.socket.addEventListener("close", ({ wasClean, code }) => {
+      // the server closes cleanly when the match is over,
+      // or with SERVICE_RESTART when it's saved the match to carry on after a restart
+      const resumable = !wasClean || code === SERVICE_RESTART;
+      if (resumable && sessionStorage.getItem(RESUME_TOKEN_KEY) !== null) {
+        console.log("Connection dropped; reconnecting");
+        CHOICE_ID = 0;
+        window.setTimeout(() => this.connect(), RECONNECT_DELAY_MS);
+      }
+    });
+  }
+
+  send(data) {
+    // clicks while reconnecting are dropped
+    if (this.socket.readyState === WebSocket.OPEN) {
+      this.socket.send(data);
+    }
+  }
+}
+
+// Handlers for each type of server event, registered with `onEvent`.
+const EVENT_HANDLERS = {};
+
+function onEvent(type, handler) {
+  EVENT_HANDLERS[type] = EVENT_HANDLERS[type] || [];
+  EVENT_HANDLERS[type].push(handler);
+}
+
+function dispatchEvents(websocket) {
+  // parse each message once and pass each event to its handlers in order
+  // a BATCH message carries all the events for one decision point
+  websocket.addEventListener("message", ({ data }) => {
+    const message = JSON.parse(data);
+    const events = message.type === "BATCH" ? message.events : [message];
+    for (const event of events) {
+      for (const handler of EVENT_HANDLERS[event.type] || []) {
+        handler(event);
+      }
+    }
+  });
+}
+
 function joinGame(prompt, websocket) {
   websocket.addEventListener("open", () => {
     // send an "join" event informing the server which player we are
     // based on hardcoded url ?player=north or ?player=south, or ?player=solo
     // and ?tiles=random, ?tiles=default, or ?tiles=new
+    // and optionally ?room=<name> to play PVP in a separate room
+    // or ?player=spectator&room=<name> to watch the match in a room;
+    // a solo match's room is logged when it starts
     const params = new URLSearchParams(window.location.search);
     const player = params.get("player").toLowerCase();
-    const tiles = params.get("tiles").toLowerCase();
-    if (! (player === NORTH_PLAYER || player === SOUTH_PLAYER || player === SOLO_MODE)) {
-      const msg = `⚠️⚠️⚠️<br>Set your url to ?player=${NORTH_PLAYER} or ?player=${SOUTH_PLAYER} or ?player=${SOLO_MODE}<br>⚠️⚠️⚠️`;
+    const tiles = (params.get("tiles") || "").toLowerCase();
+    const room = params.get("room");
+    if (! (player === NORTH_PLAYER || player === SOUTH_PLAYER || player === SOLO_MODE || player === SPECTATOR_MODE)) {
+      const msg = `⚠️⚠️⚠️<br>Set your url to ?player=${NORTH_PLAYER} or ?player=${SOUTH_PLAYER} or ?player=${SOLO_MODE} or ?player=${SPECTATOR_MODE}<br>⚠️⚠️⚠️`;
       prompt.innerHTML = msg;
       console.log(params);
       throw new Error(msg);
     }
-    if (! (tiles === "random" || tiles === "default" || tiles === "new")) {
+    if (player !== SPECTATOR_MODE && ! (tiles === "random" || tiles === "default" || tiles === "new")) {
       const msg = `⚠️⚠️⚠️<br>Set your url to ?tiles=random, ?tiles=default, or ?tiles=new<br>⚠️⚠️⚠️`;
       prompt.innerHTML = msg;
       console.log(params);
@@ -62,6 +141,14 @@ function joinGame(prompt, websocket) {
       player,
       tiles
     };
+    if (room) {
+      event.room = room;
+    }
+    // rejoin the running match if we were disconnected
+    const token = sessionStorage.getItem(RESUME_TOKEN_KEY);
+    if (token !== null) {
+      event.resume = token;
+    }
     websocket.send(JSON.stringify(event));
   });
 }
@@ -88,22 +175,26 @@ window.addEventListener("DOMContentLoaded", () => {
   const infoPanel = document.querySelector(".player-info");
 
   // Open the WebSocket connection and register event handlers.
-  const websocket = new WebSocket(getWebSocketServer());
+  const websocket = new Connection(getWebSocketServer());
 
   const actionPanel = document.querySelector(".actions");
   joinGame(prompt, websocket);
 
   sendSelection(board, actionPanel, infoPanel, websocket);
 
-  receiveSelection(board, actionPanel, websocket);
+  receiveSelection(board, actionPanel);
 
   receiveMoves(board, actionPanel, websocket);
 
-  receivePrompt(prompt, websocket);
+  receivePrompt(prompt);
 
-  receiveHighlights(board, actionPanel, infoPanel, websocket);
+  receiveHighlights(board, actionPanel, infoPanel);
 
-  receiveGameOver(websocket);
+  receiveGameOver();
+
+  receiveSession();
+
+  dispatchEvents(websocket);
 });
 
 function showMessage(message) {
@@ -173,42 +264,34 @@ function sendSelection(board, actionPanel, infoPanel, websocket) {
   });
 }
 
-function receiveSelection(board, actionPanel, websocket) {
+function receiveSelection(board, actionPanel) {
   // update the UI with changes to the current (partially) selected moves.
   // the server should call this again with null selections to clear the highlights.
-  websocket.addEventListener("message", ({ data }) => {
-    const event = JSON.parse(data);
-
-    if (event.type === "SELECTION_CHANGE") {
-      const player = event["player"];
-      const start = event["start"];
-      const action = event["action"];
-      const target = event["target"];
-
-      markChosenStart(board, start, player);
-      markChosenAction(actionPanel, action);
-      markChosenTarget(board, target, player);
-    }
+  onEvent("SELECTION_CHANGE", (event) => {
+    const player = event["player"];
+    const start = event["start"];
+    const action = event["action"];
+    const target = event["target"];
+
+    markChosenStart(board, start, player);
+    markChosenAction(actionPanel, action);
+    markChosenTarget(board, target, player);
   });
 }
 
-function receiveHighlights(board, actionPanel, infoPanel, websocket) {
+function receiveHighlights(board, actionPanel, infoPanel) {
   // highlight possible squares, actions, responses, or tiles in hand
   // the server should call this again with empty lists to clear the highlights
-  websocket.addEventListener("message", ({ data }) => {
-    const event = JSON.parse(data);
-
-    if (event.type === "HIGHLIGHT_CHANGE") {
-      const squares = event["squares"];
-      const actions = event["actions"];
-      const handTiles = event["handTiles"];
-      const boardTiles = event["boardTiles"];
-
-      highlightSquares(squares, board);
-      highlightActions(actions, actionPanel);
-      highlightHand(handTiles, infoPanel);
-      highlightBoardTiles(boardTiles, board);
-    }
+  onEvent("HIGHLIGHT_CHANGE", (event) => {
+    const squares = event["squares"];
+    const actions = event["actions"];
+    const handTiles = event["handTiles"];
+    const boardTiles = event["boardTiles"];
+
+    highlightSquares(squares, board);
+    highlightActions(actions, actionPanel);
+    highlightHand(handTiles, infoPanel);
+    highlightBoardTiles(boardTiles, board);
   });
 }
 
@@ -216,37 +299,64 @@ function receiveMoves(board, actionPanel, websocket) {
   // update the UI with changes to the persistent game state
   const log = document.querySelector(".log");
 
-  websocket.addEventListener("message", ({ data }) => {
-    const event = JSON.parse(data);
+  function render() {
+    renderBoard(board, PLAYER_VIEW, actionPanel);
+    renderLog(log, PLAYER_VIEW);
+    renderWebs(board, PLAYER_VIEW);
+    renderHand(PLAYER_VIEW);
+    renderOther(PLAYER_VIEW);
+  }
 
-    if (event.type === "STATE_CHANGE") {
-      const player_view = event["playerView"];
+  onEvent("STATE_CHANGE", (event) => {
+    PLAYER_VIEW = event["playerView"];
+    STATE_VERSION = event.version;
+    render();
+  });
 
-      renderBoard(board, player_view, actionPanel);
-      renderLog(log, player_view);
-      renderWebs(board, player_view);
-      renderHand(player_view);
-      renderOther(player_view);
+  onEvent("STATE_DELTA", (event) => {
+    if (PLAYER_VIEW === null || event.baseVersion !== STATE_VERSION) {
+      // we missed an update; ask for the full state and wait for it
+      if (PLAYER_VIEW !== null) {
+        console.log(`Missed state version ${STATE_VERSION + 1}; resyncing`);
+        websocket.send(JSON.stringify({ type: "RESYNC" }));
+        PLAYER_VIEW = null;
+      }
+      return;
     }
+    PLAYER_VIEW = applyDelta(PLAYER_VIEW, event);
+    STATE_VERSION = event.version;
+    render();
   });
 }
 
-function receivePrompt(prompt, websocket) {
-  websocket.addEventListener("message", ({ data }) => {
-    const event = JSON.parse(data);
-    if (event.type === "PROMPT") {
-      prompt.innerHTML = event.prompt;
-      CHOICE_ID = parseInt(event.choiceId);
-    }
+function applyDelta(playerView, delta) {
+  // replace the changed fields and append the new log lines
+  const patched = { ...playerView, ...delta.changes };
+  if (delta.logAppend.length > 0) {
+    patched.public_log = patched.public_log.concat(delta.logAppend);
+  }
+  return patched;
+}
+
+function receivePrompt(prompt) {
+  onEvent("PROMPT", (event) => {
+    prompt.innerHTML = event.prompt;
+    CHOICE_ID = parseInt(event.choiceId);
   });
 }
 
-function receiveGameOver(websocket) {
-  websocket.addEventListener("message", ({ data }) => {
-    const event = JSON.parse(data);
-    if (event.type === "MATCH_CHANGE") {
-      alert(event.message);
+function receiveSession() {
+  onEvent("SESSION", (event) => {
+    sessionStorage.setItem(RESUME_TOKEN_KEY, event.token);
+    if (event.room) {
+      console.log(`Spectators can watch at ?player=${SPECTATOR_MODE}&room=${event.room}`);
     }
   });
 }
 
+function receiveGameOver() {
+  onEvent("MATCH_CHANGE", (event) => {
+    alert(event.message);
+  });
+}
+
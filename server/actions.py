@@ -1,7 +1,10 @@
+from collections import deque
 from typing import Optional
-import random
+from random import Random
 
 from server.state import State
+from server import bitboard, trace
+from server.bitboard import Bitboard
 from server.constants import (
     Square,
     Action,
@@ -41,7 +44,16 @@ def path(start: Square, target: Square) -> list[Square]:
     Return a list of squares from start to target
         excludes start
         includes target (if different from start)
+
+    If the squares aren't in a straight line or diagonal (e.g. a knight-like jump),
+    the move passes over nothing, so the path is just the target.
     """
+    if (
+        start != target
+        and bitboard.BETWEEN[bitboard.index(start)][bitboard.index(target)] is None
+    ):
+        return [target]
+
     # find the direction target is from start
     row_change = 1 if target.row > start.row else -1 if target.row < start.row else 0
     col_change = 1 if target.col > start.col else -1 if target.col < start.col else 0
@@ -64,40 +76,46 @@ def _all_distances(
     Return the distance from the start to all squares, with routes:
         - allowed to end on an obstruction
         - not allowed to pass through an obstruction as an intermediate step
+
+    On the game board this reads the memoized `bitboard.distance_layers`.
     """
     assert start not in obstructions
     assert 0 <= start.row < rows and 0 <= start.col < cols
     assert all(0 <= s.row < rows and 0 <= s.col < cols for s in obstructions)
 
-    explored: dict[Square, int] = {}
+    if rows == ROWS and cols == COLUMNS:
+        layers = bitboard.distance_layers(
+            bitboard.index(start), bitboard.to_mask(obstructions)
+        )
+        return {
+            s: dist
+            for dist, layer in enumerate(layers)
+            for s in bitboard.squares_in(layer)
+        }
 
-    to_explore = [start]
-    to_explore_dists = [0]
+    # other board sizes (e.g. in tests) fall back to a plain BFS
+    return _bfs_distances(start, obstructions, rows, cols)
 
-    while to_explore:
-        s = to_explore.pop(0)
-        dist = to_explore_dists.pop(0)
-        if s in explored:
-            continue
 
-        explored[s] = dist
+def _bfs_distances(
+    start: Square, obstructions: list[Square], rows: int, cols: int
+) -> dict[Square, int]:
+    """Uncached breadth-first search for `_all_distances` on any board size."""
+    blocked = set(obstructions)
+    explored = {start: 0}
+    to_explore = deque([start])
 
-        if s in obstructions:
+    while to_explore:
+        s = to_explore.popleft()
+        if s in blocked:
             continue
 
-        for r, c in [
-            (s.row - 1, s.col - 1),
-            (s.row - 1, s.col + 0),
-            (s.row - 1, s.col + 1),
-            (s.row + 0, s.col - 1),
-            (s.row + 0, s.col + 1),
-            (s.row + 1, s.col - 1),
-            (s.row + 1, s.col + 0),
-            (s.row + 1, s.col + 1),
-        ]:
-            if 0 <= r < rows and 0 <= c < cols and Square(row=r, col=c) not in explored:
-                to_explore.append(Square(row=r, col=c))
-                to_explore_dists.append(dist + 1)
+        for r in range(max(s.row - 1, 0), min(s.row + 2, rows)):
+            for c in range(max(s.col - 1, 0), min(s.col + 2, cols)):
+                neighbor = Square(row=r, col=c)
+                if neighbor not in explored:
+                    explored[neighbor] = explored[s] + 1
+                    to_explore.append(neighbor)
     return explored
 
 
@@ -106,7 +124,7 @@ def _manhattan_dist(s1: Square, s2: Square) -> int:
 
 
 def grapple_end_square(
-    start: Square, target: Square, obstructions: list[Square]
+    start: Square, target: Square, obstructions: Bitboard = 0
 ) -> Optional[Square]:
     """
     If the grapple is valid, return the square the enemy is pulled to.
@@ -118,105 +136,81 @@ def grapple_end_square(
     The end square is the square adjacent to `start` which is nearest to `target` -
     i.e. the first square along the line of sight.
     """
-    row_diff = target.row - start.row
-    col_diff = target.col - start.col
-
-    if not (
-        row_diff == 0
-        and col_diff != 0
-        or row_diff != 0
-        and col_diff == 0
-        or abs(row_diff) == abs(col_diff)
-    ):
+    between = bitboard.BETWEEN[bitboard.index(start)][bitboard.index(target)]
+    if between is None:
         # not in a straight line / diagonal
         return None
 
-    # which direction is a single step from start towards target?
-    row_step = row_diff // abs(row_diff) if row_diff != 0 else 0
-    col_step = col_diff // abs(col_diff) if col_diff != 0 else 0
-    assert row_step != 0 or col_step != 0
-
-    end_square = Square(row=start.row + row_step, col=start.col + col_step)
-
-    # walk through the path and make sure no obstructions
-    current_square = start
-    while True:
-        next_square = Square(
-            row=current_square.row + row_step, col=current_square.col + col_step
-        )
-        # should never walk off board without hitting target
-        assert 0 <= next_square.row < ROWS
-        assert 0 <= next_square.col < COLUMNS
-
-        if next_square == target:
-            # this is the final square before target
-            return end_square
-
-        if next_square in obstructions:
-            # we hit an obstruction first; this is not a legal move
-            return None
+    if between & obstructions:
+        # we hit an obstruction first; this is not a legal move
+        return None
 
-        current_square = next_square
+    # a single step from start towards target
+    row_diff = target.row - start.row
+    col_diff = target.col - start.col
+    row_step = (row_diff > 0) - (row_diff < 0)
+    col_step = (col_diff > 0) - (col_diff < 0)
+    return Square(row=start.row + row_step, col=start.col + col_step)
 
 
-def _explosion_hits(center: Square, positions: list[Square]) -> list[Square]:
+def _explosion_hits(center: Square, positions: Bitboard) -> list[Square]:
     """
     Return a possibly-empty list of tile positions hit by a 3x3 explosion centered on `center`.
     """
-    return [
-        hit
-        for hit in positions
-        if abs(center.row - hit.row) <= 1 and abs(center.col - hit.col) <= 1
-    ]
+    return bitboard.squares_in(bitboard.EXPLOSION[bitboard.index(center)] & positions)
 
 
-def _midpoint(x: Square, y: Square) -> Square:
-    new_row = (x.row + y.row) // 2
-    new_col = (x.col + y.col) // 2
-    return Square(new_row, new_col)
+# GRENADE_THROWS[i] is a list of (target, midpoint) bit pairs:
+# the squares exactly 2 away from square i in a cardinal direction, and the square they roll over
+GRENADE_THROWS: list[list[tuple[Bitboard, Bitboard]]] = [
+    [
+        (
+            bitboard.bit(t),
+            bitboard.bit(Square((s.row + t.row) // 2, (s.col + t.col) // 2)),
+        )
+        for t in [
+            Square(s.row + 2, s.col),
+            Square(s.row - 2, s.col),
+            Square(s.row, s.col + 2),
+            Square(s.row, s.col - 2),
+        ]
+        if t.on_board()
+    ]
+    for s in bitboard.SQUARES
+]
 
 
 def _grenade_targets(
-    start: Square, all_positions: list[Square], enemy_positions: list[Square]
-) -> list[Square]:
+    start: Square, obstructions: Bitboard, enemies: Bitboard
+) -> Bitboard:
     """
-    Return a possibly-empty list of valid squares to target a grenade.
+    Return a possibly-empty mask of valid squares to target a grenade.
 
     Grenades can be thrown exactly 2 squares in a cardinal direction onto an empty square.
     They respect LOS (i.e. they cannot go over obstructions).
 
     For now we restrict to squares that hit at least one enemy to reduce misclicks.
     """
-    assert len(enemy_positions) > 0
-    assert all(e in all_positions for e in enemy_positions)
+    assert enemies
+    assert enemies & obstructions == enemies
 
-    # start with the empty squares at range
-    potential_targets = [
-        t
-        for t in [
-            Square(start.row + 2, start.col),
-            Square(start.row - 2, start.col),
-            Square(start.row, start.col + 2),
-            Square(start.row, start.col - 2),
-        ]
-        if t.on_board()
-        and not t in all_positions
-        and not _midpoint(start, t) in all_positions
-    ]
+    targets = 0
+    for target, midpoint in GRENADE_THROWS[bitboard.index(start)]:
+        # start with the empty squares at range
+        if (target | midpoint) & obstructions:
+            continue
 
-    # filter to ones that hit at least one enemy
-    return [
-        target
-        for target in potential_targets
-        if any(hit in enemy_positions for hit in _explosion_hits(target, all_positions))
-    ]
+        # filter to ones that hit at least one enemy
+        if bitboard.EXPLOSION[target.bit_length() - 1] & enemies:
+            targets |= target
+    return targets
 
 
 def _fireball_targets(
-    start: Square, obstructions: list[Square], enemies_and_webs: list[Square]
-) -> list[Square]:
+    start: Square, obstructions: Bitboard, enemies_and_webs: Bitboard
+) -> Bitboard:
     """
-    Return a possibly-empty list of valid squares to target a fireball.
+    Return a possibly-empty mask of valid squares to target a fireball.
 
     Fireballs travel diagonally in a straight line until they hit a tile, a web belonging to either player,
     or right before the edge of the board.  They explode on impact and destroy any tiles or webs in a 3x3 area
@@ -224,51 +218,34 @@ def _fireball_targets(
 
     For now we restrict to squares that hit at least one enemy or web to reduce misclicks.
     """
-    assert len(enemies_and_webs) > 0
-    assert all(t in obstructions for t in enemies_and_webs)
-    if start in obstructions:
-        obstructions.remove(start)
-
-    # start by finding the impact square in each diagonal direction
-    impact_squares = []
-    for row_step, col_step in [(1, 1), (1, -1), (-1, 1), (-1, -1)]:
-        t = start
-        next_t = Square(t.row + row_step, t.col + col_step)
-        # stop if this square is an obstruction, or the next square is off the board
-        while not t in obstructions and next_t.on_board():
-            t = next_t
-            next_t = Square(t.row + row_step, t.col + col_step)
-        impact_squares.append(t)
-
-    # filter to squares that hit at least one enemy or web
-    return [
-        t
-        for t in impact_squares
-        if any(hit in enemies_and_webs for hit in _explosion_hits(t, obstructions))
-    ]
-
+    assert enemies_and_webs
+    assert enemies_and_webs & obstructions == enemies_and_webs
+    start_index = bitboard.index(start)
+    obstructions &= ~(1 << start_index)
+    enemies_and_webs &= ~(1 << start_index)
+
+    targets = 0
+    for row_step, col_step in bitboard.DIAGONALS:
+        # start by finding the impact square in each diagonal direction:
+        # the nearest obstruction, or the last square before the edge of the board
+        ray = bitboard.RAYS[(row_step, col_step)][start_index]
+        hits = ray & obstructions
+        # rays with a positive row step go towards higher bit indices
+        if hits:
+            impact = hits & -hits if row_step > 0 else 1 << (hits.bit_length() - 1)
+        elif ray:
+            impact = 1 << (ray.bit_length() - 1) if row_step > 0 else ray & -ray
+        else:
+            # already on the edge of the board
+            impact = 1 << start_index
 
-def _knight_targets(start: Square, state: State) -> list[Square]:
-    """
-    Return a list of squares that are valid targets for a knight-like move.
-    """
-    targets = []
-    for row_step, col_step in [
-        (1, 2),
-        (1, -2),
-        (-1, 2),
-        (-1, -2),
-        (2, 1),
-        (2, -1),
-        (-2, 1),
-        (-2, -1),
-    ]:
-        square = Square(start.row + row_step, start.col + col_step)
-        if square.on_board():
-            targets.append(square)
+        # filter to squares that hit at least one enemy or web
+        if bitboard.EXPLOSION[impact.bit_length() - 1] & enemies_and_webs:
+            targets |= impact
     return targets
 
 
+@trace.traced
 def valid_targets(start: Square, state: State) -> dict[Action, list[Square]]:
     """
     What are the valid actions for the current player from the start square,
@@ -277,62 +254,58 @@ def valid_targets(start: Square, state: State) -> dict[Action, list[Square]]:
     The square lists will be non-empty; if an action has no valid target, then
     it's not currently a valid action.
     """
+    start_index = bitboard.index(start)
+    start_bit = 1 << start_index
+    allies = bitboard.player_mask(state, state.current_player)
+    enemies = bitboard.player_mask(state, state.other_player)
 
     # all other tiles are obstructions that block line of sight
-    obstructions = [s for s in state.all_positions() if s != start]
-    distances = _all_distances(start, obstructions)
+    obstructions = (allies | enemies) & ~start_bit
+    layers = bitboard.distance_layers(start_index, obstructions)
+    reachable = 0
+    for layer in layers:
+        reachable |= layer
 
     coins = state.coins[state.current_player]
 
-    enemy_positions = state.positions[state.other_player]
-
-    empty_targets = {s: dist for s, dist in distances.items() if s not in obstructions}
-    enemy_targets = {s: dist for s, dist in distances.items() if s in enemy_positions}
+    # includes the start square at distance 0
+    empty_targets = reachable & ~obstructions
+    enemy_targets = reachable & enemies
 
     # there must be enemies or the game would have ended
-    assert len(enemy_targets) > 0
+    assert enemy_targets
 
     # these actions cost no coins
     # and move to any empty square at some distance
     #
-    # here we'll allow empty lists when there is no valid target square;
+    # here we'll allow empty masks when there is no valid target square;
     # we'll drop those keys at the end
     flower_range = 2 if state.x2_tile == Tile.FLOWER else 1
     bird_range = 4 if state.x2_tile == Tile.BIRD else 2
     backstab_move_range = 4 if state.x2_tile == Tile.BACKSTABBER else 2
     ram_range = 2 if state.x2_tile == Tile.RAM else 1
+    within_manhattan = bitboard.WITHIN_MANHATTAN[start_index]
 
     # TODO: manhattan distance should probably respect obstructions too
-    bird_targets = [
-        s
-        for s, _ in empty_targets.items()
-        if 1 <= _manhattan_dist(start, s) <= bird_range
-    ]
+    bird_targets = empty_targets & within_manhattan[bird_range]
     spider_targets = bird_targets
+    ram_targets = 0
     if coins >= RAM_COST:
         # to reduce misclicks, only allow ram moves that knockback an enemy
-        def _hits_any_enemy(s: Square) -> bool:
-            hits = _ram_knockback_targets(start, s, state)
-            enemy_hits = set(hits) & set(enemy_positions)
-            return len(enemy_hits) > 0
-
-        ram_targets = [
-            s
-            for s, _ in empty_targets.items()
-            if 1 <= _manhattan_dist(start, s) <= ram_range and _hits_any_enemy(s)
-        ]
-    else:
-        ram_targets = []
-    # will append backstab enemy targets later
-    backstab_targets = [
-        s
-        for s, _ in empty_targets.items()
-        if 1 <= _manhattan_dist(start, s) <= backstab_move_range
-    ]
-
-    actions: dict[Action, list[Square]] = {
-        OtherAction.MOVE: [s for s, dist in empty_targets.items() if dist == 1],
-        Tile.FLOWER: [s for s, dist in empty_targets.items() if dist <= flower_range],
+        candidates = empty_targets & within_manhattan[ram_range]
+        for s in bitboard.squares_in(candidates):
+            if _ram_knockback_targets(s, obstructions | start_bit) & enemies:
+                ram_targets |= bitboard.bit(s)
+    # will add backstab enemy targets later
+    backstab_targets = empty_targets & within_manhattan[backstab_move_range]
+
+    flower_targets = 0
+    for layer in layers[: flower_range + 1]:
+        flower_targets |= layer
+
+    actions: dict[Action, Bitboard] = {
+        OtherAction.MOVE: empty_targets & layers[1] if len(layers) > 1 else 0,
+        Tile.FLOWER: empty_targets & flower_targets,
         Tile.BIRD: bird_targets,
         Tile.RAM: ram_targets,
         Tile.BACKSTABBER: backstab_targets,
@@ -346,70 +319,62 @@ def valid_targets(start: Square, state: State) -> dict[Action, list[Square]]:
         if state.current_player == Player.N
         else Square(start.row - 1, start.col)
     )
-    actions[Tile.HARVESTER] = [forward] if forward in empty_targets else []
+    actions[Tile.HARVESTER] = (
+        empty_targets & bitboard.bit(forward) if forward.on_board() else 0
+    )
 
     # trickster moves knight-like, whether or not there is a enemy on the target square
     # they just can't move onto an ally
-    actions[Tile.TRICKSTER] = [
-        s
-        for s in _knight_targets(start, state)
-        if s not in state.positions[state.current_player]
-    ]
+    actions[Tile.TRICKSTER] = bitboard.KNIGHT[start_index] & ~allies
 
     # see `grapple_end_square` for the definition of valid grapple targets
-    actions[Tile.HOOK] = [
-        s for s in enemy_targets if grapple_end_square(start, s, obstructions)
-    ]
-    actions[Tile.THIEF] = [s for s, dist in enemy_targets.items() if dist == 1]
+    hook_targets = 0
+    for s in bitboard.squares_in(enemy_targets):
+        between = bitboard.BETWEEN[start_index][bitboard.index(s)]
+        if between is not None and not between & obstructions:
+            hook_targets |= bitboard.bit(s)
+    actions[Tile.HOOK] = hook_targets
+    actions[Tile.THIEF] = enemy_targets & layers[1] if len(layers) > 1 else 0
 
     if coins >= KNIVES_RANGE_2_COST:
-        actions[Tile.KNIVES] = [
-            s for s in enemy_targets if 1 <= _manhattan_dist(start, s) <= 2
-        ]
+        actions[Tile.KNIVES] = enemy_targets & within_manhattan[2]
     elif coins >= KNIVES_RANGE_1_COST:
-        actions[Tile.KNIVES] = [
-            s for s in enemy_targets if 1 == _manhattan_dist(start, s)
-        ]
+        actions[Tile.KNIVES] = enemy_targets & within_manhattan[1]
 
     if coins >= GRENADES_COST:
         # see `_grenade_targets` for the definition of valid grenade targets
-        actions[Tile.GRENADES] = _grenade_targets(start, obstructions, enemy_positions)
+        actions[Tile.GRENADES] = _grenade_targets(start, obstructions, enemies)
 
     if coins >= BACKSTAB_COST:
         # backstabber kills any enemy behind the start square
         # "behind" for Player.N is lower rows, and for Player.S is higher rows
-        actions[Tile.BACKSTABBER] += [
-            s
-            for s in enemy_targets
-            if (state.current_player == Player.N and s.row < start.row)
-            or (state.current_player == Player.S and s.row > start.row)
-        ]
+        behind = (
+            bitboard.ROWS_BEFORE[start.row]
+            if state.current_player == Player.N
+            else bitboard.ROWS_AFTER[start.row]
+        )
+        actions[Tile.BACKSTABBER] |= enemy_targets & behind
 
     if coins >= FIREBALL_COST:
-        enemies_and_webs = enemy_positions + state.all_webs()
-        fireball_obstructions = obstructions + state.all_webs()
+        webs = bitboard.web_mask(state)
         actions[Tile.FIREBALL] = _fireball_targets(
-            start, fireball_obstructions, enemies_and_webs
+            start, obstructions | webs, enemies | webs
         )
 
     # drop actions with no valid targets
-    ok_actions = {a: targets for a, targets in actions.items() if len(targets) > 0}
-
-    # drop actions for tiles that are not in this game
+    # and drop actions for tiles that are not in this game
     return {
-        a: targets
-        for a, targets in ok_actions.items()
-        if a in state.tiles_in_game or a in OtherAction
+        a: bitboard.squares_in(targets)
+        for a, targets in actions.items()
+        if targets and (a in state.tiles_in_game or a in OtherAction)
     }
 
 
-def _ram_knockback_targets(start: Square, target: Square, state: State) -> list[Square]:
+def _ram_knockback_targets(target: Square, obstructions: Bitboard) -> Bitboard:
     """
-    Return a list of tiles that would be knocked back from a ram move.
+    Return a mask of tiles that would be knocked back from a ram move onto `target`.
     """
-    obstructions = [s for s in state.all_positions() if s != target]
-    distances = _all_distances(target, obstructions)
-    return [s for s, d in distances.items() if d == 1 and s in obstructions]
+    return bitboard.NEIGHBORS[bitboard.index(target)] & obstructions
 
 
 def _take_ram_action(start: Square, target: Square, state: State) -> list[Square]:
@@ -419,39 +384,39 @@ def _take_ram_action(start: Square, target: Square, state: State) -> list[Square
     player = state.current_player
 
     # move to target square
-    start_index = state.positions[player].index(start)
-    state.positions[player][start_index] = target
+    state.move_tile(start, target)
 
     # spend cost
     state.coins[player] -= RAM_COST
 
     # knockback any neighboring tiles
-    obstructions = [s for s in state.all_positions() if s != target]
-    knockback_hits = _ram_knockback_targets(start, target, state)
+    obstructions = bitboard.occupied_mask(state) & ~bitboard.bit(target)
+    knockback_hits = _ram_knockback_targets(target, obstructions)
     killed = []
-    for knocked_square in knockback_hits:
+    for knocked_square in bitboard.squares_in(knockback_hits):
         # for each tile getting knocked back, try to move it directly away from target.
         # if that's obstructed, kill it.
-        knocked_player = state.player_at(knocked_square)
         end_square = _knockback_end_square(target, knocked_square)
 
-        if end_square.on_board() and end_square not in obstructions:
+        if end_square.on_board() and not bitboard.bit(end_square) & obstructions:
             # move it
-            knocked_index = state.positions[knocked_player].index(knocked_square)
-            state.positions[knocked_player][knocked_index] = end_square
+            state.move_tile(knocked_square, end_square)
         else:
             # kill it
             killed.append(knocked_square)
     return killed
 
 
+@trace.traced
 def take_action(
-    start: Square, action: Action, target: Square, state: State
+    start: Square, action: Action, target: Square, state: State, rng: Random
 ) -> list[Square]:
     """
     Updates the state with the result of the action.
     Assumes the action is valid.
 
+    `rng` is the game's random source, used to pick where TRICKSTER bumps its target.
+
     Returns a possibly-empty list of casualties (positions of tiles that got killed)
     """
     player = state.current_player
@@ -474,8 +439,7 @@ def take_action(
         Tile.SPIDER,
     ) or (action == Tile.BACKSTABBER and state.maybe_player_at(target) is None):
         # move to the target square
-        start_index = state.positions[player].index(start)
-        state.positions[player][start_index] = target
+        state.move_tile(start, target)
 
         # gain coins
         state.coins[player] += COIN_GAIN[action] * repeats
@@ -494,20 +458,16 @@ def take_action(
             state.swap_identity(start, target)
 
             # bump target to random adjacent unoccupied square
-            target_index = state.positions[enemy].index(target)
-
-            obstructions = [s for s in state.all_positions() if s != target]
-            distances = _all_distances(target, obstructions)
-            bump_candidates = [
-                s for s, d in distances.items() if s not in obstructions and d == 1
-            ]
+            bump_candidates = bitboard.squares_in(
+                bitboard.NEIGHBORS[bitboard.index(target)]
+                & ~bitboard.occupied_mask(state)
+            )
             assert len(bump_candidates) > 0
-            bump_target = random.choice(bump_candidates)
-            state.positions[enemy][target_index] = bump_target
+            bump_target = rng.choice(bump_candidates)
+            state.move_tile(target, bump_target)
 
         # move to the target square
-        start_index = state.positions[player].index(start)
-        state.positions[player][start_index] = target
+        state.move_tile(start, target)
 
         # gain coins
         state.coins[player] += COIN_GAIN[Tile.TRICKSTER] * repeats
@@ -518,10 +478,9 @@ def take_action(
 
     if action == Tile.HOOK:
         # move target next to us
-        end_square = grapple_end_square(start, target, obstructions=[])
+        end_square = grapple_end_square(start, target)
         assert end_square
-        target_index = state.positions[enemy].index(target)
-        state.positions[enemy][target_index] = end_square
+        state.move_tile(target, end_square)
 
         # steal
         if NEGATIVE_COINS_OK:
@@ -536,12 +495,7 @@ def take_action(
 
     if action == Tile.THIEF:
         # swap places with target
-        start_index = state.positions[player].index(start)
-        target_index = state.positions[enemy].index(target)
-        start_square = state.positions[player][start_index]
-        target_square = state.positions[enemy][target_index]
-        state.positions[player][start_index] = target_square
-        state.positions[enemy][target_index] = start_square
+        state.swap_positions(start, target)
 
         # steal
         if NEGATIVE_COINS_OK:
@@ -559,22 +513,22 @@ def take_action(
         state.coins[player] -= GRENADES_COST
 
         # remove all webs hit by blast
-        for web in _explosion_hits(target, state.webs[player]):
+        for web in _explosion_hits(target, bitboard.to_mask(state.webs[player])):
             state.webs[player].remove(web)
-        for web in _explosion_hits(target, state.webs[enemy]):
+        for web in _explosion_hits(target, bitboard.to_mask(state.webs[enemy])):
             state.webs[enemy].remove(web)
-        return _explosion_hits(target, state.all_positions())
+        return _explosion_hits(target, bitboard.occupied_mask(state))
 
     if action == Tile.FIREBALL:
         # pay cost
         state.coins[player] -= FIREBALL_COST
 
         # remove all webs hit by blast
-        for web in _explosion_hits(target, state.webs[player]):
+        for web in _explosion_hits(target, bitboard.to_mask(state.webs[player])):
             state.webs[player].remove(web)
-        for web in _explosion_hits(target, state.webs[enemy]):
+        for web in _explosion_hits(target, bitboard.to_mask(state.webs[enemy])):
             state.webs[enemy].remove(web)
-        return _explosion_hits(target, state.all_positions())
+        return _explosion_hits(target, bitboard.occupied_mask(state))
 
     if action == Tile.KNIVES:
         # cost depends on distance to target
@@ -599,6 +553,7 @@ def take_action(
     assert False, f"unknown {action=}"
 
 
+@trace.traced
 def reflect_action(
     start: Square, action: Action, target: Square, state: State
 ) -> list[Square]:
@@ -618,10 +573,9 @@ def reflect_action(
 
     if action == Tile.HOOK:
         # move start next to target
-        end_square = grapple_end_square(target, start, obstructions=[])
+        end_square = grapple_end_square(target, start)
         assert end_square
-        start_index = state.positions[player].index(start)
-        state.positions[player][start_index] = end_square
+        state.move_tile(start, end_square)
 
         # steal
         steal_amount = min(GRAPPLE_STEAL_AMOUNT * repeats, state.coins[player])
@@ -633,12 +587,7 @@ def reflect_action(
 
     if action == Tile.THIEF:
         # swap places with target; same as original action
-        start_index = state.positions[player].index(start)
-        target_index = state.positions[enemy].index(target)
-        start_square = state.positions[player][start_index]
-        target_square = state.positions[enemy][target_index]
-        state.positions[player][start_index] = target_square
-        state.positions[enemy][target_index] = start_square
+        state.swap_positions(start, target)
 
         # steal; same as original action with players swapped
         if NEGATIVE_COINS_OK:
@@ -653,7 +602,7 @@ def reflect_action(
 
     if action == Tile.FIREBALL:
         # explode at start
-        return _explosion_hits(start, state.all_positions())
+        return _explosion_hits(start, bitboard.occupied_mask(state))
 
     assert False, f"unknown {action=}"
 
@@ -1,6 +1,6 @@
 from websockets.server import WebSocketServerProtocol
-from typing import Iterable, AsyncIterable
-import random
+from typing import Iterable, AsyncIterable, Optional
+from random import Random
 
 from server.constants import Action, Square, Tile, Response, OtherAction
 from server.choices import (
@@ -74,8 +74,8 @@ class DummyWebsocket(WebSocketServerProtocol):
     """
     Implements the websocket send interface by doing nothing.
 
-    This simplifies the game loop; we can always send notifications on the websocket
-    without checking if it's a human or bot.
+    Notifications skip bots (see `notify.humans`), but this keeps anything that does
+    send to a bot's websocket harmless.
     """
 
     # always open
@@ -97,10 +97,13 @@ class RandomBot:
     """
     Chooses true actions when possible; otherwise lies with fixed probability.
     Challanges with fixed probability.
+
+    Pass a seeded `rng` to make the bot's choices reproducible.
     """
 
-    def __init__(self):
+    def __init__(self, rng: Optional[Random] = None):
         self.websocket = DummyWebsocket()
+        self.rng = rng if rng is not None else Random()
         self.truth_prob = 2 / 3
         self.challenge_prob = 1 / 4
 
@@ -118,15 +121,17 @@ class RandomBot:
 
         # if there's no action, return a square
         if not possible_actions:
-            return random.choice(possible_squares)
+            return self.rng.choice(possible_squares)
 
         # otherwise, randomly decide between moving and a lying action
         lie_actions = [a for a in possible_actions if a != OtherAction.MOVE]
 
-        if random.random() < self.truth_prob:
+        # MOVE may be blocked, and may be the only action
+        can_move = OtherAction.MOVE in possible_actions
+        if can_move and (not lie_actions or self.rng.random() < self.truth_prob):
             return OtherAction.MOVE
         else:
-            return random.choice(lie_actions)
+            return self.rng.choice(lie_actions)
 
     async def choose_square_or_hand(
         self,
@@ -136,7 +141,7 @@ class RandomBot:
     ) -> Square | Tile:
         # choose randomly
         choices: list[Square | Tile] = possible_squares + possible_hand_tiles
-        return random.choice(choices)
+        return self.rng.choice(choices)
 
     async def choose_response(
         self,
@@ -152,9 +157,9 @@ class RandomBot:
         # sometimes challenge
         if (
             Response.CHALLENGE in possible_responses
-            and random.random() < self.challenge_prob
+            and self.rng.random() < self.challenge_prob
         ):
-            return random.choice(possible_responses)
+            return self.rng.choice(possible_responses)
 
         # sometimes lie about reflecting
         lie_responses = [
@@ -162,8 +167,8 @@ class RandomBot:
             for r in possible_responses
             if r != true_response_hint and isinstance(r, Tile)
         ]
-        if lie_responses and random.random() > self.truth_prob:
-            return random.choice(lie_responses)
+        if lie_responses and self.rng.random() > self.truth_prob:
+            return self.rng.choice(lie_responses)
 
         # otherwise, accept
         assert Response.ACCEPT in possible_responses
@@ -175,7 +180,7 @@ class RandomBot:
         prompt: str,
     ) -> Tile:
         # choose randomly
-        return random.choice(choices)
+        return self.rng.choice(choices)
 
 
 # An agent is a human player or bot that makes choices
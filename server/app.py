@@ -3,41 +3,176 @@
 import asyncio
 import json
 import os
+import secrets
 import signal
+import traceback
+from typing import Optional
 
-from websockets.server import WebSocketServerProtocol, serve
+from websockets.exceptions import ConnectionClosed
+from websockets.server import WebSocketServer, WebSocketServerProtocol, serve
 
 from server.constants import Player
 from server.game import play_one_match
+from server import inbox, metrics, session, timing, trace
+from server.notify import humans
+from server.session import Session, open_session, resume
+from server.spectate import watch
 from server.agents import Agent, Human, RandomBot
 
 
 # URL player parameter for playing against the AI
 SOLO_PLAYER = "solo"
 
-# PVP_PLAYERS is a dict from joined players (NORTH or SOUTH) to the human agent.
-# At most 1 PVP game at a time (see `handler` docstring for explanation)
-PVP_PLAYERS: dict[Player, Agent] = {}
+# URL player parameter for watching the match in a room
+SPECTATOR = "spectator"
+
+# PVP room used when the join event and URL don't name one
+DEFAULT_ROOM = "default"
+
+# running matches are saved here on shutdown, and restored on startup
+CHECKPOINT_PATH = os.environ.get("CHECKPOINT_PATH", "matches.checkpoint")
+
+# clients only send small JSON events; refuse anything bigger
+MAX_MESSAGE_SIZE = 2**12
+
+
+class Room:
+    """
+    Seats for one PVP match.
+
+    `seats` maps joined players (NORTH or SOUTH) to their human agent.
+    `match` is the running match, once both seats are filled, and `session` its session.
+    """
+
+    def __init__(self, room_id: str):
+        self.room_id = room_id
+        self.seats: dict[Player, Agent] = {}
+        self.match: Optional[asyncio.Task] = None
+        self.session: Optional[Session] = None
+
+
+# open PVP rooms by room id
+ROOMS: dict[str, Room] = {}
+
+# running solo matches by room id, which is generated for each; see `solo_room_id`
+SOLO_MATCHES: dict[str, Session] = {}
+
+
+def solo_room_id() -> str:
+    """A room id for spectators to find a new solo match by."""
+    return f"{SOLO_PLAYER}-{secrets.token_urlsafe(6)}"
+
+
+def find_match(room_id: str) -> Optional[Session]:
+    """The running match in the room, PVP or solo, if there is one."""
+    room = ROOMS.get(room_id)
+    if room is not None and room.session is not None:
+        return room.session
+    return SOLO_MATCHES.get(room_id)
+
+
+def join_room(room_id: str, player: Player, agent: Agent) -> Optional[Room]:
+    """
+    Seat the agent in the room, creating the room if it doesn't exist.
+
+    A seat can be retaken if its websocket has closed, but not while a match is running.
+    Returns None if the seat is taken.
+    """
+    room = ROOMS.get(room_id)
+    if room is None:
+        room = ROOMS[room_id] = Room(room_id)
+
+    seated = room.seats.get(player)
+    if seated is not None and (room.match is not None or seated.websocket.open):
+        return None
+
+    room.seats[player] = agent
+    return room
+
+
+def leave_room(room: Room, player: Player, agent: Agent) -> None:
+    """
+    Give up the agent's seat if they still have it, and close the room once it's empty.
+    """
+    if room.seats.get(player) is agent:
+        del room.seats[player]
+    if not room.seats and ROOMS.get(room.room_id) is room:
+        del ROOMS[room.room_id]
+
+
+def close_room(room: Room) -> None:
+    """Remove the room when its match ends, so the room id can be reused."""
+    room.seats.clear()
+    if ROOMS.get(room.room_id) is room:
+        del ROOMS[room.room_id]
+
+
+def start_restored(restored: Session) -> asyncio.Task:
+    """
+    Play a match restored from a checkpoint, back in its room: a PVP room, or with the
+    running solo matches.
+
+    No handler awaits the match, so how it ends is logged here.
+    """
+    match = asyncio.create_task(
+        play_one_match(restored.players, restored.tileset, restored)
+    )
+    match.add_done_callback(_log_restored_match)
+    if len(humans(restored.players)) < 2:
+        room_id = restored.room_id = restored.room_id or solo_room_id()
+        SOLO_MATCHES[room_id] = restored
+        match.add_done_callback(lambda _: SOLO_MATCHES.pop(room_id, None))
+    else:
+        assert restored.room_id is not None
+        room = ROOMS[restored.room_id] = Room(restored.room_id)
+        room.seats = restored.players
+        room.session = restored
+        room.match = match
+        match.add_done_callback(lambda _: close_room(room))
+    return match
+
+
+def _log_restored_match(match: asyncio.Task) -> None:
+    if match.cancelled():
+        return
+    error = match.exception()
+    if isinstance(error, ConnectionClosed):
+        print("Restored match ended after a player disconnected")
+    elif error is not None:
+        print("Restored match failed")
+        traceback.print_exception(error)
 
 
 async def handler(websocket: WebSocketServerProtocol) -> None:
     """
     Supports:
         - any number of solo games (player vs AI)
-        - at most 1 PVP game (2 human players)
+        - any number of PVP rooms, each with at most 1 PVP match (2 human players)
 
     When a new websocket connects, it could be:
         - a player creating a solo game
-        - the first player joining a PVP game
-        - the second player joining a PVP game
+        - the first player joining a PVP room
+        - the second player joining a PVP room
+        - a spectator watching the match in a PVP room, or a solo match's room;
+          see `server.spectate`
 
-    If the first player joins a PVP game, just register their websocket and then wait forever;
-    the actual game will run in the second player's handler.
+    If the first player joins a PVP room, just register their websocket and then wait forever;
+    the actual match will run in the second player's handler.
 
     2nd player to connect determines the starting tileset.
 
+    The room id is taken from the join event's `room`, or else the URL path,
+    or else `DEFAULT_ROOM`.
+
+    Each solo match gets a generated room id, sent to the player with their resume
+    token, so spectators can find it.
+
+    If the join event has a `resume` token for a running match, the websocket takes
+    over that player's seat instead; see `server.session`.
+
     Consumes a single message from the websocket queue containing the Player
-    (north, south, or solo).  Future messages are handled inside the game task.
+    (north, south, or solo).  Future messages are read by the websocket's inbox,
+    started as soon as it joins; see `server.inbox`.
 
     `play_one_match` makes a best effort to close the websocket when a player disconnects;
     if it fails, we rely on the default timeouts in the `serve` caller to close the connection.
@@ -45,31 +180,89 @@ async def handler(websocket: WebSocketServerProtocol) -> None:
     assert isinstance(websocket, WebSocketServerProtocol)
     message = await websocket.recv()
     event = json.loads(message)
-    tileset = event["tiles"]
     assert event["type"] == "join"
+    room_id = event.get("room") or websocket.path.strip("/") or DEFAULT_ROOM
+
+    if event["player"] == SPECTATOR:
+        watched = find_match(room_id)
+        if watched is None:
+            await websocket.close(reason="There's no match to watch in this room")
+            return
+        engine = watched.engine
+        await watch(
+            watched.audience, engine.state if engine is not None else None, websocket
+        )
+        return
+
+    tileset = event["tiles"]
     assert tileset in ["random", "default", "new"]
 
+    token = event.get("resume")
+    if token and await resume(token, websocket):
+        # the match runs in another handler; keep this connection open until it ends
+        await websocket.wait_closed()
+        return
+
     if event["player"] == SOLO_PLAYER:
+        inbox.attach(websocket)
         # in solo mode, the player is south and the AI is north
         players: dict[Player, Agent] = {
             Player.S: Human(websocket),
             Player.N: RandomBot(),
         }
-        await play_one_match(players, tileset)
+        solo_id = solo_room_id()
+        solo = SOLO_MATCHES[solo_id] = open_session(players, tileset, solo_id)
+        try:
+            await play_one_match(players, tileset, solo)
+        finally:
+            del SOLO_MATCHES[solo_id]
         return
 
     # in pvp, the player is the one specified in the url
-    # overwrite the existing websocket/agent if it exists
+    # replace the existing websocket/agent if it has disconnected
     player = Player(event["player"])
-    PVP_PLAYERS[player] = Human(websocket)
-
-    if len(PVP_PLAYERS) == 2 and all(w.websocket.open for w in PVP_PLAYERS.values()):
-        print(f"{player} connected; starting match")
-        await play_one_match(PVP_PLAYERS, tileset)
+    agent = Human(websocket)
+    room = join_room(room_id, player, agent)
+    if room is None:
+        print(f"{player} already taken in room {room_id}")
+        await websocket.close(reason=f"{player} is already taken in this room")
         return
+    # read the websocket while waiting for the other player too, e.g. for RESYNCs
+    inbox.attach(websocket)
+
+    if len(room.seats) == 2 and all(w.websocket.open for w in room.seats.values()):
+        print(f"{player} connected to room {room_id}; starting match")
+        room.session = open_session(room.seats, tileset, room_id)
+        room.match = asyncio.create_task(
+            play_one_match(room.seats, tileset, room.session)
+        )
+        try:
+            await room.match
+        finally:
+            close_room(room)
     else:
-        print(f"{player} waiting for other player")
-        await websocket.wait_closed()
+        print(f"{player} waiting for other player in room {room_id}")
+        try:
+            await websocket.wait_closed()
+        finally:
+            if room.match is None:
+                leave_room(room, player, agent)
+
+
+def _register_gauges(server: WebSocketServer) -> None:
+    metrics.gauge("open_connections", lambda: len(server.websockets))
+    metrics.gauge("solo_matches", lambda: len(SOLO_MATCHES))
+    metrics.gauge("pvp_rooms", lambda: len(ROOMS))
+    metrics.gauge(
+        "pvp_matches", lambda: sum(room.match is not None for room in ROOMS.values())
+    )
+    metrics.gauge(
+        "spectators",
+        lambda: sum(
+            len(room.session.audience) for room in ROOMS.values() if room.session
+        )
+        + sum(len(solo.audience) for solo in SOLO_MATCHES.values()),
+    )
 
 
 async def main() -> None:
@@ -77,12 +270,31 @@ async def main() -> None:
     loop = asyncio.get_running_loop()
     stop = loop.create_future()
     loop.add_signal_handler(signal.SIGTERM, stop.set_result, None)
+    # trace the next game; see `server.trace`
+    loop.add_signal_handler(signal.SIGUSR1, trace.arm)
+
+    # carry on the matches that were running when the server last shut down
+    if os.path.exists(CHECKPOINT_PATH):
+        sessions = session.restore(CHECKPOINT_PATH)
+        for restored in sessions:
+            start_restored(restored)
+        print(f"Restored {len(sessions)} matches from {CHECKPOINT_PATH}.")
 
     port = int(os.environ.get("PORT", "8001"))
     print(f"Serving websocket server on port {port}.")
 
-    async with serve(handler, "", port):
+    async with serve(handler, "", port, max_size=MAX_MESSAGE_SIZE) as server:
+        if metrics.METRICS_PORT:
+            _register_gauges(server)
+            await metrics.start(int(metrics.METRICS_PORT))
+            print(f"Serving metrics on localhost port {metrics.METRICS_PORT}.")
         await stop
+        saved = session.checkpoint(CHECKPOINT_PATH)
+        print(f"Saved {saved} matches to {CHECKPOINT_PATH}.")
+
+    if timing.TIMINGS_PATH:
+        timing.dump(timing.TIMINGS_PATH)
+        print(f"Saved turn timings to {timing.TIMINGS_PATH}.")
 
 
 if __name__ == "__main__":
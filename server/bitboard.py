@@ -0,0 +1,201 @@
+"""
+Bitboard representation of the board.
+
+The board is 5x5, so any set of squares fits in one 25-bit integer:
+square (row, col) is bit `row * COLUMNS + col`.
+
+Move generation in `server/actions.py` works on these masks instead of lists of squares,
+so membership tests and set operations are single integer operations.
+The geometry masks (neighbors, explosions, knight moves, rays) are precomputed once at import.
+"""
+
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from server.constants import Player, Square, ROWS, COLUMNS
+from server.state import State
+
+# A set of squares, one bit per square
+Bitboard = int
+
+NUM_SQUARES = ROWS * COLUMNS
+FULL: Bitboard = (1 << NUM_SQUARES) - 1
+
+# the square for each bit index
+SQUARES: list[Square] = [Square(r, c) for r in range(ROWS) for c in range(COLUMNS)]
+
+
+def index(square: Square) -> int:
+    """The bit index of a square."""
+    return square.row * COLUMNS + square.col
+
+
+def bit(square: Square) -> Bitboard:
+    """The single-square mask of a square."""
+    return 1 << (square.row * COLUMNS + square.col)
+
+
+def to_mask(squares: Iterable[Square]) -> Bitboard:
+    """The mask of a collection of squares."""
+    mask = 0
+    for square in squares:
+        mask |= 1 << (square.row * COLUMNS + square.col)
+    return mask
+
+
+def squares_in(mask: Bitboard) -> list[Square]:
+    """The squares in a mask, ordered by row then column."""
+    squares = []
+    while mask:
+        low = mask & -mask
+        squares.append(SQUARES[low.bit_length() - 1])
+        mask ^= low
+    return squares
+
+
+def player_mask(state: State, player: Player) -> Bitboard:
+    """Squares occupied by one player's tiles."""
+    return to_mask(state.positions[player])
+
+
+def occupied_mask(state: State) -> Bitboard:
+    """Squares occupied by any tile, regardless of player."""
+    return to_mask(state.positions[Player.N]) | to_mask(state.positions[Player.S])
+
+
+def web_mask(state: State) -> Bitboard:
+    """Squares with a web, regardless of player."""
+    return to_mask(state.webs[Player.N]) | to_mask(state.webs[Player.S])
+
+
+def _offsets_mask(square: Square, offsets: list[tuple[int, int]]) -> Bitboard:
+    """Mask of the on-board squares at the given (row, col) offsets from square."""
+    return to_mask(
+        s
+        for s in (Square(square.row + r, square.col + c) for r, c in offsets)
+        if s.on_board()
+    )
+
+
+KING_OFFSETS = [(r, c) for r in (-1, 0, 1) for c in (-1, 0, 1) if (r, c) != (0, 0)]
+KNIGHT_OFFSETS = [
+    (1, 2),
+    (1, -2),
+    (-1, 2),
+    (-1, -2),
+    (2, 1),
+    (2, -1),
+    (-2, 1),
+    (-2, -1),
+]
+
+# the 8 squares adjacent to each square, including diagonals
+NEIGHBORS: list[Bitboard] = [_offsets_mask(s, KING_OFFSETS) for s in SQUARES]
+
+# the 3x3 square centered on each square, including the center
+EXPLOSION: list[Bitboard] = [NEIGHBORS[i] | (1 << i) for i in range(NUM_SQUARES)]
+
+# the squares a knight-like move reaches from each square
+KNIGHT: list[Bitboard] = [_offsets_mask(s, KNIGHT_OFFSETS) for s in SQUARES]
+
+# the 4 diagonal directions, as (row step, col step)
+DIAGONALS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+def _ray(square: Square, row_step: int, col_step: int) -> Bitboard:
+    """Mask of the squares walking from square in one direction, excluding square."""
+    mask = 0
+    s = Square(square.row + row_step, square.col + col_step)
+    while s.on_board():
+        mask |= bit(s)
+        s = Square(s.row + row_step, s.col + col_step)
+    return mask
+
+
+# RAYS[direction][i] is the squares walking from square i in a direction, excluding i
+RAYS: dict[tuple[int, int], list[Bitboard]] = {
+    direction: [_ray(s, *direction) for s in SQUARES] for direction in KING_OFFSETS
+}
+
+
+def _between(a: Square, b: Square) -> Optional[Bitboard]:
+    """
+    Mask of the squares strictly between a and b if they share a row, column, or diagonal.
+    None otherwise.
+    """
+    row_diff = b.row - a.row
+    col_diff = b.col - a.col
+    if a == b or not (row_diff == 0 or col_diff == 0 or abs(row_diff) == abs(col_diff)):
+        return None
+    row_step = (row_diff > 0) - (row_diff < 0)
+    col_step = (col_diff > 0) - (col_diff < 0)
+    return _ray(a, row_step, col_step) & _ray(b, -row_step, -col_step)
+
+
+# BETWEEN[i][j] is the squares strictly between squares i and j along a straight line
+# or diagonal, or None if they aren't in line
+BETWEEN: list[list[Optional[Bitboard]]] = [
+    [_between(a, b) for b in SQUARES] for a in SQUARES
+]
+
+# WITHIN_MANHATTAN[i][d] is the squares at manhattan distance 1 through d from square i
+MAX_MANHATTAN = ROWS + COLUMNS - 2
+WITHIN_MANHATTAN: list[list[Bitboard]] = [
+    [
+        to_mask(
+            s
+            for s in SQUARES
+            if 1 <= abs(s.row - start.row) + abs(s.col - start.col) <= d
+        )
+        for d in range(MAX_MANHATTAN + 1)
+    ]
+    for start in SQUARES
+]
+
+# ROWS_BEFORE[r] is all squares in rows < r; ROWS_AFTER[r] is all squares in rows > r
+ROWS_BEFORE: list[Bitboard] = [(1 << (r * COLUMNS)) - 1 for r in range(ROWS)]
+ROWS_AFTER: list[Bitboard] = [
+    FULL & ~((1 << ((r + 1) * COLUMNS)) - 1) for r in range(ROWS)
+]
+
+# masks to stop horizontal shifts from wrapping between rows
+_NOT_FIRST_COLUMN: Bitboard = FULL & ~to_mask(Square(r, 0) for r in range(ROWS))
+_NOT_LAST_COLUMN: Bitboard = FULL & ~to_mask(
+    Square(r, COLUMNS - 1) for r in range(ROWS)
+)
+
+
+def _spread(mask: Bitboard) -> Bitboard:
+    """Grow a mask by one square in all 8 directions."""
+    row = mask | ((mask << 1) & _NOT_FIRST_COLUMN) | ((mask >> 1) & _NOT_LAST_COLUMN)
+    return (row | (row << COLUMNS) | (row >> COLUMNS)) & FULL
+
+
+# How many (start, obstructions) distance tables to remember.
+# With at most 4 tiles on board there are ~60k possible keys, but a game only visits a few
+# hundred of them, and self-play revisits the common early-game layouts constantly.
+DISTANCE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=DISTANCE_CACHE_SIZE)
+def distance_layers(start: int, obstructions: Bitboard) -> tuple[Bitboard, ...]:
+    """
+    Breadth-first king-move distances from bit index `start`.
+
+    Layer d of the result is the squares at distance d, with routes:
+        - allowed to end on an obstruction
+        - not allowed to pass through an obstruction as an intermediate step
+
+    Results are memoized in a bounded LRU keyed by (start, obstructions);
+    `distance_layers.cache_info()` reports the hit and miss counts.
+    """
+    assert not obstructions & (1 << start)
+    frontier = reached = 1 << start
+    layers = [frontier]
+    while True:
+        # only unobstructed squares expand to their neighbors
+        frontier = _spread(frontier & ~obstructions) & ~reached
+        if not frontier:
+            return tuple(layers)
+        reached |= frontier
+        layers.append(frontier)
@@ -13,10 +13,11 @@ from server.constants import (
     Response,
     OutEventType,
 )
+from server import inbox, metrics, outbox, trace
 
 # Generally incoming messages are invalid unless we've prompted for them.
-# websockets keeps incoming messages in a FIFO queue, but generally all messages
-# are invalid unless we've prompted for something specific.
+# Each websocket's reader (see `server.inbox`) only hands over a choice
+# with the id we've prompted for.
 #
 # For each websocket, we use an incrementing count as an ID
 # All messages with other choice ids are ignored, so we can ignore messages from
@@ -45,7 +46,7 @@ async def send_prompt(
         prompt = f"⌛⌛⌛<br>{prompt}<br>⌛⌛⌛"
 
     event = {"type": "PROMPT", "choiceId": choice_id, "prompt": prompt}
-    await websocket.send(json.dumps(event))
+    outbox.send(websocket, json.dumps(event), key="PROMPT")
 
 
 async def _get_choice(prompt: str, websocket: WebSocketServerProtocol) -> dict:
@@ -59,26 +60,11 @@ async def _get_choice(prompt: str, websocket: WebSocketServerProtocol) -> dict:
     # we use this to ignore old messages
     expected_choice_id = NEXT_CHOICE_ID.get(websocket, 1)
     NEXT_CHOICE_ID[websocket] = expected_choice_id + 1
-    await send_prompt(prompt, websocket, expected_choice_id)
-
-    # the websocket queue may have accumulated stale messages since we last recieved
-    # wait in a loop to throw away any stale messages
-    while True:
-        message = await websocket.recv()
-        event = json.loads(message)
-        if "choiceId" not in event:
-            print(f"Ignored {event=}")
-            continue
-        choice_id = int(event["choiceId"])
-
-        if expected_choice_id == choice_id:
-            return event["data"]
-        elif choice_id < expected_choice_id:
-            print(f"Ignored {choice_id=}; {expected_choice_id=}")
-        else:
-            assert (
-                False
-            ), f"{choice_id=} should never be greater than {expected_choice_id=}"
+    with trace.span("prompt", choiceId=expected_choice_id):
+        await send_prompt(prompt, websocket, expected_choice_id)
+
+        # the websocket's reader drops stale messages as they arrive; see `server.inbox`
+        return await inbox.get_choice(websocket, expected_choice_id)
 
 
 async def _send_highlights(
@@ -95,7 +81,20 @@ async def _send_highlights(
         "handTiles": hand_tiles,
         "boardTiles": board_tiles,
     }
-    await websocket.send(json.dumps(event))
+    outbox.send(websocket, json.dumps(event), key=OutEventType.HIGHLIGHT_CHANGE.value)
+
+
+def highlighted_choices(highlights: dict) -> list[dict]:
+    """
+    The data of each choice a client may send for a decoded HIGHLIGHT_CHANGE event,
+    for simulating players.
+    """
+    return (
+        [{"row": row, "column": column} for row, column in highlights["squares"]]
+        + [{"button": action} for action in highlights["actions"]]
+        + [{"handTile": tile} for tile in highlights["handTiles"]]
+        + [{"boardTile": tile} for tile in highlights["boardTiles"]]
+    )
 
 
 @asynccontextmanager
@@ -152,6 +151,7 @@ async def choose_action_or_square(
                 pass
 
             # it's not valid; get a new choice
+            metrics.count("invalid_choices")
             print(
                 f"Ignoring invalid choice {data=}, {possible_actions=}, {possible_squares=}"
             )
@@ -186,6 +186,7 @@ async def choose_square_or_hand(
                 pass
 
             # it's not valid; get a new choice
+            metrics.count("invalid_choices")
             print(
                 f"Ignoring invalid choice {data=}, {possible_squares=}, {possible_hand_tiles=}"
             )
@@ -222,6 +223,7 @@ async def choose_response(
                 pass
 
             # it's not valid; get a new choice
+            metrics.count("invalid_choices")
             print(f"Ignoring invalid choice {data=}, {possible_responses=}")
 
 
@@ -246,4 +248,5 @@ async def choose_exchange(
                 pass
 
             # it's not valid; get a new choice
+            metrics.count("invalid_choices")
             print(f"Ignoring invalid choice {data=}, {choices=}")
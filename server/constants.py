@@ -155,8 +155,14 @@ class OutEventType(str, Enum):
 
     STATE_CHANGE = "STATE_CHANGE"
 
+    # the fields of the player view that changed since the last STATE_CHANGE or STATE_DELTA
+    STATE_DELTA = "STATE_DELTA"
+
     SELECTION_CHANGE = "SELECTION_CHANGE"
 
     HIGHLIGHT_CHANGE = "HIGHLIGHT_CHANGE"
 
     MATCH_CHANGE = "MATCH_CHANGE"
+
+    # the token for reconnecting to the match; see `server.session`
+    SESSION = "SESSION"
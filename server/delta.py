@@ -0,0 +1,210 @@
+"""
+Delta encoding of the state views sent to each websocket.
+
+The first state sent on a websocket is a full STATE_CHANGE snapshot.  After that we send
+a STATE_DELTA with only the top-level view fields that changed, and the lines appended to
+`public_log`, since the previous view sent on the same websocket.
+
+Each message has an incrementing version, and each delta names the version it applies to.
+If the client finds it's missed a version, it sends a RESYNC message and we fall back to
+a full snapshot next time.
+
+A view is sent as two parts: the public part shared by both players (`State.public_view`)
+and the player's private part (`State.private_view`).  The public part of each message is
+encoded once per broadcast and spliced into each player's message.
+
+Spectators all follow one shared stream of these messages; see `server.spectate`.
+"""
+
+import json
+from typing import Any, NamedTuple, Optional
+from weakref import WeakKeyDictionary
+
+from websockets.server import WebSocketServerProtocol
+
+from server.constants import OutEventType
+
+# incoming message type asking for a full snapshot
+RESYNC = "RESYNC"
+
+View = dict[str, Any]
+
+
+class SentView(NamedTuple):
+    version: int
+    # `State.version` the view was built from
+    state_version: int
+    public: View
+    private: View
+
+
+# The last view sent on each websocket.
+#
+# Weak references so we don't keep old websockets alive.
+SENT_VIEWS: WeakKeyDictionary[WebSocketServerProtocol, SentView] = WeakKeyDictionary()
+
+# Encoded public fragments shared between the players in one broadcast,
+# keyed by the ids of the public views they were encoded from.
+# The views are kept in the value so the ids can't be reused while it's alive.
+FragmentCache = dict[tuple[int, int], tuple[Optional[View], View, str, str]]
+
+
+def is_current(websocket: WebSocketServerProtocol, state_version: int) -> bool:
+    """True if the websocket was last sent the view of this state version."""
+    sent = SENT_VIEWS.get(websocket)
+    return sent is not None and sent.state_version == state_version
+
+
+def state_change_message(
+    state_version: int,
+    public: View,
+    private: View,
+    websocket: WebSocketServerProtocol,
+    cache: FragmentCache,
+) -> Optional[str]:
+    """
+    Return the encoded message that updates the websocket's client to the view
+    made of `public` and `private`, and remember the view as sent.
+
+    Returns None if the view hasn't changed since the last one sent, so there's
+    nothing to send.
+
+    Pass the same `cache` for every player in a broadcast to encode the public part once.
+    """
+    sent, message = view_message(
+        SENT_VIEWS.get(websocket), state_version, public, private, cache
+    )
+    SENT_VIEWS[websocket] = sent
+    return message
+
+
+def view_message(
+    sent: Optional[SentView],
+    state_version: int,
+    public: View,
+    private: View,
+    cache: FragmentCache,
+) -> tuple[SentView, Optional[str]]:
+    """
+    Like `state_change_message`, for a client that was last sent `sent` (None if nothing).
+
+    Returns the view now sent, and the message or None.
+    """
+    if sent is None:
+        sent = SentView(1, state_version, public, private)
+        return sent, snapshot_message(sent, cache)
+
+    public_changes, log_append = _public_fragment(sent.public, public, cache)
+    private_changes = _encode_fields(_changes(sent.private, private))
+    if not public_changes and not private_changes and log_append == "[]":
+        return (
+            sent._replace(state_version=state_version, public=public, private=private),
+            None,
+        )
+
+    version = sent.version + 1
+    return SentView(version, state_version, public, private), (
+        f'{{"type": "{OutEventType.STATE_DELTA.value}", "version": {version}, '
+        f'"baseVersion": {sent.version}, '
+        f'"changes": {{{_join(public_changes, private_changes)}}}, '
+        f'"logAppend": {log_append}}}'
+    )
+
+
+def snapshot_message(sent: SentView, cache: FragmentCache) -> str:
+    """The full STATE_CHANGE message for a view, carrying on from its version."""
+    public_fields, _ = _public_fragment(None, sent.public, cache)
+    return (
+        f'{{"type": "{OutEventType.STATE_CHANGE.value}", "version": {sent.version}, '
+        f'"playerView": {{{_join(public_fields, _encode_fields(sent.private))}}}}}'
+    )
+
+
+def forget(websocket: WebSocketServerProtocol) -> None:
+    """Send a full snapshot on the websocket next time."""
+    SENT_VIEWS.pop(websocket, None)
+
+
+def merge(older: str, newer: str) -> str:
+    """
+    Combine two consecutive messages from `state_change_message` for the same websocket
+    into one message with the same effect, for a client that hasn't been sent either yet.
+    """
+    new = json.loads(newer)
+    if new["type"] == OutEventType.STATE_CHANGE.value:
+        # a snapshot doesn't depend on what came before
+        return newer
+
+    old = json.loads(older)
+    if old["type"] == OutEventType.STATE_CHANGE.value:
+        view = {**old["playerView"], **new["changes"]}
+        view["public_log"] = view["public_log"] + new["logAppend"]
+        return json.dumps(
+            {
+                "type": OutEventType.STATE_CHANGE.value,
+                "version": new["version"],
+                "playerView": view,
+            }
+        )
+
+    changes = {**old["changes"], **new["changes"]}
+    if "public_log" in new["changes"]:
+        log_append = new["logAppend"]
+    elif "public_log" in old["changes"]:
+        changes["public_log"] = old["changes"]["public_log"] + old["logAppend"]
+        log_append = new["logAppend"]
+    else:
+        log_append = old["logAppend"] + new["logAppend"]
+    return json.dumps(
+        {
+            "type": OutEventType.STATE_DELTA.value,
+            "version": new["version"],
+            "baseVersion": old["baseVersion"],
+            "changes": changes,
+            "logAppend": log_append,
+        }
+    )
+
+
+def _public_fragment(
+    old: Optional[View], new: View, cache: FragmentCache
+) -> tuple[str, str]:
+    """
+    Encode the public fields that changed from `old` to `new` (all of them if `old` is
+    None), and the lines appended to the log.
+    """
+    key = (id(old), id(new))
+    cached = cache.get(key)
+    if cached is not None and cached[0] is old and cached[1] is new:
+        return cached[2], cached[3]
+
+    log_append: list[str] = []
+    if old is None:
+        changes = new
+    elif old is new:
+        # the same version was already sent
+        changes = {}
+    else:
+        changes = _changes(old, new)
+        old_log, new_log = old["public_log"], new["public_log"]
+        if "public_log" in changes and new_log[: len(old_log)] == old_log:
+            # the log usually only grows
+            del changes["public_log"]
+            log_append = new_log[len(old_log) :]
+
+    fragment = (_encode_fields(changes), json.dumps(log_append))
+    cache[key] = (old, new, *fragment)
+    return fragment
+
+
+def _changes(old: View, new: View) -> View:
+    return {key: value for key, value in new.items() if old.get(key) != value}
+
+
+def _encode_fields(fields: View) -> str:
+    """Encode a dict as JSON without the surrounding braces, for splicing."""
+    return json.dumps(fields)[1:-1]
+
+
+def _join(*fragments: str) -> str:
+    return ", ".join(fragment for fragment in fragments if fragment)
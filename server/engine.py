@@ -0,0 +1,933 @@
+"""
+The rules of one game as a synchronous state machine.
+
+The turn sequence is written as generator "flows": plain functions that `yield` a `Decision`
+whenever a player has to choose something, and receive the choice back from `Engine.step`.
+Flows also yield notification events (state changed, selection changed, waiting prompts)
+which the engine records for a driver to forward to the players, but never waits on.
+
+This keeps the conditional sequences of challenges and responses written directly in code
+(see `_play_one_turn`), while letting the game run without an event loop or websockets:
+
+    rng = Random(seed)
+    engine = Engine(new_state(match_score, tileset, rng), rng)
+    while not engine.is_terminal():
+        engine.step(choose(engine.pending, engine.legal_decisions()))
+
+See `server/game.py` for the async driver that plays a game over websockets.
+"""
+
+from enum import Enum
+from random import Random
+from typing import (
+    Any,
+    Collection,
+    Generator,
+    NamedTuple,
+    Optional,
+    Sequence,
+    TypeVar,
+    cast,
+)
+
+from server.actions import (
+    valid_targets,
+    take_action,
+    reflect_action,
+    grapple_end_square,
+    path,
+)
+from server import timing
+from server.state import State
+from server.constants import (
+    Player,
+    Square,
+    GameResult,
+    Action,
+    Tile,
+    OtherAction,
+    Response,
+    other_player,
+)
+
+
+class DecisionKind(str, Enum):
+    """The kinds of choices a player makes during a game."""
+
+    # choose a start tile, action, and target for the turn
+    ACTION = "ACTION"
+    # accept, challenge, or reflect the opponent's action
+    RESPONSE = "RESPONSE"
+    # accept or challenge the opponent's reflect
+    REFLECT_RESPONSE = "REFLECT_RESPONSE"
+    # choose which tile on board to lose
+    LOSE_TILE = "LOSE_TILE"
+    # choose the replacement tile from hand, or a different tile to lose
+    REPLACEMENT = "REPLACEMENT"
+    # choose a tile from an exchange square, or keep the current tile
+    EXCHANGE = "EXCHANGE"
+    # choose an enemy tile to smite
+    SMITE = "SMITE"
+    # move the ×2 to a different action
+    MOVE_X2 = "MOVE_X2"
+
+
+# Anything a player can choose
+Choice = Action | Response | Square
+
+
+class Decision(NamedTuple):
+    """
+    A point where the game waits for one player to choose.
+
+    The legal choices are grouped the same way the agents are asked for them.
+    """
+
+    kind: DecisionKind
+    player: Player
+    prompt: str
+    # actions, responses, or exchange tiles
+    actions: list[Action | Response] = []
+    squares: list[Square] = []
+    hand_tiles: list[Tile] = []
+    # the true tile behind the choice, for bots; never shown to players
+    hint: Optional[Action] = None
+
+    def options(self) -> list[Choice]:
+        return [*self.actions, *self.squares, *self.hand_tiles]
+
+
+class StateChanged(NamedTuple):
+    """Both players should be shown the current state."""
+
+
+class SelectionChanged(NamedTuple):
+    """
+    The selected action changed.
+
+    Sent to `player`, or to both players if `player` is None.
+    See `notify.notify_selection_changed`.
+    """
+
+    player: Optional[Player]
+    selecting_player: Optional[Player]
+    start: Optional[Square]
+    action: Optional[Action]
+    target: Optional[Square]
+
+
+class Waiting(NamedTuple):
+    """Tell a player what they are waiting on while their opponent chooses."""
+
+    player: Player
+    prompt: str
+
+
+Event = StateChanged | SelectionChanged | Waiting
+
+
+class Keyframe(NamedTuple):
+    """
+    A copy of the state between two turns, enough to resume the game from there.
+
+    The engine reseeds its rng from `seed` at every turn boundary, so a keyframe doesn't
+    need the rng's full internal state.
+    """
+
+    # turns played before the keyframe
+    turn: int
+    # decisions made before the keyframe
+    decision: int
+    seed: int
+    state: State
+
+
+T = TypeVar("T")
+
+# A flow yields decisions and events, is sent the choice for each decision,
+# and returns a T when done
+Flow = Generator[Decision | Event, Any, T]
+
+STATE_CHANGED = StateChanged()
+CLEAR_SELECTION = SelectionChanged(None, None, None, None, None)
+
+
+class Engine:
+    """
+    Plays one game from a new state, or resumes one from a `Keyframe`,
+    pausing at every decision.
+
+        - `pending` is the decision waiting to be made, if the game isn't over
+        - `legal_decisions()` lists the choices for it
+        - `step(choice)` makes the choice and runs the game up to the next decision
+        - `events` collects the notifications for players since the driver last cleared it
+        - `decisions` records every choice made, as its index in `legal_decisions()`
+
+    `rng` is the game's only source of randomness, so a game is reproduced by dealing
+    and playing it from the same seed with the same decisions.
+
+    Every `keyframe_interval` turns, a copy of the state is added to `keyframes`;
+    0 disables them.
+
+    `interactive` players choose their start tile, action, and target in a loop that
+    lets them change their mind; the UI needs this but bots don't.
+
+    With `timings`, the time spent in each phase of a turn is recorded there;
+    see `server.timing`.
+    """
+
+    def __init__(
+        self,
+        state: State,
+        rng: Random,
+        interactive: Collection[Player] = (),
+        record_events: bool = True,
+        keyframe_interval: int = 0,
+        turns: int = 0,
+        decisions: Sequence[int] = (),
+        timings: Optional[timing.GameTimings] = None,
+    ):
+        self.state = state
+        self.rng = rng
+        self.interactive = frozenset(interactive)
+        self.record_events = record_events
+        self.keyframe_interval = keyframe_interval
+        self.keyframes: list[Keyframe] = []
+        self.events: list[Event] = []
+        self.turns = turns
+        self.decisions = list(decisions)
+        self.pending: Optional[Decision] = None
+        self.timings = timings
+        self._flow = self._play()
+        self._advance(None)
+
+    @staticmethod
+    def resume(
+        keyframe: Keyframe,
+        decisions: Sequence[int],
+        interactive: Collection[Player] = (),
+        record_events: bool = True,
+        keyframe_interval: int = 0,
+    ) -> "Engine":
+        """
+        Continue a game from a keyframe.
+
+        `decisions` are the ones made before the keyframe, to carry on the record.
+        """
+        assert len(decisions) == keyframe.decision
+        return Engine(
+            keyframe.state.model_copy(deep=True),
+            Random(keyframe.seed),
+            interactive,
+            record_events,
+            keyframe_interval,
+            turns=keyframe.turn,
+            decisions=decisions,
+        )
+
+    def is_terminal(self) -> bool:
+        return self.pending is None
+
+    def legal_decisions(self) -> list[Choice]:
+        if self.pending is None:
+            return []
+        return self.pending.options()
+
+    def step(self, choice: Choice) -> None:
+        """Make the pending decision, then run until the next one."""
+        if self.pending is None:
+            raise ValueError("Game is over")
+        options = self.pending.options()
+        if choice not in options:
+            raise ValueError(f"Illegal {choice=} for {self.pending.kind}")
+        self.decisions.append(options.index(choice))
+        self._advance(choice)
+
+    def _advance(self, choice: Optional[Choice]) -> None:
+        # the flows may change the state from here until the next decision
+        self.state.touch()
+        timing.active = self.timings
+        try:
+            request = self._flow.send(choice)
+            while not isinstance(request, Decision):
+                if self.record_events:
+                    self.events.append(request)
+                request = next(self._flow)
+        except StopIteration:
+            self.pending = None
+            return
+        finally:
+            timing.active = None
+        self.pending = request
+
+    def _play(self) -> Flow[None]:
+        state = self.state
+        if self.turns == 0:
+            state.log("New game!")
+        yield STATE_CHANGED
+
+        while state.game_result() == GameResult.ONGOING:
+            state.check_consistency()
+
+            yield from _play_one_turn(state, self.interactive, self.rng)
+
+            state.next_turn()
+            self.turns += 1
+            self._end_turn()
+
+            yield STATE_CHANGED
+
+        state.log(f"Game over!  {state.game_result()}!")
+        yield STATE_CHANGED
+
+    def _end_turn(self) -> None:
+        """Reseed between turns, and maybe take a keyframe."""
+        seed = self.rng.getrandbits(64)
+        self.rng.seed(seed)
+
+        if (
+            self.keyframe_interval
+            and self.turns % self.keyframe_interval == 0
+            and self.state.game_result() == GameResult.ONGOING
+        ):
+            keyframe = Keyframe(
+                self.turns, len(self.decisions), seed, self.state.model_copy(deep=True)
+            )
+            self.keyframes.append(keyframe)
+
+
+@timing.phase("bonus")
+def _resolve_bonus(state: State) -> Flow[None]:
+    """Give a player bonus for starting their turn on the bonus square"""
+    player = state.maybe_player_at(state.bonus_position)
+    if state.current_player != player:
+        # current player does not get the bonus
+        return
+
+    revealed = 0
+    for _ in range(state.bonus_reveal):
+        revealed += state.reveal_unused()
+
+    state.log(
+        f"{player.format_for_log()} starts turn on bonus square: +${state.bonus_amount}, revealed {revealed} unused tiles"
+    )
+    state.coins[player] += state.bonus_amount
+    yield STATE_CHANGED
+
+
+def _move_x2(square: Square, state: State) -> Flow[None]:
+    """Allow the player to move the x2 highlight."""
+    player = state.player_at(square)
+    yield Waiting(other_player(player), "Waiting for opponent to move the ×2.")
+    choices: list[Action | Response] = [
+        t for t in Tile if t != state.x2_tile and t != Tile.HIDDEN
+    ]
+    choice = yield Decision(
+        DecisionKind.MOVE_X2,
+        player,
+        "Move the ×2 to a different action.",
+        actions=choices,
+    )
+    assert isinstance(choice, Tile)
+    state.x2_tile = choice
+    state.log(f"{player.format_for_log()} moved ×2 to {choice}")
+
+    yield STATE_CHANGED
+
+
+def _resolve_exchange(square: Square, state: State, rng: Random) -> Flow[None]:
+    """Allow a player to exchange with a exchange square"""
+    player = state.player_at(square)
+    exchange_index = state.exchange_positions.index(square)
+    tile_on_board_index = state.index_at(square)
+
+    # player can now see the exchange position
+    state.exchange_tiles_revealed[player][exchange_index] = True
+
+    yield STATE_CHANGED
+    yield Waiting(other_player(player), "Waiting for opponent to exchange tiles.")
+
+    # if they could, other player can no longer see the exchange position or tile
+    # because it may have change
+    state.exchange_tiles_revealed[other_player(player)][exchange_index] = False
+    state.tiles_on_board_revealed[player][tile_on_board_index] = False
+
+    old_tile = state.tile_at(square)
+    exchange_choices: list[Action | Response] = [
+        *state.exchange_tiles[exchange_index],
+        old_tile,
+    ]
+    choice = yield Decision(
+        DecisionKind.EXCHANGE,
+        player,
+        "Exchange tiles, or keep your current tile.",
+        actions=exchange_choices,
+    )
+
+    if choice != old_tile:
+        # they swapped with a exchange tile
+        state.tiles_on_board[player][tile_on_board_index] = choice
+        state.exchange_tiles[exchange_index].remove(choice)
+        state.exchange_tiles[exchange_index].append(old_tile)
+
+        # shuffle to hide which tile they placed
+        rng.shuffle(state.exchange_tiles[exchange_index])
+
+    state.log(f"{player.format_for_log()} may have exchanged tiles.")
+
+
+def _resolve_smite(state: State, player: Player, target: Square) -> Flow[None]:
+    state.coins[player] -= state.smite_cost
+    state.log(
+        f"{player.format_for_log()} smites ⚡ {target.format_for_log()} for ${state.smite_cost}"
+    )
+
+    yield from _lose_tile(target, state)
+    yield CLEAR_SELECTION
+
+
+def _check_special_square(end_square: Square, state: State, rng: Random) -> Flow[None]:
+    """
+    One of the players moved onto end_square, either directly or as side effect of an action;
+    If it's a special square, resolve it.
+    """
+    if state.maybe_player_at(end_square) is None:
+        # the tile that moved there has since been killed
+        return
+
+    if state.x2_tile is not None and end_square == state.bonus_position:
+        yield from _move_x2(end_square, state)
+
+    if end_square in state.exchange_positions:
+        yield from _resolve_exchange(end_square, state, rng)
+
+
+def _check_web(
+    start: Square, target: Square, state: State, moving_player: Player
+) -> None:
+    """
+    If the player moved onto an enemy web, they'll skip their next turn.  Doesn't stack.
+    """
+    already_skipping = state.skip_next_turn[moving_player]
+
+    enemy_webs = state.webs[other_player(moving_player)]
+
+    # if any of the squares on the path are enemy webs, the player skips their next turn
+    # also clears any webs they stepped on
+    for square in path(start, target):
+        if square in enemy_webs:
+            state.skip_next_turn[moving_player] = True
+            enemy_webs.remove(square)
+
+    if state.skip_next_turn[moving_player] and not already_skipping:
+        state.log(
+            f"{moving_player.format_for_log()} is tangled in WEB 🕸️ and will skip their next turn."
+        )
+
+
+@timing.phase("resolve_action")
+def _resolve_action(
+    start: Square,
+    action: Action,
+    target: Square,
+    state: State,
+    rng: Random,
+    reflect: bool = False,
+) -> Flow[None]:
+    if state.x2_tile == action:
+        repeats = 2
+        x2_msg = "2X "
+    else:
+        repeats = 1
+        x2_msg = ""
+
+    # `hits` is a possibly-empty list of tiles hit by the action
+    if reflect:
+        hits = reflect_action(start, action, target, state)
+        state.log(f"{state.other_player.format_for_log()} reflects {x2_msg}{action}")
+    else:
+        hits = take_action(start, action, target, state, rng)
+        state.log(f"{state.current_player.format_for_log()} uses {x2_msg}{action}")
+
+    for repeat in range(repeats):
+        if repeats > 1 and hits:
+            state.log(f"{repeat + 1} / {repeats} - ")
+
+        for hit in hits:
+            yield from _lose_tile(hit, state)
+
+        yield CLEAR_SELECTION
+
+    # we may have moved onto a special square or web
+    # (BACKSTABBER only moves when it doesn't kill)
+    if action in (
+        OtherAction.MOVE,
+        Tile.FLOWER,
+        Tile.BIRD,
+        Tile.TRICKSTER,
+        Tile.HARVESTER,
+        Tile.RAM,
+        Tile.BACKSTABBER,
+        Tile.SPIDER,
+    ) and not (action == Tile.BACKSTABBER and hits):
+        yield from _check_special_square(target, state, rng)
+        _check_web(start, target, state, moving_player=state.current_player)
+
+    # hook may have pulled someone onto one, or dragged someone across a web
+    if action == Tile.HOOK:
+        if reflect:
+            # player moved
+            moving_player = state.current_player
+            end_square = grapple_end_square(target, start)
+        else:
+            # enemy moved
+            moving_player = state.other_player
+            end_square = grapple_end_square(start, target)
+        assert end_square is not None
+        yield from _check_special_square(end_square, state, rng)
+        _check_web(start, target, state, moving_player)
+
+    # thief swaps positions, which might move either player onto one
+    if action == Tile.THIEF:
+        yield from _check_special_square(start, state, rng)
+        yield from _check_special_square(target, state, rng)
+
+        # current player moved to target
+        _check_web(start, target, state, moving_player=state.current_player)
+        # other player moved to start
+        _check_web(target, start, state, moving_player=state.other_player)
+
+    # spider goes again after exchange
+    if action == Tile.SPIDER and target in state.exchange_positions:
+        state.go_again = True
+
+
+@timing.phase("select_action")
+def _select_action(
+    state: State, interactive: frozenset[Player]
+) -> Flow[tuple[Square, Action, Square]]:
+    """
+    Prompt the player to choose the action for their turn.
+
+    Returns:
+        - square of the tile that's taking the action
+        - the action
+        - target square of the action
+    """
+    player = state.current_player
+    yield Waiting(state.other_player, "Waiting for opponent to select their action.")
+
+    possible_starts = state.positions[player]
+    assert 1 <= len(possible_starts) <= 2
+    if len(possible_starts) == 1:
+        # only one choice
+        start = possible_starts[0]
+    else:
+        start = yield Decision(
+            DecisionKind.ACTION, player, "Select a tile.", squares=possible_starts
+        )
+
+    # for bots, choose once
+    if player not in interactive:
+        actions_and_targets = valid_targets(start, state)
+        bot_action = yield Decision(
+            DecisionKind.ACTION,
+            player,
+            "Select an action.",
+            actions=list(actions_and_targets.keys()),
+            hint=state.maybe_tile_at(start),
+        )
+        target = yield Decision(
+            DecisionKind.ACTION,
+            player,
+            "Select a target.",
+            squares=actions_and_targets[bot_action],
+        )
+        # show both players the proposed action
+        yield SelectionChanged(None, player, start, bot_action, target)
+        return start, bot_action, target
+
+    # for humans, choose in a loop
+    # to allow changing out choice of start square & action
+    chosen_action: Optional[Action] = None
+    while True:
+        actions_and_targets = valid_targets(start, state)
+        possible_actions: list[Action | Response] = list(actions_and_targets.keys())
+        possible_targets = actions_and_targets[chosen_action] if chosen_action else []
+
+        # display the partial selection and valid actions/targets to the
+        # current player
+        yield SelectionChanged(player, player, start, chosen_action, None)
+
+        if not chosen_action and len(possible_starts) == 1:
+            possible_squares = []
+            prompt = "Select an action."
+        elif not chosen_action:
+            possible_squares = possible_starts
+            prompt = "Select an action, or a different tile."
+        elif len(possible_starts) == 1:
+            possible_squares = possible_targets
+            prompt = "Select a target, or a different action."
+        else:
+            possible_squares = possible_starts + possible_targets
+            prompt = "Select a target, or a different action or tile."
+
+        choice = yield Decision(
+            DecisionKind.ACTION,
+            player,
+            prompt,
+            actions=possible_actions,
+            squares=possible_squares,
+        )
+        if choice in possible_targets:
+            # they chose a target
+            # we should now have all 3 selected
+            assert chosen_action is not None
+            target = cast(Square, choice)
+
+            # show both players the proposed action
+            yield SelectionChanged(None, player, start, chosen_action, target)
+            return start, chosen_action, target
+        elif choice in possible_actions:
+            # they chose an action
+            # go around again for the target or different action
+            chosen_action = cast(Action, choice)
+        else:
+            # they chose a start square
+            # go around again for the action or different start
+            assert choice in possible_starts
+            start = cast(Square, choice)
+            chosen_action = None
+
+
+@timing.phase("lose_tile")
+def _lose_tile(player_or_square: Player | Square, state: State) -> Flow[None]:
+    """
+     - Prompt the player to choose a tile to lose, if applicable
+     - choose the tile to replace it, if applicable
+     - log the lost tile
+     - update state
+
+    If `player_or_square` is a square, the player must lose the tile on that square.
+    (E.g. when that tile was hit by an attack.)
+
+    If `player_or_square` is a player, the player chooses one tile on board to lose.
+    (E.g. when the player lost a challenge.)
+    We allow the player to cancel and retry that choice when they get to the replacement
+    tile.
+    """
+
+    # select which tile on board is lost
+    # in some cases the player gets a choice
+    if isinstance(player_or_square, Square):
+        # a specific square was lost to an attack, so they get no choice
+        maybe_player = state.maybe_player_at(player_or_square)
+        if maybe_player is None:
+            # if a double-attack killed the square and nothing replaced it,
+            # it's possible the square is empty
+            # in which case nothing happens
+            return
+        player = maybe_player
+        possible_squares = [player_or_square]
+    else:
+        # they lost a challenge, so they get a choice if they have multiple tiles
+        assert player_or_square in Player
+        player = player_or_square
+        possible_squares = list(state.positions[player])
+
+    if len(possible_squares) == 0:
+        # they have no tiles to lose
+        # i.e. their last tile was already killed by action
+        return
+
+    if len(possible_squares) > 1 or len(state.tiles_in_hand[player]) > 0:
+        # current player will need to choose something, so set a waiting prompt for opponent
+        # and send any state updates so far to both players
+        yield STATE_CHANGED
+        yield Waiting(other_player(player), "Waiting for opponent to lose tile.")
+
+    if len(possible_squares) > 1:
+        square = yield Decision(
+            DecisionKind.LOSE_TILE,
+            player,
+            "Choose which tile to lose.",
+            squares=possible_squares,
+        )
+    else:
+        square = possible_squares[0]
+
+    # choose replacement tile from hand in a loop
+    # to enable choosing a different square to lose
+    while True:
+        # mark the selected tile with an X for this player
+        yield SelectionChanged(player, player, None, None, square)
+
+        tile = state.tile_at(square)
+        hand_tiles = state.tiles_in_hand[player]
+
+        if len(hand_tiles) == 0:
+            # the player has no tiles in hand, so no choice
+            replacement = None
+            break
+
+        if len(hand_tiles) == 1:
+            # the player only has one tile in hand, so no choice
+            replacement = hand_tiles[0]
+            break
+
+        if len(possible_squares) == 1:
+            # the player chooses the replacement tile
+            replacement = yield Decision(
+                DecisionKind.REPLACEMENT,
+                player,
+                "Choose the replacement tile from your hand.",
+                hand_tiles=list(hand_tiles),
+            )
+            break
+
+        # otherwise, the player chooses the replacement tile or changes the lost tile
+        choice = yield Decision(
+            DecisionKind.REPLACEMENT,
+            player,
+            "Choose the replacement tile from your hand, or a different tile to lose.",
+            squares=possible_squares,
+            hand_tiles=list(hand_tiles),
+        )
+        if choice in hand_tiles:
+            replacement = cast(Tile, choice)
+            break
+        else:
+            # they changed the lost tile
+            # go around the loop again to choose the replacement
+            assert choice in possible_squares
+            square = cast(Square, choice)
+            continue
+
+    # move the tile from alive to dead
+    state.remove_tile(square)
+    state.discard.append(tile)
+
+    # move the replacement tile if applicable
+    if replacement:
+        state.tiles_in_hand[player].remove(replacement)
+        state.place_tile(player, replacement, square)
+        state.log(
+            f"{player.format_for_log()} lost {tile} on {square.format_for_log()} and replaced it from hand."
+        )
+    else:
+        state.log(
+            f"{player.format_for_log()} lost {tile} on {square.format_for_log()}."
+        )
+
+    state.score_point(other_player(player))
+    yield CLEAR_SELECTION
+    yield STATE_CHANGED
+
+
+@timing.phase("select_response")
+def _select_response(
+    start: Square, action: Action, target: Square, state: State
+) -> Flow[Response | Tile]:
+    assert action in Tile
+
+    player_at_target = state.maybe_player_at(target)
+    tile_at_target = state.maybe_tile_at(target)
+
+    possible_responses: list[Action | Response] = [
+        Response.ACCEPT,
+        Response.CHALLENGE,
+    ]
+    # only an enemy tile on the target square can reflect
+    # e.g. not when BACKSTABBER moves to an empty square
+    if player_at_target == state.other_player and action in (
+        # each of these tiles reflects itself
+        Tile.HOOK,
+        Tile.THIEF,
+        Tile.KNIVES,
+        Tile.BACKSTABBER,
+        # Tile.FIREBALL reflects Tile.FIREBALL, but only if the direct target is an enemy
+        Tile.FIREBALL,
+    ):
+        possible_responses.append(action)
+
+    yield Waiting(state.current_player, "Waiting for opponent to respond.")
+
+    response = yield Decision(
+        DecisionKind.RESPONSE,
+        state.other_player,
+        f"Opponent claimed {action}.  Choose your response.",
+        actions=possible_responses,
+        hint=tile_at_target,
+    )
+    return response
+
+
+@timing.phase("select_reflect_response")
+def _select_reflect_response(action: Action, state: State) -> Flow[Response]:
+    yield Waiting(state.other_player, "Waiting for opponent to respond to reflect.")
+    response = yield Decision(
+        DecisionKind.REFLECT_RESPONSE,
+        state.current_player,
+        f"Opponent reflected with {action}.  Choose your response.",
+        actions=[Response.ACCEPT, Response.CHALLENGE],
+    )
+    return response
+
+
+def _select_smite_target(state: State, player: Player) -> Flow[Square]:
+    yield Waiting(
+        other_player(player), "Waiting for opponent to select a tile to smite ⚡"
+    )
+    target = yield Decision(
+        DecisionKind.SMITE,
+        player,
+        "Select a tile to smite ⚡",
+        squares=list(state.positions[other_player(player)]),
+    )
+    return target
+
+
+@timing.phase("maybe_smite")
+def _maybe_smite(state: State) -> Flow[None]:
+    """
+    Check if either player has enough coins to smite.
+    If so, select a target and resolve the smite.
+    """
+    for player in (state.current_player, state.other_player):
+        if state.game_result() != GameResult.ONGOING:
+            # sometimes we hit enough coins to smite at the same time as the game ends, if e.g.
+            # the opponent lost a challenge.
+            # only smite if the game is still ongoing
+            return
+
+        if state.smite_cost <= state.coins[player]:
+            # the player must have just gained enough coins to smite
+            yield CLEAR_SELECTION
+            # make sure both players see the updated coin amount before selecting a target
+            yield STATE_CHANGED
+
+            target = yield from _select_smite_target(state, player)
+            yield from _resolve_smite(state, player, target)
+
+
+def _play_one_turn(
+    state: State, interactive: frozenset[Player], rng: Random
+) -> Flow[None]:
+    """
+    Play one turn, prompting both players for choices as needed.
+
+    Updates `state` with the result of the turn. Doesn't transition to the next turn
+    or display that state to the players.
+    """
+
+    if state.skip_next_turn[state.current_player]:
+        state.log(f"{state.current_player.format_for_log()} skips their turn.")
+        state.skip_next_turn[state.current_player] = False
+        yield STATE_CHANGED
+        return
+
+    # maybe give a bonus to current player for starting on the bonus square
+    # this only happens once, even if the current player goes again
+    yield from _resolve_bonus(state)
+
+    # the bonus may push the current player's coins above the smite cost
+    yield from _maybe_smite(state)
+
+    # spider on exchange may allow the current player to go again
+    # in which case we repeat the whole turn, except for the bonus
+    state.go_again = True
+    while state.go_again:
+        state.go_again = False
+
+        if state.game_result() != GameResult.ONGOING:
+            # a smite already ended the game
+            break
+
+        # current player chooses their move
+        start, action, target = yield from _select_action(state, interactive)
+        if not action in Tile:
+            assert action in OtherAction
+            # the player didn't claim a tile
+            # i.e. they moved or smited
+            # so no possibility of challenge
+            yield from _resolve_action(start, action, target, state, rng)
+            continue
+
+        # ask opponent to accept, challenge, or reflect as appropriate
+        response = yield from _select_response(start, action, target, state)
+
+        if response == Response.ACCEPT:
+            # other player allows the action to proceed
+            yield from _resolve_action(start, action, target, state, rng)
+
+        elif response == Response.CHALLENGE:
+            state.reveal_at(start)
+            start_tile = state.tile_at(start)
+            msg = f"{state.current_player.format_for_log()} reveals a {start_tile}."
+            if action == start_tile:
+                # challenge fails
+                # original action succeeds
+                state.log(
+                    msg
+                    + f" Challenge fails!  First the {action} happens, then {state.other_player.format_for_log()} will choose a tile to lose."
+                )
+                yield from _resolve_action(start, action, target, state, rng)
+                yield from _lose_tile(state.other_player, state)
+            else:
+                # challenge succeeds
+                # original action fails
+                state.log(msg + " Challenge succeeds!")
+                yield CLEAR_SELECTION
+                yield from _lose_tile(state.current_player, state)
+        else:
+            assert action == response
+            # the response was to reflect
+            # which the original player may challenge
+            reflect_response = yield from _select_reflect_response(response, state)
+            target_tile = state.tile_at(target)
+            reveal_msg = (
+                f"{state.other_player.format_for_log()} reveals a {target_tile}."
+            )
+
+            if reflect_response == Response.ACCEPT:
+                # reflect succeeds
+                # original action fails
+                state.log(f"{action} reflected.")
+                yield CLEAR_SELECTION
+                yield from _resolve_action(
+                    start, action, target, state, rng, reflect=True
+                )
+            elif target_tile == response:
+                # challenge fails
+                # reflect succeeds
+                # original action fails
+                state.reveal_at(target)
+                state.log(
+                    reveal_msg
+                    + f" Challenge fails!  First the {response} is reflected, then {state.current_player.format_for_log()} will choose a tile to lose."
+                )
+                yield CLEAR_SELECTION
+                yield from _resolve_action(
+                    start, action, target, state, rng, reflect=True
+                )
+                yield from _lose_tile(state.current_player, state)
+            else:
+                state.reveal_at(target)
+                # challenge succeeds
+                # reflect fails
+                # original action succeeds
+                state.log(
+                    reveal_msg
+                    + f" Challenge succeeds!  First the {action} happens, then {state.other_player.format_for_log()} will choose a tile to lose."
+                )
+                yield from _resolve_action(start, action, target, state, rng)
+                yield from _lose_tile(state.other_player, state)
+
+        # the action may push the current player's coins above the smite cost
+        # or the opponent's, if an action was reflected
+        yield from _maybe_smite(state)
+
+        if state.go_again:
+            state.log(f"{state.current_player.format_for_log()} can move again.")
+
+        yield STATE_CHANGED
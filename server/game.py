@@ -1,751 +1,236 @@
-from typing import Optional, cast, Literal
-from random import shuffle
+from typing import Literal, Optional
+from random import Random, SystemRandom
 import asyncio
+import os
+import time
+
+from websockets.exceptions import ConnectionClosed
 
 from server.agents import Agent, Human
-from server.actions import (
-    valid_targets,
-    take_action,
-    reflect_action,
-    grapple_end_square,
-    path,
+from server.engine import (
+    Engine,
+    Decision,
+    DecisionKind,
+    Choice,
+    Event,
+    StateChanged,
+    SelectionChanged,
+    Waiting,
 )
 from server.state import new_state, State
-from server.constants import (
-    Player,
-    Square,
-    GameResult,
-    Action,
-    Tile,
-    OtherAction,
-    Response,
-    other_player,
-)
+from server import metrics, outbox, recording, timing, trace
+from server.session import Session, close_session, open_session
+from server.constants import Player, Tile, Response
 from server.choices import send_prompt
 from server.notify import (
     broadcast_state_changed,
     notify_selection_changed,
     broadcast_selection_changed,
-    clear_selection,
     broadcast_game_over,
 )
 
+# if set, a recording of every finished game is saved to this directory
+RECORDINGS_DIR = os.environ.get("RECORDINGS_DIR")
 
-async def _resolve_bonus(
-    state: State,
-    players: dict[Player, Agent],
-) -> None:
-    """Give a player bonus for starting their turn on the bonus square"""
-    player = state.maybe_player_at(state.bonus_position)
-    if state.current_player != player:
-        # current player does not get the bonus
-        return
-
-    revealed = 0
-    for _ in range(state.bonus_reveal):
-        revealed += state.reveal_unused()
-
-    state.log(
-        f"{player.format_for_log()} starts turn on bonus square: +${state.bonus_amount}, revealed {revealed} unused tiles"
-    )
-    state.coins[player] += state.bonus_amount
-    await broadcast_state_changed(state, players)
-
-
-async def _move_x2(
-    square: Square,
-    state: State,
-    players: dict[Player, Agent],
-) -> None:
-    """Allow the player to move the x2 highlight."""
-    player = state.player_at(square)
-    await send_prompt(
-        "Waiting for opponent to move the ×2.",
-        players[other_player(player)].websocket,
-    )
-    choices: list[Action] = [t for t in Tile if t != state.x2_tile and t != Tile.HIDDEN]
-    choice = await players[player].choose_action_or_square(
-        choices,
-        [],
-        "Move the ×2 to a different action.",
-        true_action_hint=None,
-    )
-    assert isinstance(choice, Tile)
-    state.x2_tile = choice
-    state.log(f"{player.format_for_log()} moved ×2 to {choice}")
-
-    await broadcast_state_changed(state, players)
-
-
-async def _resolve_exchange(
-    square: Square,
-    state: State,
-    players: dict[Player, Agent],
-) -> None:
-    """Allow a player to exchange with a exchange square"""
-    player = state.player_at(square)
-    exchange_index = state.exchange_positions.index(square)
-    tile_on_board_index = state.positions[player].index(square)
-
-    # player can now see the exchange position
-    state.exchange_tiles_revealed[player][exchange_index] = True
-
-    await broadcast_state_changed(state, players)
-    await send_prompt(
-        "Waiting for opponent to exchange tiles.",
-        players[other_player(player)].websocket,
-    )
-
-    # if they could, other player can no longer see the exchange position or tile
-    # because it may have change
-    state.exchange_tiles_revealed[other_player(player)][exchange_index] = False
-    state.tiles_on_board_revealed[player][tile_on_board_index] = False
-
-    old_tile = state.tile_at(square)
-    exchange_choices = state.exchange_tiles[exchange_index] + [old_tile]
-    choice = await players[player].choose_exchange(
-        exchange_choices,
-        "Exchange tiles, or keep your current tile.",
-    )
-
-    if choice != old_tile:
-        # they swapped with a exchange tile
-        state.tiles_on_board[player][tile_on_board_index] = choice
-        state.exchange_tiles[exchange_index].remove(choice)
-        state.exchange_tiles[exchange_index].append(old_tile)
-
-        # shuffle to hide which tile they placed
-        shuffle(state.exchange_tiles[exchange_index])
-
-    state.log(f"{player.format_for_log()} may have exchanged tiles.")
-
-
-async def _resolve_smite(
-    state: State,
-    player: Player,
-    players: dict[Player, Agent],
-    target: Square,
-) -> None:
-    state.coins[player] -= state.smite_cost
-    state.log(
-        f"{player.format_for_log()} smites ⚡ {target.format_for_log()} for ${state.smite_cost}"
-    )
-
-    await _lose_tile(target, state, players)
-    await clear_selection(players)
-
-
-async def _check_special_square(
-    end_square: Square, state: State, players: dict[Player, Agent]
-) -> None:
-    """
-    One of the players moved onto end_square, either directly or as side effect of an action;
-    If it's a special square, resolve it.
-    """
-    if state.x2_tile is not None and end_square == state.bonus_position:
-        await _move_x2(end_square, state, players)
-
-    if end_square in state.exchange_positions:
-        await _resolve_exchange(end_square, state, players)
-
-
-async def _check_web(
-    start: Square, target: Square, state: State, moving_player: Player
-) -> None:
-    """
-    If the player moved onto an enemy web, they'll skip their next turn.  Doesn't stack.
-    """
-    already_skipping = state.skip_next_turn[moving_player]
-
-    enemy_webs = state.webs[other_player(moving_player)]
-
-    # if any of the squares on the path are enemy webs, the player skips their next turn
-    # also clears any webs they stepped on
-    for square in path(start, target):
-        if square in enemy_webs:
-            state.skip_next_turn[moving_player] = True
-            enemy_webs.remove(square)
-
-    if state.skip_next_turn[moving_player] and not already_skipping:
-        state.log(
-            f"{moving_player.format_for_log()} is tangled in WEB 🕸️ and will skip their next turn."
-        )
-
-
-async def _resolve_action(
-    start: Square,
-    action: Action,
-    target: Square,
-    state: State,
-    players: dict[Player, Agent],
-    reflect: bool = False,
-) -> None:
-    if state.x2_tile == action:
-        repeats = 2
-        x2_msg = "2X "
-    else:
-        repeats = 1
-        x2_msg = ""
-
-    # `hits` is a possibly-empty list of tiles hit by the action
-    if reflect:
-        hits = reflect_action(start, action, target, state)
-        state.log(f"{state.other_player.format_for_log()} reflects {x2_msg}{action}")
-    else:
-        hits = take_action(start, action, target, state)
-        state.log(f"{state.current_player.format_for_log()} uses {x2_msg}{action}")
-
-    for repeat in range(repeats):
-        if repeats > 1 and hits:
-            state.log(f"{repeat + 1} / {repeats} - ")
-
-        for hit in hits:
-            await _lose_tile(hit, state, players)
+# recordings embed a copy of the state this many turns apart, for seeking
+KEYFRAME_INTERVAL = int(os.environ.get("KEYFRAME_INTERVAL", "10"))
 
-        await clear_selection(players)
 
-    # we may have moved onto a special square or web
-    if action in (
-        OtherAction.MOVE,
-        Tile.FLOWER,
-        Tile.BIRD,
-        Tile.TRICKSTER,
-        Tile.HARVESTER,
-        Tile.RAM,
-        Tile.BACKSTABBER,
-        Tile.SPIDER,
-    ):
-        await _check_special_square(target, state, players)
-        await _check_web(start, target, state, moving_player=state.current_player)
-
-    # hook may have pulled someone onto one, or dragged someone across a web
-    if action == Tile.HOOK:
-        if reflect:
-            # player moved
-            moving_player = state.current_player
-            end_square = grapple_end_square(target, start, obstructions=[])
-        else:
-            # enemy moved
-            moving_player = state.other_player
-            end_square = grapple_end_square(start, target, obstructions=[])
-        assert end_square is not None
-        await _check_special_square(end_square, state, players)
-        await _check_web(start, target, state, moving_player)
-
-    # thief swaps positions, which might move either player onto one
-    if action == Tile.THIEF:
-        await _check_special_square(start, state, players)
-        await _check_special_square(target, state, players)
-
-        # current player moved to target
-        await _check_web(start, target, state, moving_player=state.current_player)
-        # other player moved to start
-        await _check_web(target, start, state, moving_player=state.other_player)
-
-    # spider goes again after exchange
-    if action == Tile.SPIDER and target in state.exchange_positions:
-        state.go_again = True
-
-
-async def _select_action(
-    state: State, players: dict[Player, Agent]
-) -> tuple[Square, Action, Square]:
-    """
-    Prompt the player to choose the action for their turn.
-
-    Returns:
-        - square of the tile that's taking the action
-        - the action
-        - target square of the action
-    """
-    await send_prompt(
-        "Waiting for opponent to select their action.",
-        players[state.other_player].websocket,
-    )
-    current_agent = players[state.current_player]
-
-    possible_starts = state.positions[state.current_player]
-    assert 1 <= len(possible_starts) <= 2
-    if len(possible_starts) == 1:
-        # only one choice
-        start = possible_starts[0]
-    else:
-        choice = await current_agent.choose_action_or_square(
-            [], possible_starts, "Select a tile.", true_action_hint=None
-        )
-        start = cast(Square, choice)
-
-    # for bots, choose once
-    if not isinstance(current_agent, Human):
-        true_action_hint = state.maybe_tile_at(start)
-        actions_and_targets = valid_targets(start, state)
-        possible_actions = list(actions_and_targets.keys())
-        bot_action = await current_agent.choose_action_or_square(
-            possible_actions, [], "Select an action.", true_action_hint
-        )
-        assert isinstance(bot_action, Action)
-        target = await current_agent.choose_action_or_square(
-            [], actions_and_targets[bot_action], "Select a target.", None
-        )
-        assert isinstance(target, Square)
-        # show both players the proposed action
-        await broadcast_selection_changed(
-            state.current_player, start, bot_action, target, players
-        )
-        return start, bot_action, target
-
-    # for humans, choose in a loop
-    # to allow changing out choice of start square & action
-    chosen_action: Optional[Action] = None
-    while True:
-        actions_and_targets = valid_targets(start, state)
-        possible_actions = list(actions_and_targets.keys())
-        possible_targets = actions_and_targets[chosen_action] if chosen_action else []
-
-        # display the partial selection and valid actions/targets to the
-        # current player
-        await notify_selection_changed(
-            state.current_player, start, chosen_action, None, current_agent.websocket
-        )
-
-        if not chosen_action and len(possible_starts) == 1:
-            possible_squares = []
-            prompt = "Select an action."
-        elif not chosen_action:
-            possible_squares = possible_starts
-            prompt = "Select an action, or a different tile."
-        elif len(possible_starts) == 1:
-            possible_squares = possible_targets
-            prompt = "Select a target, or a different action."
-        else:
-            possible_squares = possible_starts + possible_targets
-            prompt = "Select a target, or a different action or tile."
-
-        choice = await current_agent.choose_action_or_square(
-            possible_actions, possible_squares, prompt, true_action_hint=None
-        )
-        if choice in possible_targets:
-            # they chose a target
-            # we should now have all 3 selected
-            assert chosen_action is not None
-            target = cast(Square, choice)
-
-            # show both players the proposed action
+async def _notify(event: Event, state: State, players: dict[Player, Agent]) -> None:
+    """Forward one engine event to the players' websockets.  Bots aren't notified."""
+    if isinstance(event, StateChanged):
+        await broadcast_state_changed(state, players)
+    elif isinstance(event, SelectionChanged):
+        if event.player is None:
             await broadcast_selection_changed(
-                state.current_player, start, chosen_action, target, players
+                event.selecting_player,
+                event.start,
+                event.action,
+                event.target,
+                players,
             )
-            return start, chosen_action, target
-        elif choice in possible_actions:
-            # they chose an action
-            # go around again for the target or different action
-            chosen_action = cast(Action, choice)
-        else:
-            # they chose a start square
-            # go around again for the action or different start
-            assert choice in possible_starts
-            start = cast(Square, choice)
-            chosen_action = None
-
-
-async def _lose_tile(
-    player_or_square: Player | Square,
-    state: State,
-    players: dict[Player, Agent],
-) -> None:
-    """
-     - Prompt the player to choose a tile to lose, if applicable
-     - choose the tile to replace it, if applicable
-     - log the lost tile
-     - update state
-
-    If `player_or_square` is a square, the player must lose the tile on that square.
-    (E.g. when that tile was hit by an attack.)
-
-    If `player_or_square` is a player, the player chooses one tile on board to lose.
-    (E.g. when the player lost a challenge.)
-    We allow the player to cancel and retry that choice when they get to the replacement
-    tile.
-    """
-
-    # select which tile on board is lost
-    # in some cases the player gets a choice
-    if isinstance(player_or_square, Square):
-        # a specific square was lost to an attack, so they get no choice
-        try:
-            player = state.player_at(player_or_square)
-        except ValueError:
-            # if a double-attack killed the square and nothing replaced it,
-            # it's possible the square is empty
-            # in which case nothing happens
-            return
-        possible_squares = [player_or_square]
+        elif isinstance(players[event.player], Human):
+            await notify_selection_changed(
+                event.selecting_player,
+                event.start,
+                event.action,
+                event.target,
+                players[event.player].websocket,
+            )
+    elif isinstance(event, Waiting):
+        if isinstance(players[event.player], Human):
+            await send_prompt(event.prompt, players[event.player].websocket)
     else:
-        # they lost a challenge, so they get a choice if they have multiple tiles
-        assert player_or_square in Player
-        player = player_or_square
-        possible_squares = state.positions[player]
-
-    if len(possible_squares) == 0:
-        # they have no tiles to lose
-        # i.e. their last tile was already killed by action
-        return
+        assert False, f"unknown {event=}"
 
-    if len(possible_squares) > 1 or len(state.tiles_in_hand[player]) > 0:
-        # current player will need to choose something, so set a waiting prompt for opponent
-        # and send any state updates so far to both players
-        await broadcast_state_changed(state, players)
-        await send_prompt(
-            "Waiting for opponent to lose tile.",
-            players[other_player(player)].websocket,
-        )
-
-    agent = players[player]
 
-    if len(possible_squares) > 1:
-        choice = await agent.choose_square_or_hand(
-            possible_squares,
-            [],
-            "Choose which tile to lose.",
-        )
-        square = cast(Square, choice)
-    else:
-        square = possible_squares[0]
+async def decide(decision: Decision, players: dict[Player, Agent]) -> Choice:
+    """Ask the deciding player's agent to make the decision."""
+    agent = players[decision.player]
 
-    # choose replacement tile from hand in a loop
-    # to enable choosing a different square to lose
-    while True:
-        # mark the selected tile with an X for this player
-        await notify_selection_changed(
-            player, start=None, action=None, target=square, websocket=agent.websocket
+    if decision.kind in (
+        DecisionKind.ACTION,
+        DecisionKind.SMITE,
+        DecisionKind.MOVE_X2,
+    ):
+        return await agent.choose_action_or_square(
+            [a for a in decision.actions if not isinstance(a, Response)],
+            decision.squares,
+            decision.prompt,
+            true_action_hint=decision.hint,
         )
 
-        tile = state.tile_at(square)
-        hand_tiles = state.tiles_in_hand[player]
-
-        if len(hand_tiles) == 0:
-            # the player has no tiles in hand, so no choice
-            replacement = None
-            break
-
-        if len(hand_tiles) == 1:
-            # the player only has one tile in hand, so no choice
-            replacement = hand_tiles[0]
-            break
-
-        if len(possible_squares) == 1:
-            # the player chooses the replacement tile
-            choice = await agent.choose_square_or_hand(
-                possible_squares=[],
-                possible_hand_tiles=hand_tiles,
-                prompt="Choose the replacement tile from your hand.",
-            )
-            replacement = cast(Tile, choice)
-            break
-
-        # otherwise, the player chooses the replacement tile or changes the lost tile
-        choice = await agent.choose_square_or_hand(
-            possible_squares=possible_squares,
-            possible_hand_tiles=hand_tiles,
-            prompt="Choose the replacement tile from your hand, or a different tile to lose.",
+    if decision.kind in (DecisionKind.LOSE_TILE, DecisionKind.REPLACEMENT):
+        return await agent.choose_square_or_hand(
+            decision.squares,
+            decision.hand_tiles,
+            decision.prompt,
         )
-        if choice in hand_tiles:
-            replacement = cast(Tile, choice)
-            break
-        else:
-            # they changed the lost tile
-            # go around the loop again to choose the replacement
-            assert choice in possible_squares
-            square = cast(Square, choice)
-            continue
-
-    # move the tile from alive to dead
-    position_index = state.positions[player].index(square)
-    state.tiles_on_board[player].pop(position_index)
-    state.positions[player].pop(position_index)
-    state.tiles_on_board_revealed[player].pop(position_index)
-    state.discard.append(tile)
 
-    # move the replacement tile if applicable
-    if replacement:
-        state.tiles_in_hand[player].remove(replacement)
-        state.tiles_on_board[player].append(replacement)
-        state.positions[player].append(square)
-        state.tiles_on_board_revealed[player].append(False)
-        state.log(
-            f"{player.format_for_log()} lost {tile} on {square.format_for_log()} and replaced it from hand."
+    if decision.kind in (DecisionKind.RESPONSE, DecisionKind.REFLECT_RESPONSE):
+        hint = decision.hint if isinstance(decision.hint, Tile) else None
+        return await agent.choose_response(
+            [r for r in decision.actions if isinstance(r, (Response, Tile))],
+            decision.prompt,
+            true_response_hint=hint,
         )
-    else:
-        state.log(
-            f"{player.format_for_log()} lost {tile} on {square.format_for_log()}."
-        )
-
-    state.score_point(other_player(player))
-    await clear_selection(players)
-    await broadcast_state_changed(state, players)
 
-
-async def _select_response(
-    start: Square,
-    action: Action,
-    target: Square,
-    state: State,
-    players: dict[Player, Agent],
-) -> Response | Tile:
-    assert action in Tile
-
-    player_at_target = state.maybe_player_at(target)
-    tile_at_target = state.maybe_tile_at(target)
-
-    possible_responses: list[Response | Tile] = [
-        Response.ACCEPT,
-        Response.CHALLENGE,
-    ]
-    if action == Tile.HOOK:
-        # Tile.HOOK reflects Tile.HOOK
-        possible_responses.append(Tile.HOOK)
-    elif action == Tile.THIEF:
-        # Tile.THIEF reflects Tile.THIEF
-        possible_responses.append(Tile.THIEF)
-    elif action == Tile.KNIVES:
-        # Tile.KNIVES reflects Tile.KNIVES
-        possible_responses.append(Tile.KNIVES)
-    elif action == Tile.BACKSTABBER:
-        # Tile.BACKSTABBER reflects Tile.BACKSTABBER
-        possible_responses.append(Tile.BACKSTABBER)
-    elif action == Tile.FIREBALL and player_at_target == state.other_player:
-        # Tile.FIREBALL reflects Tile.FIREBALL, but only if the direct target is an enemy
-        possible_responses.append(Tile.FIREBALL)
-
-    await send_prompt(
-        "Waiting for opponent to respond.", players[state.current_player].websocket
-    )
-
-    return await players[state.other_player].choose_response(
-        possible_responses,
-        f"Opponent claimed {action}.  Choose your response.",
-        true_response_hint=tile_at_target,
-    )
-
-
-async def _select_reflect_response(
-    action: Action, state: State, players: dict[Player, Agent]
-) -> Response:
-    await send_prompt(
-        "Waiting for opponent to respond to reflect.",
-        players[state.other_player].websocket,
-    )
-    response = await players[state.current_player].choose_response(
-        [Response.ACCEPT, Response.CHALLENGE],
-        f"Opponent reflected with {action}.  Choose your response.",
-        true_response_hint=None,
+    assert decision.kind == DecisionKind.EXCHANGE
+    return await agent.choose_exchange(
+        [t for t in decision.actions if isinstance(t, Tile)],
+        decision.prompt,
     )
-    return cast(Response, response)
-
-
-async def _select_smite_target(
-    state: State, player: Player, players: dict[Player, Agent]
-) -> Square:
-    await send_prompt(
-        "Waiting for opponent to select a tile to smite ⚡",
-        players[other_player(player)].websocket,
-    )
-    choice = await players[player].choose_action_or_square(
-        [],
-        state.positions[other_player(player)],
-        "Select a tile to smite ⚡",
-        true_action_hint=None,
-    )
-    return cast(Square, choice)
-
-
-async def _maybe_smite(state: State, players: dict[Player, Agent]) -> None:
-    """
-    Check if either player has enough coins to smite.
-    If so, select a target and resolve the smite.
-    """
-    if state.game_result() != GameResult.ONGOING:
-        # sometimes we hit enough coins to smite at the same time as the game ends, if e.g.
-        # the opponent lost a challenge.
-        # only smite if the game is still ongoing
-        return
-
-    # if the current player has enough coins to smite, select a target and resolve the smite
-    if state.smite_cost <= state.coins[state.current_player]:
-        # the current player must have just gained enough coins to smite
-        await clear_selection(players)
-        # make sure both players see the updated coin amount before selecting a target
-        await broadcast_state_changed(state, players)
-
-        target = await _select_smite_target(state, state.current_player, players)
-        await _resolve_smite(state, state.current_player, players, target)
-
-    if state.smite_cost <= state.coins[state.other_player]:
-        # the other player must have just gained enough coins to smite
-        await clear_selection(players)
-        # make sure both players see the updated coin amount before selecting a target
-        await broadcast_state_changed(state, players)
-
-        target = await _select_smite_target(state, state.other_player, players)
-        await _resolve_smite(state, state.other_player, players, target)
-
-
-async def _play_one_turn(state: State, players: dict[Player, Agent]) -> None:
-    """
-    Play one turn, prompting both players for choices as needed.
-
-    Updates `state` with the result of the turn. Doesn't transition to the next turn
-    or display that state to the players.
-    """
-
-    if state.skip_next_turn[state.current_player]:
-        state.log(f"{state.current_player.format_for_log()} skips their turn.")
-        state.skip_next_turn[state.current_player] = False
-        await broadcast_state_changed(state, players)
-        return
-
-    # maybe give a bonus to current player for starting on the bonus square
-    # this only happens once, even if the current player goes again
-    await _resolve_bonus(state, players)
-
-    # the bonus may push the current player's coins above the smite cost
-    await _maybe_smite(state, players)
-
-    # spider on exchange may allow the current player to go again
-    # in which case we repeat the whole turn, except for the bonus
-    state.go_again = True
-    while state.go_again:
-        state.go_again = False
-
-        # current player chooses their move
-        start, action, target = await _select_action(state, players)
-        if not action in Tile:
-            assert action in OtherAction
-            # the player didn't claim a tile
-            # i.e. they moved or smited
-            # so no possibility of challenge
-            await _resolve_action(start, action, target, state, players)
-            continue
-
-        # ask opponent to accept, challenge, or reflect as appropriate
-        response = await _select_response(start, action, target, state, players)
-
-        if response == Response.ACCEPT:
-            # other player allows the action to proceed
-            await _resolve_action(start, action, target, state, players)
-
-        elif response == Response.CHALLENGE:
-            state.reveal_at(start)
-            start_tile = state.tile_at(start)
-            msg = f"{state.current_player.format_for_log()} reveals a {start_tile}."
-            if action == start_tile:
-                # challenge fails
-                # original action succeeds
-                state.log(
-                    msg
-                    + f" Challenge fails!  First the {action} happens, then {state.other_player.format_for_log()} will choose a tile to lose."
-                )
-                await _resolve_action(start, action, target, state, players)
-                await _lose_tile(state.other_player, state, players)
-            else:
-                # challenge succeeds
-                # original action fails
-                state.log(msg + " Challenge succeeds!")
-                await clear_selection(players)
-                await _lose_tile(state.current_player, state, players)
-        else:
-            assert action == response
-            # the response was to reflect
-            # which the original player may challenge
-            reflect_response = await _select_reflect_response(response, state, players)
-            target_tile = state.tile_at(target)
-            reveal_msg = (
-                f"{state.other_player.format_for_log()} reveals a {target_tile}."
-            )
-
-            if reflect_response == Response.ACCEPT:
-                # reflect succeeds
-                # original action fails
-                state.log(f"{action} reflected.")
-                await clear_selection(players)
-                await _resolve_action(
-                    start, action, target, state, players, reflect=True
-                )
-            elif target_tile == response:
-                # challenge fails
-                # reflect succeeds
-                # original action fails
-                state.reveal_at(target)
-                state.log(
-                    reveal_msg
-                    + f" Challenge fails!  First the {response} is reflected, then {state.current_player.format_for_log()} will choose a tile to lose."
-                )
-                await clear_selection(players)
-                await _resolve_action(
-                    start, action, target, state, players, reflect=True
-                )
-                await _lose_tile(state.current_player, state, players)
-            else:
-                state.reveal_at(target)
-                # challenge succeeds
-                # reflect fails
-                # original action succeeds
-                state.log(
-                    reveal_msg
-                    + f" Challenge succeeds!  First the {action} happens, then {state.other_player.format_for_log()} will choose a tile to lose."
-                )
-                await _resolve_action(start, action, target, state, players)
-                await _lose_tile(state.other_player, state, players)
-
-        # the action may push the current player's coins above the smite cost
-        # or the opponent's, if an action was reflected
-        await _maybe_smite(state, players)
-
-        if state.go_again:
-            state.log(f"{state.current_player.format_for_log()} can move again.")
-
-        await broadcast_state_changed(state, players)
 
 
 async def play_one_game(
     match_score: dict[Player, int],
     players: dict[Player, Agent],
     tileset: Literal["random", "default", "new"],
+    seed: Optional[int] = None,
+    session: Optional[Session] = None,
 ) -> dict[Player, int]:
     """
     Play one game on the connected websockets.
 
-    Returns the game score.
-    """
-    # initialize a new game
-    state = new_state(match_score, tileset)
-    state.log("New game!")
-    await broadcast_state_changed(state, players)
-
-    while state.game_result() == GameResult.ONGOING:
-        state.check_consistency()
+    The rules run in a headless `Engine`; this loop forwards the engine's events to
+    the players and asks the agents for each decision.
+    If no `seed` is given, a fresh one is drawn and logged so the game can be reproduced.
 
-        await _play_one_turn(state, players)
-
-        state.next_turn()
+    With a `session`, a player who disconnects while deciding can reconnect and decide
+    on their new websocket, and a game restored into the session from a checkpoint
+    carries on instead of a new one starting.
 
+    Returns the game score.
+    """
+    humans = [player for player, agent in players.items() if isinstance(agent, Human)]
+    if session is not None and session.restored_game is not None:
+        # carry on the game that was running when the server restarted
+        restored, session.restored_game = session.restored_game, None
+        seed = restored.seed
+        print(f"Restored game with {seed=}")
+        start_match_score = restored.match_score.copy()
+        engine = recording.replay(restored)
+        engine.record_events = bool(humans)
+    else:
+        if seed is None:
+            seed = SystemRandom().randrange(2**63)
+        print(f"New game with {seed=}")
+
+        # initialize a new game
+        start_match_score = match_score.copy()
+        rng = Random(seed)
+        engine = Engine(
+            new_state(match_score, tileset, rng),
+            rng,
+            interactive=humans,
+            # only humans are notified of events
+            record_events=bool(humans),
+            timings=timing.GameTimings() if timing.TIMINGS_PATH else None,
+        )
+    engine.keyframe_interval = KEYFRAME_INTERVAL if RECORDINGS_DIR else 0
+    trace.describe(seed=seed, tileset=tileset)
+    state = engine.state
+    if session is not None:
+        session.engine = engine
+        session.seed = seed
+        session.start_match_score = start_match_score
+
+    timings = engine.timings
+    # when the last choice was made
+    decided: Optional[float] = None
+    while True:
+        start = time.perf_counter()
+        events, engine.events = engine.events, []
+        for event in events:
+            await _notify(event, state, players)
+            if session is not None and isinstance(event, Waiting):
+                session.prompts[event.player] = event.prompt
+
+        # Flush any state change the players haven't seen before they're prompted.
+        # Repeated state changes from the same step are only sent once; see
+        # `broadcast_state_changed`.
         await broadcast_state_changed(state, players)
-
-    state.log(f"Game over!  {state.game_result()}!")
-    await broadcast_state_changed(state, players)
-    return state.game_score
+        if session is not None:
+            session.audience.update(state)
+        if timings is not None:
+            timings.add_compute("broadcast", time.perf_counter() - start)
+
+        if engine.pending is None:
+            if RECORDINGS_DIR:
+                game = recording.record(engine, seed, tileset, start_match_score)
+                recording.save(game, RECORDINGS_DIR)
+            if timings is not None:
+                timing.finished(timings)
+            return state.game_score
+
+        deciding = engine.pending.player
+        if session is not None:
+            session.prompts.pop(deciding, None)
+        start = time.perf_counter()
+        if decided is not None:
+            metrics.DECISION_LATENCY.add(start - decided)
+            if session is not None:
+                session.latency.add(start - decided)
+        try:
+            choice = await decide(engine.pending, players)
+        except ConnectionClosed:
+            if session is None or not await session.wait_for(deciding):
+                raise
+            # ask again on the new websocket
+            decided = None
+            continue
+        if timings is not None:
+            timings.add_wait(engine.pending, time.perf_counter() - start)
+        decided = time.perf_counter()
+        with trace.span("step", player=deciding.value, kind=engine.pending.kind.value):
+            engine.step(choice)
 
 
 async def play_one_match(
-    players: dict[Player, Agent], tileset: Literal["random", "default", "new"]
+    players: dict[Player, Agent],
+    tileset: Literal["random", "default", "new"],
+    session: Optional[Session] = None,
 ) -> None:
     """
     Play games forever in a loop, updating the match score and broadcasting each game's score.
+
+    Pass a `session` from `open_session` to play the match in, e.g. one restored from
+    a checkpoint to carry it on; otherwise one is opened.
     """
     print(f"New match with {players}")
-    match_score = {Player.N: 0, Player.S: 0}
+    if session is None:
+        session = open_session(players, tileset)
+    session.task = asyncio.current_task()
+    # matches opened without a room, e.g. in tests, are told apart by their session
+    match_id = session.room_id or f"match-{id(session):x}"
+    metrics.MATCH_LATENCY[match_id] = session.latency
+    match_score = session.match_score
     try:
         while True:
-            game_score = await play_one_game(match_score.copy(), players, tileset)
+            with trace.game():
+                game_score = await play_one_game(
+                    match_score.copy(), players, tileset, session=session
+                )
             for player, points in game_score.items():
                 match_score[player] += points
 
@@ -753,6 +238,10 @@ async def play_one_match(
 
             await broadcast_game_over(players, game_score)
     finally:
+        del metrics.MATCH_LATENCY[match_id]
+        close_session(session)
         for agent in players.values():
             if isinstance(agent, Human):
-                await agent.websocket.close()
+                await outbox.flush(agent.websocket)
+                await agent.websocket.close(*session.close_reason)
+        await session.audience.close(*session.close_reason)
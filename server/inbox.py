@@ -0,0 +1,156 @@
+"""
+Reads each player's websocket in one long-lived task, and routes the messages.
+
+The reader is started with `attach` when the websocket joins a game, and runs until it
+closes or is `detach`ed.
+
+The reader parses each message once as it arrives:
+    - RESYNC asks for a full state snapshot.  Once the player is in a match, it's sent
+      straight away by the inbox's `on_resync`; before that, with the first state.
+    - A choice with the choice id currently being waited on is handed to the waiting
+      coroutine.  Only the first one counts.
+    - Anything else (stale choice ids, clicks while nobody is waiting, junk) is dropped
+      straight away and counted.
+
+The socket is drained even between prompts, so a client spamming clicks can't build up
+a queue: at most one choice is held per websocket, waiting to be picked up.
+"""
+
+import asyncio
+import json
+from typing import Callable, Optional
+from weakref import WeakKeyDictionary
+
+from websockets.exceptions import ConnectionClosed
+from websockets.server import WebSocketServerProtocol
+
+from server import delta, metrics
+
+
+class Inbox:
+    """Routes the messages read from one websocket."""
+
+    def __init__(self, websocket: WebSocketServerProtocol):
+        self.websocket = websocket
+        # the choice id being waited on, and where to deliver it
+        self.choice_id = 0
+        self.choice: Optional[asyncio.Future[dict]] = None
+        # why the reader stopped, once it has
+        self.error: Optional[BaseException] = None
+        # messages thrown away
+        self.dropped = 0
+        # sends the client a full snapshot, once the websocket is seated in a match
+        self.on_resync: Optional[Callable[[], None]] = None
+        self.reader = asyncio.create_task(self.read())
+
+    async def read(self) -> None:
+        try:
+            while True:
+                self.route(await self.websocket.recv())
+        except BaseException as e:
+            # usually ConnectionClosed; pass it on to whoever waits next
+            self.error = e
+            if self.choice is not None and not self.choice.done():
+                self.choice.set_exception(e)
+            if not isinstance(e, ConnectionClosed):
+                raise
+        finally:
+            if self.dropped:
+                print(f"Dropped {self.dropped} stale or invalid messages")
+
+    def route(self, message: str | bytes) -> None:
+        metrics.count("messages_received")
+        try:
+            event = json.loads(message)
+        except ValueError:
+            event = None
+        if not isinstance(event, dict):
+            self.dropped += 1
+            metrics.count("invalid_messages")
+            return
+
+        if event.get("type") == delta.RESYNC:
+            # the client missed a state update and ignores deltas until it gets the full
+            # state, so send it now rather than after the current decision
+            delta.forget(self.websocket)
+            if self.on_resync is not None:
+                self.on_resync()
+            return
+
+        if "data" not in event:
+            self.dropped += 1
+            metrics.count("invalid_messages")
+            return
+        if (
+            self.choice is None
+            or self.choice.done()
+            or event.get("choiceId") != self.choice_id
+        ):
+            self.dropped += 1
+            metrics.count("stale_choices")
+            return
+        self.choice.set_result(event["data"])
+
+    async def get_choice(self, choice_id: int) -> dict:
+        """Wait for the data of the choice with this id."""
+        if self.error is not None:
+            raise self.error
+        self.choice_id = choice_id
+        self.choice = asyncio.get_running_loop().create_future()
+        try:
+            return await self.choice
+        finally:
+            self.choice_id = 0
+            self.choice = None
+
+
+# Weak references so we don't keep old websockets alive.
+INBOXES: WeakKeyDictionary[WebSocketServerProtocol, Inbox] = WeakKeyDictionary()
+
+
+def attach(
+    websocket: WebSocketServerProtocol,
+    on_resync: Optional[Callable[[], None]] = None,
+) -> Inbox:
+    """
+    Start reading the websocket if it isn't being read yet, and return its inbox.
+
+    Call this as soon as the websocket joins a game, so it's drained from then on.
+
+    `on_resync` is called when the client asks for a full snapshot with RESYNC.
+    """
+    inbox = INBOXES.get(websocket)
+    if inbox is None:
+        inbox = INBOXES[websocket] = Inbox(websocket)
+    if on_resync is not None:
+        inbox.on_resync = on_resync
+    return inbox
+
+
+async def get_choice(websocket: WebSocketServerProtocol, choice_id: int) -> dict:
+    """
+    Wait for the data of the choice with this id.
+
+    Raises ConnectionClosed if the websocket closes first, or isn't being read, e.g.
+    because a reconnected player replaced it.
+    """
+    inbox = INBOXES.get(websocket)
+    if inbox is None:
+        raise ConnectionClosed(None, None)
+    return await inbox.get_choice(choice_id)
+
+
+def detach(websocket: WebSocketServerProtocol) -> None:
+    """
+    Stop reading the websocket, e.g. when a reconnected player replaces it.
+
+    A choice waiting on it fails with ConnectionClosed straight away, without waiting
+    for the closing handshake.
+    """
+    inbox = INBOXES.pop(websocket, None)
+    if inbox is None:
+        return
+    inbox.error = ConnectionClosed(None, None)
+    if inbox.choice is not None and not inbox.choice.done():
+        inbox.choice.set_exception(inbox.error)
+    inbox.reader.cancel()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Load-test a running server with simulated solo players.
+
+    python -m server.app &
+    python -m server.loadtest --clients 10 50 100 200 --duration 20 --pid $!
+
+Each client joins a solo game and answers every prompt with a random choice from the
+highlighted options, after an optional think time.  A client that's prompted with
+nothing to choose leaves and joins a new game, so it keeps up the load.  Clients are
+added in steps; after each step the load generator reports, for that step:
+    - how many clients are still connected
+    - p50/p95/p99 latency from sending a choice to receiving the next prompt, leaving
+      out the server's pause between games
+    - frames per second received across all clients
+    - the server's resident memory, if `--pid` is given (Linux only)
+    - the server's event loop lag, measured as the ping round trip on an idle connection
+    - the load generator's own event loop lag; if it's high, the numbers are suspect
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from typing import NamedTuple, Optional
+
+from websockets.client import WebSocketClientProtocol, connect
+from websockets.exceptions import ConnectionClosed
+
+from server.choices import highlighted_choices
+
+# seconds between event loop lag probes
+PROBE_INTERVAL = 0.1
+
+
+class StepResult(NamedTuple):
+    """Measurements for one load step."""
+
+    clients: int
+    # clients connected at the end of the step
+    connected: int
+    # prompts answered during the step
+    choices: int
+    # latency percentiles from choice to next prompt, in milliseconds
+    p50: float
+    p95: float
+    p99: float
+    frames_per_second: float
+    server_rss_mb: Optional[float]
+    # p99 ping round trip to the server, in milliseconds
+    server_lag_p99: float
+    # p99 lateness of our own timer, in milliseconds
+    client_lag_p99: float
+    errors: int
+
+
+class Stats:
+    """Measurements collected by all clients since the last `reset`."""
+
+    def __init__(self) -> None:
+        # clients connected now
+        self.connected = 0
+        self.reset()
+
+    def reset(self) -> None:
+        self.latencies: list[float] = []
+        self.frames = 0
+        self.server_lags: list[float] = []
+        self.client_lags: list[float] = []
+        self.errors = 0
+
+
+async def run_client(
+    url: str, tiles: str, think: float, rng: random.Random, stats: Stats
+) -> None:
+    """
+    Play solo games until cancelled or disconnected, answering prompts like a (fast)
+    human.
+    """
+    rejoin = True
+    try:
+        while rejoin:
+            async with connect(url) as websocket:
+                stats.connected += 1
+                try:
+                    rejoin = await _play(websocket, tiles, think, rng, stats)
+                finally:
+                    stats.connected -= 1
+    except (ConnectionClosed, OSError):
+        stats.errors += 1
+
+
+async def _play(
+    websocket: WebSocketClientProtocol,
+    tiles: str,
+    think: float,
+    rng: random.Random,
+    stats: Stats,
+) -> bool:
+    """
+    Join a solo game and play it until the connection closes.
+
+    Returns True if the client gave up on the game, to join a new one.
+    """
+    join = {"type": "join", "player": "solo", "tiles": tiles}
+    await websocket.send(json.dumps(join))
+    highlights: Optional[dict] = None
+    sent_at: Optional[float] = None
+    async for message in websocket:
+        stats.frames += 1
+        frame = json.loads(message)
+        events = frame["events"] if frame["type"] == "BATCH" else [frame]
+        for event in events:
+            if event["type"] == "HIGHLIGHT_CHANGE":
+                highlights = event
+            elif event["type"] == "MATCH_CHANGE":
+                # the game is over, and the server pauses before the next one
+                sent_at = None
+            elif event["type"] == "PROMPT" and event["choiceId"] > 0:
+                if sent_at is not None:
+                    stats.latencies.append(time.perf_counter() - sent_at)
+                    sent_at = None
+                options = highlighted_choices(highlights) if highlights else []
+                if not options:
+                    # nothing we can answer, so the game would wait on us forever
+                    stats.errors += 1
+                    return True
+                if think:
+                    await asyncio.sleep(rng.uniform(0, think))
+                choice = {
+                    "choiceId": event["choiceId"],
+                    "data": rng.choice(options),
+                }
+                await websocket.send(json.dumps(choice))
+                sent_at = time.perf_counter()
+    return False
+
+
+async def probe_lag(url: str, stats: Stats) -> None:
+    """
+    Measure event loop lag on both sides until cancelled.
+
+    The probe connects without joining, so the server only answers its pings; the round
+    trip is mostly time spent waiting for the server's event loop.
+    """
+    async with connect(url, ping_interval=None) as websocket:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(PROBE_INTERVAL)
+            stats.client_lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+            start = time.perf_counter()
+            pong = await websocket.ping()
+            await pong
+            stats.server_lags.append(time.perf_counter() - start)
+
+
+def _rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _percentile(values: list[float], q: int) -> float:
+    """The q-th percentile of `values` in milliseconds, or NaN if there are none."""
+    if len(values) < 2:
+        return values[0] * 1000 if values else float("nan")
+    return statistics.quantiles(values, n=100)[q - 1] * 1000
+
+
+async def ramp(
+    url: str,
+    steps: list[int],
+    duration: float,
+    tiles: str,
+    think: float,
+    pid: Optional[int],
+    seed: int,
+) -> list[StepResult]:
+    """Add clients up to each step's count, measuring each step for `duration` seconds."""
+    stats = Stats()
+    rng = random.Random(seed)
+    clients: list[asyncio.Task] = []
+    probe = asyncio.create_task(probe_lag(url, stats))
+    results = []
+    try:
+        for count in steps:
+            while len(clients) < count:
+                client_rng = random.Random(rng.getrandbits(64))
+                clients.append(
+                    asyncio.create_task(
+                        run_client(url, tiles, think, client_rng, stats)
+                    )
+                )
+            # let the new clients join before measuring
+            await asyncio.sleep(min(1.0, duration))
+            stats.reset()
+            start = time.perf_counter()
+            await asyncio.sleep(duration)
+            seconds = time.perf_counter() - start
+
+            result = StepResult(
+                clients=count,
+                connected=stats.connected,
+                choices=len(stats.latencies),
+                p50=_percentile(stats.latencies, 50),
+                p95=_percentile(stats.latencies, 95),
+                p99=_percentile(stats.latencies, 99),
+                frames_per_second=stats.frames / seconds,
+                server_rss_mb=_rss_mb(pid) if pid is not None else None,
+                server_lag_p99=_percentile(stats.server_lags, 99),
+                client_lag_p99=_percentile(stats.client_lags, 99),
+                errors=stats.errors,
+            )
+            _print_step(result)
+            results.append(result)
+    finally:
+        for task in clients + [probe]:
+            task.cancel()
+        await asyncio.gather(*clients, probe, return_exceptions=True)
+    return results
+
+
+def _print_step(result: StepResult) -> None:
+    rss = f"{result.server_rss_mb:.0f}MB" if result.server_rss_mb is not None else "n/a"
+    print(
+        f"{result.clients} clients ({result.connected} connected): "
+        f"{result.choices} choices, "
+        f"latency p50 {result.p50:.1f}ms p95 {result.p95:.1f}ms p99 {result.p99:.1f}ms, "
+        f"{result.frames_per_second:.0f} frames/s, server rss {rss}, "
+        f"server lag p99 {result.server_lag_p99:.1f}ms, "
+        f"client lag p99 {result.client_lag_p99:.1f}ms, {result.errors} errors"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="ws://localhost:8001/")
+    parser.add_argument(
+        "--clients",
+        type=int,
+        nargs="+",
+        default=[10, 50, 100, 200],
+        help="number of clients at each step",
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per step")
+    parser.add_argument(
+        "--tiles", choices=["random", "default", "new"], default="random"
+    )
+    parser.add_argument(
+        "--think",
+        type=float,
+        default=0.0,
+        help="max seconds each client waits to answer",
+    )
+    parser.add_argument(
+        "--pid", type=int, help="server process id, to report its memory"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", help="write per-step results as JSON lines")
+    args = parser.parse_args()
+
+    results = asyncio.run(
+        ramp(
+            args.url,
+            args.clients,
+            args.duration,
+            args.tiles,
+            args.think,
+            args.pid,
+            args.seed,
+        )
+    )
+    if args.results:
+        with open(args.results, "w") as f:
+            for result in results:
+                f.write(json.dumps(result._asdict()) + "\n")
+
+
+if __name__ == "__main__":
+    main()
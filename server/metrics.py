@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Counters and gauges describing the running server, for graphing e.g. during load tests.
+
+Set `METRICS_PORT` to serve them as JSON over plain HTTP on that port, on localhost only:
+
+    METRICS_PORT=9100 python -m server.app &
+    python -m server.metrics --url http://localhost:9100/metrics > metrics.jsonl
+
+Run as a script, this module is the scraper: it polls the URL and writes one snapshot
+per line, with a timestamp.
+
+Counters only ever go up, so a scraper takes the difference between two snapshots for a
+rate.  Gauges are read when scraped, from functions registered with `gauge`.
+Histograms are power-of-two microsecond buckets (see `timing.Histogram`), also
+cumulative:
+    - loop_lag: how late the event loop wakes up a task that sleeps `LAG_INTERVAL`
+    - decision_latency: server time from one choice being made to the next prompt
+    - match_latency: the same, for each running match by its room id, so one slow
+      match stands out from the load on the whole server
+With `TIMINGS_PATH` set, the snapshot also has the per-phase turn timings of recent
+games; see `server.timing`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import urllib.request
+from collections import Counter
+from typing import Any, Callable, Optional
+
+from server import timing
+from server.timing import Histogram
+
+# serve metrics on this port, if set
+METRICS_PORT = os.environ.get("METRICS_PORT")
+
+# seconds between event loop lag samples
+LAG_INTERVAL = 0.1
+
+COUNTERS: Counter[str] = Counter(
+    dict.fromkeys(
+        [
+            "messages_received",
+            # not a JSON choice or RESYNC
+            "invalid_messages",
+            # choices for an old prompt, or sent when nobody's waiting
+            "stale_choices",
+            # choices for the current prompt that aren't one of the options
+            "invalid_choices",
+            "frames_sent",
+            "events_sent",
+            "bytes_sent",
+        ],
+        0,
+    )
+)
+
+GAUGES: dict[str, Callable[[], float]] = {}
+
+LOOP_LAG = Histogram()
+
+DECISION_LATENCY = Histogram()
+
+# the decision latency of each running match, by room id; see `game.play_one_match`
+MATCH_LATENCY: dict[str, Histogram] = {}
+
+# the metrics server and the lag sampler task, once started
+RUNNING: list[Any] = []
+
+
+def count(name: str, n: int = 1) -> None:
+    COUNTERS[name] += n
+
+
+def gauge(name: str, read: Callable[[], float]) -> None:
+    """Report `read()` as the gauge `name` in every snapshot."""
+    GAUGES[name] = read
+
+
+def snapshot() -> dict[str, Any]:
+    return {
+        "time": time.time(),
+        "counters": dict(COUNTERS),
+        "gauges": {name: read() for name, read in GAUGES.items()},
+        "loop_lag": LOOP_LAG.to_json(),
+        "decision_latency": DECISION_LATENCY.to_json(),
+        "match_latency": {
+            match: latency.to_json() for match, latency in MATCH_LATENCY.items()
+        },
+        "turn_timings": timing.summary() if timing.TIMINGS_PATH else None,
+    }
+
+
+async def watch_loop_lag() -> None:
+    """Sample the event loop's lag into `LOOP_LAG` until cancelled."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        LOOP_LAG.add(max(time.perf_counter() - start - LAG_INTERVAL, 0))
+
+
+async def start(port: int) -> None:
+    """Serve `snapshot()` as JSON at /metrics on localhost, and start sampling lag."""
+    RUNNING.append(await asyncio.start_server(_handle, "127.0.0.1", port))
+    RUNNING.append(asyncio.create_task(watch_loop_lag()))
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request = await reader.readline()
+        # skip the headers
+        while (await reader.readline()).strip():
+            pass
+        parts = request.split()
+        if len(parts) >= 2 and parts[0] == b"GET" and parts[1] == b"/metrics":
+            status, body = "200 OK", json.dumps(snapshot()).encode()
+        else:
+            status, body = "404 Not Found", b""
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def scrape(url: str, interval: float, samples: Optional[int]) -> None:
+    """Print a snapshot from `url` as a JSON line every `interval` seconds."""
+    taken = 0
+    while samples is None or taken < samples:
+        start = time.monotonic()
+        try:
+            with urllib.request.urlopen(url, timeout=10) as response:
+                print(response.read().decode(), flush=True)
+        except OSError as e:
+            print(f"Failed to scrape {url}: {e}", file=sys.stderr)
+        taken += 1
+        time.sleep(max(interval - (time.monotonic() - start), 0))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Scrape a server's metrics.")
+    parser.add_argument("--url", default="http://localhost:9100/metrics")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds")
+    parser.add_argument("--samples", type=int, help="stop after this many")
+    args = parser.parse_args()
+    try:
+        scrape(args.url, args.interval, args.samples)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,3 @@
-import asyncio
 import json
 from typing import Optional
 
@@ -6,20 +5,79 @@ from websockets.server import WebSocketServerProtocol
 
 from server.state import State
 from server.constants import Player, Square, Action, OutEventType, other_player
-from server.agents import Agent
+from server.agents import Agent, Human
+from server.delta import (
+    FragmentCache,
+    View,
+    forget,
+    is_current,
+    merge,
+    state_change_message,
+)
+from server import outbox, trace
+
+
+def humans(players: dict[Player, Agent]) -> dict[Player, Human]:
+    """
+    The players who need notifications.
+
+    Bots get everything they need from their choice arguments, so we skip building
+    and encoding messages for them.
+    """
+    return {
+        player: agent for player, agent in players.items() if isinstance(agent, Human)
+    }
 
 
 async def broadcast_state_changed(state: State, players: dict[Player, Agent]) -> None:
-    """Notify both players that the state changed."""
-    async with asyncio.TaskGroup() as tg:
-        for player, agent in players.items():
-            event = {
-                "type": OutEventType.STATE_CHANGE.value,
-                "playerView": state.player_view(player).dict(),
-            }
-            message = json.dumps(event)
-            coroutine = agent.websocket.send(message)
-            tg.create_task(coroutine)
+    """
+    Notify both players that the state changed.
+
+    Only the changes since the last view sent to each player are sent; see `server.delta`.
+    Players who were already sent this version of the state, or whose view didn't change,
+    are skipped, so this is cheap to call whenever the state may have changed.
+    The public part of the view is built and encoded once for both players.
+    """
+    listeners = {
+        player: agent
+        for player, agent in humans(players).items()
+        if not is_current(agent.websocket, state.version)
+    }
+    if not listeners:
+        return
+
+    with trace.span("broadcast", players=len(listeners)):
+        public = state.public_view()
+        cache: FragmentCache = {}
+        for player, agent in listeners.items():
+            _send_view(state, player, public, agent.websocket, cache)
+
+
+def send_snapshot(
+    state: State, player: Player, websocket: WebSocketServerProtocol
+) -> None:
+    """
+    Send the player a full snapshot of the state straight away, e.g. when their client
+    asks for one with RESYNC.
+    """
+    forget(websocket)
+    _send_view(state, player, state.public_view(), websocket, {})
+
+
+def _send_view(
+    state: State,
+    player: Player,
+    public: View,
+    websocket: WebSocketServerProtocol,
+    cache: FragmentCache,
+) -> None:
+    private = state.private_view(player)
+    message = state_change_message(state.version, public, private, websocket, cache)
+    if message is not None:
+        # a queued state message that wasn't sent yet is folded into this one
+        outbox.send(
+            websocket, message, key=OutEventType.STATE_CHANGE.value, merge=merge
+        )
 
 
 async def clear_selection(players: dict[Player, Agent]) -> None:
@@ -39,12 +97,14 @@ async def broadcast_selection_changed(
     """
     Notify both players a selection changed.  See `notify_selection_changed` for details.
     """
-    async with asyncio.TaskGroup() as tg:
-        for agent in players.values():
-            coroutine = notify_selection_changed(
-                selecting_player, start, action, target, agent.websocket
-            )
-            tg.create_task(coroutine)
+    listeners = humans(players)
+    if not listeners:
+        return
+
+    # both players see the same selection, so encode it once
+    message = _selection_changed_message(selecting_player, start, action, target)
+    for agent in listeners.values():
+        outbox.send(agent.websocket, message, key=OutEventType.SELECTION_CHANGE.value)
 
 
 async def notify_selection_changed(
@@ -66,6 +126,16 @@ async def notify_selection_changed(
     The game removes the selection from both players after the action is resolved
     by calling this with all None.
     """
+    message = _selection_changed_message(selecting_player, start, action, target)
+    outbox.send(websocket, message, key=OutEventType.SELECTION_CHANGE.value)
+
+
+def _selection_changed_message(
+    selecting_player: Optional[Player],
+    start: Optional[Square],
+    action: Optional[Action],
+    target: Optional[Square],
+) -> str:
     event = {
         "type": OutEventType.SELECTION_CHANGE.value,
         "player": selecting_player,
@@ -73,28 +143,24 @@ async def notify_selection_changed(
         "action": action,
         "target": target,
     }
-    message = json.dumps(event)
-    await websocket.send(message)
+    return json.dumps(event)
 
 
 async def broadcast_game_over(
     players: dict[Player, Agent],
     game_score: dict[Player, int],
 ) -> None:
-    async with asyncio.TaskGroup() as tg:
-        for player, agent in players.items():
-            us = game_score[player]
-            them = game_score[other_player(player)]
-            if us > them:
-                msg = f"🎉🎉🎉 You won {us} to {them}. Nice! Try to win again!"
-            elif us == them:
-                msg = f"Tie! {us} - {them}. Wow, it finally happened! Cool!"
-            else:
-                msg = f"You lose {us} to {them}... but this game is mostly luck, so try again!"
-            event = {
-                "type": OutEventType.MATCH_CHANGE.value,
-                "message": msg,
-            }
-            message = json.dumps(event)
-            coroutine = agent.websocket.send(message)
-            tg.create_task(coroutine)
+    for player, agent in humans(players).items():
+        us = game_score[player]
+        them = game_score[other_player(player)]
+        if us > them:
+            msg = f"🎉🎉🎉 You won {us} to {them}. Nice! Try to win again!"
+        elif us == them:
+            msg = f"Tie! {us} - {them}. Wow, it finally happened! Cool!"
+        else:
+            msg = f"You lose {us} to {them}... but this game is mostly luck, so try again!"
+        event = {
+            "type": OutEventType.MATCH_CHANGE.value,
+            "message": msg,
+        }
+        outbox.send(agent.websocket, json.dumps(event))
@@ -0,0 +1,137 @@
+"""
+Batches the events sent to each websocket into one frame per decision point.
+
+The game queues events with `send` without waiting.  A sender task per websocket sends
+everything queued as soon as the game yields to the event loop, which it does when it
+blocks waiting on a player.  So all the UI updates leading up to a prompt (state,
+selection, highlights, the prompt itself) arrive together in one BATCH frame:
+
+    {"type": "BATCH", "events": [...]}
+
+A single queued event is sent as is.  See `dispatchEvents` in docs/main.js.
+
+Events queued while a frame is still being sent go out together in the next frame,
+so a slow client never holds up the game.  To keep the queue small, an event can name
+a `key`: it replaces the queued event with the same key, if any, since the client
+would only overwrite it.  A client that falls too far behind anyway is disconnected.
+"""
+
+import asyncio
+from typing import Callable, Optional
+from weakref import WeakKeyDictionary
+
+from websockets.exceptions import ConnectionClosed
+from websockets.server import WebSocketServerProtocol
+
+from server import metrics
+
+# disconnect a client whose queue grows past either limit
+MAX_QUEUED_BYTES = 2**20
+MAX_QUEUED_EVENTS = 1000
+
+# disconnect a client that doesn't take a frame within this many seconds
+SEND_TIMEOUT = 30.0
+
+# close code and reason for clients that fall behind
+SLOW_CLIENT_CODE = 1008
+SLOW_CLIENT_REASON = "Too far behind"
+
+# combines a queued event with the event replacing it
+Merge = Callable[[str, str], str]
+
+
+class Outbox:
+    """Encoded events waiting to be sent on one websocket."""
+
+    def __init__(self, websocket: WebSocketServerProtocol):
+        self.websocket = websocket
+        # (key, encoded event) in the order they're sent; each key appears at most once
+        self.events: list[tuple[Optional[str], str]] = []
+        self.size = 0
+        self.sender: Optional[asyncio.Task] = None
+        self.closing: Optional[asyncio.Task] = None
+
+    def put(
+        self, message: str, key: Optional[str] = None, merge: Optional[Merge] = None
+    ) -> None:
+        if self.closing is not None or not self.websocket.open:
+            # nobody to send to
+            return
+
+        if key is not None:
+            for i, (queued_key, queued) in enumerate(self.events):
+                if queued_key == key:
+                    del self.events[i]
+                    self.size -= len(queued)
+                    if merge is not None:
+                        message = merge(queued, message)
+                    break
+        self.events.append((key, message))
+        self.size += len(message)
+
+        if self.size > MAX_QUEUED_BYTES or len(self.events) > MAX_QUEUED_EVENTS:
+            self.disconnect()
+        elif self.sender is None:
+            self.sender = asyncio.create_task(self.send_all())
+
+    async def send_all(self) -> None:
+        """Send everything queued, including anything queued while sending."""
+        try:
+            while self.events:
+                events = [message for _, message in self.events]
+                self.events, self.size = [], 0
+                if len(events) == 1:
+                    frame = events[0]
+                else:
+                    frame = f'{{"type": "BATCH", "events": [{", ".join(events)}]}}'
+                await asyncio.wait_for(self.websocket.send(frame), SEND_TIMEOUT)
+                metrics.count("frames_sent")
+                metrics.count("events_sent", len(events))
+                metrics.count("bytes_sent", len(frame))
+        except ConnectionClosed:
+            # the game notices when it next waits on this player
+            self.events, self.size = [], 0
+        except asyncio.TimeoutError:
+            self.disconnect()
+        finally:
+            self.sender = None
+
+    def disconnect(self) -> None:
+        """Drop the queue and close the connection."""
+        print(f"Disconnecting slow client: {self.size} bytes queued")
+        self.events, self.size = [], 0
+        if self.sender is not None and self.sender is not asyncio.current_task():
+            self.sender.cancel()
+        self.closing = asyncio.create_task(
+            self.websocket.close(SLOW_CLIENT_CODE, SLOW_CLIENT_REASON)
+        )
+
+
+# Weak references so we don't keep old websockets alive.
+OUTBOXES: WeakKeyDictionary[WebSocketServerProtocol, Outbox] = WeakKeyDictionary()
+
+
+def send(
+    websocket: WebSocketServerProtocol,
+    message: str,
+    key: Optional[str] = None,
+    merge: Optional[Merge] = None,
+) -> None:
+    """
+    Queue an encoded event for the websocket's next frame.
+
+    If an event with the same `key` is still queued, it's removed, and this event is
+    queued in its place at the back.  `merge(queued, message)` gives the event to queue
+    instead, if the queued one can't simply be dropped.
+    """
+    outbox = OUTBOXES.get(websocket)
+    if outbox is None:
+        outbox = OUTBOXES[websocket] = Outbox(websocket)
+    outbox.put(message, key, merge)
+
+
+async def flush(websocket: WebSocketServerProtocol) -> None:
+    """Wait until anything queued for the websocket is sent, e.g. before closing it."""
+    outbox = OUTBOXES.get(websocket)
+    if outbox is not None and outbox.sender is not None:
+        await asyncio.wait([outbox.sender])
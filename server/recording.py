@@ -0,0 +1,201 @@
+"""
+Compact game recordings, and a replayer that re-simulates them.
+
+A game is fully determined by its seed, its config, and the choices made at each decision,
+so that's all a recording needs.  Each choice is stored as one byte: its index in
+`Engine.legal_decisions()`.  A typical game encodes to a few hundred bytes.
+
+Recordings may also embed keyframes: zlib-compressed copies of the state every K turns.
+Seeking to a turn then resumes from the nearest keyframe instead of replaying from the start.
+
+    recording = record(engine, seed, tileset, start_match_score)
+    data = recording.encode()
+    ...
+    engine = replay(Recording.decode(data), turn=10)
+"""
+
+import os
+import struct
+import zlib
+from random import Random
+from typing import Literal, NamedTuple, Optional
+
+from server.constants import Player
+from server.engine import Engine, Keyframe
+from server.state import new_state, State
+
+Tileset = Literal["random", "default", "new"]
+TILESETS: list[Tileset] = ["random", "default", "new"]
+
+# bump when the encoding or the meaning of a decision index changes
+FORMAT_VERSION = 2
+
+# version, tileset, interactive players, seed, north match score, south match score,
+# number of decisions, number of keyframes
+_HEADER = struct.Struct("<BBBQHHIH")
+
+# turn, decision, seed, length of the compressed state that follows
+_KEYFRAME_HEADER = struct.Struct("<HIQI")
+
+# interactive players are stored as a bitmask
+_PLAYER_BITS = {Player.N: 1, Player.S: 2}
+
+
+class Recording(NamedTuple):
+    """Everything needed to re-simulate one game."""
+
+    seed: int
+    tileset: Tileset
+    # the match score when the game started
+    match_score: dict[Player, int]
+    # players who chose through the interactive selection loop; see `Engine`
+    interactive: frozenset[Player]
+    # index of each choice in the legal decisions at that point
+    decisions: list[int]
+    keyframes: list[Keyframe] = []
+
+    def encode(self) -> bytes:
+        interactive = sum(_PLAYER_BITS[player] for player in self.interactive)
+        header = _HEADER.pack(
+            FORMAT_VERSION,
+            TILESETS.index(self.tileset),
+            interactive,
+            self.seed,
+            self.match_score[Player.N],
+            self.match_score[Player.S],
+            len(self.decisions),
+            len(self.keyframes),
+        )
+        parts = [header, bytes(self.decisions)]
+        for keyframe in self.keyframes:
+            state = _encode_state(keyframe.state)
+            parts.append(
+                _KEYFRAME_HEADER.pack(
+                    keyframe.turn, keyframe.decision, keyframe.seed, len(state)
+                )
+            )
+            parts.append(state)
+        return b"".join(parts)
+
+    @staticmethod
+    def decode(data: bytes) -> "Recording":
+        version = data[0]
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported recording version {version}")
+        (
+            _,
+            tileset,
+            interactive,
+            seed,
+            north,
+            south,
+            num_decisions,
+            num_keyframes,
+        ) = _HEADER.unpack_from(data)
+
+        offset = _HEADER.size
+        decisions = list(data[offset : offset + num_decisions])
+        offset += num_decisions
+
+        keyframes = []
+        for _ in range(num_keyframes):
+            turn, decision, keyframe_seed, size = _KEYFRAME_HEADER.unpack_from(
+                data, offset
+            )
+            offset += _KEYFRAME_HEADER.size
+            state = _decode_state(data[offset : offset + size])
+            offset += size
+            keyframes.append(Keyframe(turn, decision, keyframe_seed, state))
+
+        return Recording(
+            seed=seed,
+            tileset=TILESETS[tileset],
+            match_score={Player.N: north, Player.S: south},
+            interactive=frozenset(
+                player for player, bit in _PLAYER_BITS.items() if interactive & bit
+            ),
+            decisions=decisions,
+            keyframes=keyframes,
+        )
+
+
+def _encode_state(state: State) -> bytes:
+    return zlib.compress(state.model_dump_json().encode(), 9)
+
+
+def _decode_state(data: bytes) -> State:
+    return State.model_validate_json(zlib.decompress(data))
+
+
+def record(
+    engine: Engine,
+    seed: int,
+    tileset: Tileset,
+    match_score: dict[Player, int],
+) -> Recording:
+    """
+    Record the decisions made so far in `engine`.
+
+    `seed`, `tileset` and `match_score` are the arguments the game was started with;
+    the state's match score changes during the game, so pass a copy from the start.
+    """
+    return Recording(
+        seed=seed,
+        tileset=tileset,
+        match_score=match_score.copy(),
+        interactive=engine.interactive,
+        decisions=engine.decisions.copy(),
+        keyframes=engine.keyframes.copy(),
+    )
+
+
+def new_engine(recording: Recording, turn: Optional[int] = 0) -> Engine:
+    """
+    Start the recorded game from the latest keyframe at or before `turn`
+    (or the latest keyframe if `turn` is None), or from the beginning if there isn't one.
+    """
+    keyframes = [
+        keyframe
+        for keyframe in recording.keyframes
+        if turn is None or keyframe.turn <= turn
+    ]
+    if keyframes:
+        keyframe = keyframes[-1]
+        return Engine.resume(
+            keyframe,
+            recording.decisions[: keyframe.decision],
+            interactive=recording.interactive,
+            record_events=False,
+        )
+
+    rng = Random(recording.seed)
+    state = new_state(recording.match_score.copy(), recording.tileset, rng)
+    return Engine(state, rng, interactive=recording.interactive, record_events=False)
+
+
+def replay(recording: Recording, turn: Optional[int] = None) -> Engine:
+    """
+    Re-simulate the recorded game.
+
+    Stops at the first decision after `turn` turns have been played,
+    or after the last recorded decision if `turn` is None or past the end.
+    """
+    engine = new_engine(recording, turn)
+    for index in recording.decisions[len(engine.decisions) :]:
+        if turn is not None and engine.turns >= turn:
+            break
+        engine.step(engine.legal_decisions()[index])
+    return engine
+
+
+def save(recording: Recording, directory: str) -> str:
+    """Write the recording to `directory`, named by its seed.  Returns the path."""
+    path = os.path.join(directory, f"{recording.seed}.arena")
+    with open(path, "wb") as f:
+        f.write(recording.encode())
+    return path
+
+
+def load(path: str) -> Recording:
+    with open(path, "rb") as f:
+        return Recording.decode(f.read())
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Play many bot-vs-bot games in parallel, without websockets or an event loop.
+
+    python -m server.selfplay --games 10000 --north RandomBot --south RandomBot
+
+Games are spread over a process pool.  Each game's seed is derived from `--seed` and its
+index, so different `--seed`s give independent batches, and any single game can be
+replayed with its seed.  Per-game results stream to
+`--results` as JSON lines, and a summary is printed at the end.
+"""
+
+import argparse
+import json
+import multiprocessing
+from random import Random
+import sys
+import time
+from collections import Counter
+from typing import Any, Coroutine, Iterator, NamedTuple, Optional, TypeVar
+
+from server import agents, recording
+from server.agents import Agent, Human
+from server.constants import GameResult, Player
+from server.engine import Engine
+from server.game import decide
+from server.recording import TILESETS, Tileset
+from server.state import new_state
+
+# stop games that haven't finished after this many turns and count them as unfinished
+DEFAULT_MAX_TURNS = 1000
+
+T = TypeVar("T")
+
+
+class GameSummary(NamedTuple):
+    """The result of one self-play game."""
+
+    seed: int
+    tileset: Tileset
+    # a GameResult value; ONGOING if the game hit the turn limit
+    result: str
+    turns: int
+    game_score: dict[Player, int]
+    smite_cost: int
+    bonus_amount: int
+    bonus_reveal: int
+    seconds: float
+
+
+class GameSpec(NamedTuple):
+    """Everything a worker needs to play one game."""
+
+    seed: int
+    tileset: Tileset
+    north: str
+    south: str
+    max_turns: int
+    # save a recording of the game here, if set
+    recordings_dir: Optional[str] = None
+    # turns between keyframes in the recording; 0 for none
+    keyframe_interval: int = 0
+
+
+def _run_sync(coroutine: Coroutine[Any, Any, T]) -> T:
+    """
+    Run a coroutine that never suspends to completion.
+
+    Bots answer immediately, so their async choices can be driven without an event loop.
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coroutine.close()
+    raise RuntimeError("self-play agents must not wait on anything")
+
+
+def _make_agent(name: str, rng: Random) -> Agent:
+    agent_class = getattr(agents, name, None)
+    if agent_class is None or agent_class is Human:
+        raise ValueError(f"Unknown bot {name}")
+    return agent_class(rng)
+
+
+def game_seed(batch_seed: int, index: int) -> int:
+    """The seed of a batch's `index`th game, independent of every other batch's."""
+    return Random(f"{batch_seed}-{index}").getrandbits(64)
+
+
+def play_game(spec: GameSpec) -> GameSummary:
+    """Play one game between two bots."""
+    start_time = time.perf_counter()
+    # the game and each bot draw from their own generator, all derived from the seed
+    rng = Random(spec.seed)
+    players = {
+        Player.N: _make_agent(spec.north, Random(f"{spec.seed}-{Player.N}")),
+        Player.S: _make_agent(spec.south, Random(f"{spec.seed}-{Player.S}")),
+    }
+    match_score = {Player.N: 0, Player.S: 0}
+    state = new_state(match_score.copy(), spec.tileset, rng)
+    engine = Engine(
+        state, rng, record_events=False, keyframe_interval=spec.keyframe_interval
+    )
+
+    while engine.pending is not None and engine.turns < spec.max_turns:
+        engine.step(_run_sync(decide(engine.pending, players)))
+
+    if spec.recordings_dir:
+        game = recording.record(engine, spec.seed, spec.tileset, match_score)
+        recording.save(game, spec.recordings_dir)
+
+    return GameSummary(
+        seed=spec.seed,
+        tileset=spec.tileset,
+        result=state.game_result().value,
+        turns=engine.turns,
+        game_score=state.game_score,
+        smite_cost=state.smite_cost,
+        bonus_amount=state.bonus_amount,
+        bonus_reveal=state.bonus_reveal,
+        seconds=time.perf_counter() - start_time,
+    )
+
+
+def play_games(
+    specs: list[GameSpec], workers: int, chunksize: int = 16
+) -> Iterator[GameSummary]:
+    """Play games across a process pool, yielding results as they finish."""
+    if workers <= 1:
+        yield from map(play_game, specs)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap_unordered(play_game, specs, chunksize=chunksize)
+
+
+def _print_summary(results: list[GameSummary], seconds: float) -> None:
+    games = len(results)
+    outcomes = Counter(r.result for r in results)
+    turns = sorted(r.turns for r in results)
+    print(f"{games} games in {seconds:.2f}s: {games / seconds:.1f} games/s")
+    for outcome in GameResult:
+        print(
+            f"  {outcome.value}: {outcomes[outcome.value]} ({outcomes[outcome.value] / games:.1%})"
+        )
+    print(
+        f"  turns: mean {sum(turns) / games:.1f}, median {turns[games // 2]}, max {turns[-1]}"
+    )
+    for tileset in TILESETS:
+        by_tileset = [r for r in results if r.tileset == tileset]
+        if not by_tileset:
+            continue
+        south_wins = sum(r.result == GameResult.SOUTH_WINS.value for r in by_tileset)
+        print(
+            f"  {tileset}: {len(by_tileset)} games, south wins {south_wins / len(by_tileset):.1%}, "
+            f"mean turns {sum(r.turns for r in by_tileset) / len(by_tileset):.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument(
+        "--north", default="RandomBot", help="bot class in server.agents"
+    )
+    parser.add_argument(
+        "--south", default="RandomBot", help="bot class in server.agents"
+    )
+    parser.add_argument("--tileset", choices=TILESETS + ["mixed"], default="mixed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS)
+    parser.add_argument("--results", help="write per-game results as JSON lines")
+    parser.add_argument("--recordings", help="save a recording of each game here")
+    parser.add_argument(
+        "--keyframe-interval",
+        type=int,
+        default=0,
+        help="embed a keyframe in recordings every this many turns",
+    )
+    args = parser.parse_args()
+
+    specs = [
+        GameSpec(
+            seed=game_seed(args.seed, i),
+            tileset=(
+                TILESETS[i % len(TILESETS)] if args.tileset == "mixed" else args.tileset
+            ),
+            north=args.north,
+            south=args.south,
+            max_turns=args.max_turns,
+            recordings_dir=args.recordings,
+            keyframe_interval=args.keyframe_interval if args.recordings else 0,
+        )
+        for i in range(args.games)
+    ]
+    # fail fast on a bad agent name rather than in every worker
+    _make_agent(args.north, Random())
+    _make_agent(args.south, Random())
+
+    out = open(args.results, "w") if args.results else None
+    results = []
+    start_time = time.perf_counter()
+    try:
+        for summary in play_games(specs, args.workers):
+            results.append(summary)
+            if out:
+                out.write(json.dumps(summary._asdict()) + "\n")
+    finally:
+        if out:
+            out.close()
+
+    if not results:
+        print("No games played.", file=sys.stderr)
+        return
+    _print_summary(results, time.perf_counter() - start_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Lets players reconnect to a running match after their websocket drops.
+
+Each human in a match is sent a resume token in a SESSION event, with the id of the
+room spectators can watch the match in.  A client that
+reconnects sends the token back in its join event, and `resume` seats the new websocket
+in place of the old one.  The player is sent a full snapshot of the state and their
+current prompt; if the game was waiting on their choice, the choice is asked again on
+the new websocket.
+
+The game waits up to `RECONNECT_TIMEOUT` seconds for a disconnected player to come
+back before ending the match.
+
+When the server shuts down, `checkpoint` saves every running match to a file, with its
+current game as a `Recording`, and closes the players' websockets with
+`SERVICE_RESTART`, which tells clients to reconnect.  `restore` loads the matches
+again on startup, replaying each game up to its pending decision, so the players carry
+on where they left off when they reconnect with their tokens.
+"""
+
+import asyncio
+import base64
+import json
+import os
+import secrets
+from functools import partial
+from typing import Any, Literal, Optional
+
+from websockets.exceptions import ConnectionClosed
+from websockets.server import WebSocketServerProtocol
+
+from server import agents, inbox, outbox, recording
+from server.agents import Agent, DummyWebsocket, Human
+from server.choices import send_prompt
+from server.constants import OutEventType, Player
+from server.engine import Engine
+from server.notify import broadcast_state_changed, humans, send_snapshot
+from server.recording import Recording
+from server.spectate import Audience
+from server.timing import Histogram
+
+RECONNECT_TIMEOUT = 60.0
+
+# close code asking clients to reconnect once the server is back
+SERVICE_RESTART = 1012
+
+
+class Disconnected(DummyWebsocket):
+    """Stands in for a restored player's websocket until they reconnect."""
+
+    open = False
+
+    async def recv(self) -> str:
+        raise ConnectionClosed(None, None)
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        pass
+
+
+class Session:
+    """A running match that its human players can reconnect to."""
+
+    def __init__(
+        self,
+        players: dict[Player, Agent],
+        tileset: Literal["random", "default", "new"],
+        tokens: Optional[dict[Player, str]] = None,
+        room_id: Optional[str] = None,
+    ):
+        self.players = players
+        self.tileset = tileset
+        # the room spectators find the match in: its PVP room, or one generated for a
+        # solo match
+        self.room_id = room_id
+        # resume token for each human's seat
+        self.tokens = tokens or {
+            player: secrets.token_urlsafe(16) for player in humans(players).keys()
+        }
+        self.match_score = {Player.N: 0, Player.S: 0}
+        # the current game once it has started, with its seed and starting match score
+        self.engine: Optional[Engine] = None
+        self.seed = 0
+        self.start_match_score = self.match_score.copy()
+        # a game to carry on instead of starting a new one; see `restore`
+        self.restored_game: Optional[Recording] = None
+        # the last prompt each player was shown while the other player was deciding
+        self.prompts: dict[Player, str] = {}
+        # set when a player reconnects
+        self.reconnected = {player: asyncio.Event() for player in self.tokens}
+        # spectators of the match
+        self.audience = Audience()
+        # the task playing the match
+        self.task: Optional[asyncio.Task] = None
+        # server time from each choice to the next prompt; see `metrics.MATCH_LATENCY`
+        self.latency = Histogram()
+        # code and reason for closing the players' websockets when the match ends
+        self.close_reason: tuple[int, str] = (1000, "")
+        for player, agent in humans(players).items():
+            inbox.attach(agent.websocket, partial(self.resync, player))
+
+    async def resume(self, player: Player, websocket: WebSocketServerProtocol) -> None:
+        """Put the new websocket in the player's seat, and bring it up to date."""
+        agent = humans(self.players)[player]
+        old_websocket, agent.websocket = agent.websocket, websocket
+        # a choice pending on the old websocket is asked again on the new one
+        inbox.detach(old_websocket)
+        inbox.attach(websocket, partial(self.resync, player))
+
+        outbox.send(websocket, self._session_message(player))
+        if self.engine is not None:
+            # nothing was sent on this websocket yet, so this is a full snapshot
+            await broadcast_state_changed(self.engine.state, {player: agent})
+        prompt = self.prompts.get(player)
+        if prompt is not None:
+            await send_prompt(prompt, websocket)
+        self.reconnected[player].set()
+
+        await old_websocket.close()
+
+    def resync(self, player: Player) -> None:
+        """Send the player a full snapshot, when their client asks for one."""
+        if self.engine is not None:
+            websocket = humans(self.players)[player].websocket
+            send_snapshot(self.engine.state, player, websocket)
+
+    async def wait_for(self, player: Player) -> bool:
+        """
+        Wait for a disconnected player to reconnect.
+
+        Returns False if they don't within `RECONNECT_TIMEOUT`, or aren't human.
+        """
+        agent = self.players[player]
+        if not isinstance(agent, Human):
+            return False
+        if agent.websocket.open:
+            # already reconnected
+            return True
+        reconnected = self.reconnected[player]
+        reconnected.clear()
+        print(f"Waiting for {player} to reconnect")
+        try:
+            await asyncio.wait_for(reconnected.wait(), RECONNECT_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def _session_message(self, player: Player) -> str:
+        event = {
+            "type": OutEventType.SESSION.value,
+            "token": self.tokens[player],
+            "room": self.room_id,
+        }
+        return json.dumps(event)
+
+
+# running sessions by resume token
+SESSIONS: dict[str, tuple[Session, Player]] = {}
+
+
+def open_session(
+    players: dict[Player, Agent],
+    tileset: Literal["random", "default", "new"],
+    room_id: Optional[str] = None,
+) -> Session:
+    """Start accepting reconnections to the match, and send each human their token."""
+    session = Session(players, tileset, room_id=room_id)
+    for player, token in session.tokens.items():
+        SESSIONS[token] = (session, player)
+        outbox.send(players[player].websocket, session._session_message(player))
+    return session
+
+
+def close_session(session: Session) -> None:
+    for token in session.tokens.values():
+        SESSIONS.pop(token, None)
+
+
+async def resume(token: str, websocket: WebSocketServerProtocol) -> bool:
+    """
+    Seat the websocket in the running match the token was issued for.
+
+    Returns False if there's no such match, e.g. because it has ended.
+    """
+    seat = SESSIONS.get(token)
+    if seat is None:
+        return False
+    session, player = seat
+    print(f"{player} reconnected")
+    await session.resume(player, websocket)
+    return True
+
+
+def checkpoint(path: str) -> int:
+    """
+    Save every running match to `path`, then stop them, closing the players'
+    websockets with `SERVICE_RESTART`.
+
+    Returns the number of matches saved.
+    """
+    sessions = list({id(session): session for session, _ in SESSIONS.values()}.values())
+    matches = [_encode_session(session) for session in sessions]
+
+    # write and rename so a crash mid-write can't leave a truncated checkpoint
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(matches, f)
+    os.replace(f"{path}.tmp", path)
+
+    for session in sessions:
+        session.close_reason = (SERVICE_RESTART, "Server restarting")
+        if session.task is not None:
+            session.task.cancel()
+    return len(matches)
+
+
+def restore(path: str) -> list[Session]:
+    """
+    Load the matches saved by `checkpoint`, and accept reconnections to them.
+
+    The checkpoint is deleted so the matches are only restored once.
+    Start each match with `play_one_match(session.players, session.tileset, session)`,
+    in its `room_id`.
+    """
+    with open(path) as f:
+        matches = json.load(f)
+    os.remove(path)
+
+    sessions = [_decode_session(match) for match in matches]
+    for session in sessions:
+        for player, token in session.tokens.items():
+            SESSIONS[token] = (session, player)
+    return sessions
+
+
+def _encode_session(session: Session) -> dict[str, Any]:
+    match: dict[str, Any] = {
+        "tileset": session.tileset,
+        "room": session.room_id,
+        "tokens": {player.value: token for player, token in session.tokens.items()},
+        "bots": {
+            player.value: type(agent).__name__
+            for player, agent in session.players.items()
+            if not isinstance(agent, Human)
+        },
+        "match_score": {
+            player.value: score for player, score in session.match_score.items()
+        },
+        "prompts": {player.value: prompt for player, prompt in session.prompts.items()},
+        "game": None,
+    }
+    engine = session.engine
+    if engine is not None and engine.pending is not None:
+        game = recording.record(
+            engine, session.seed, session.tileset, session.start_match_score
+        )
+        match["game"] = base64.b64encode(game.encode()).decode()
+    return match
+
+
+def _decode_session(match: dict[str, Any]) -> Session:
+    tokens = {Player(player): token for player, token in match["tokens"].items()}
+    players: dict[Player, Agent] = {player: Human(Disconnected()) for player in tokens}
+    for player, name in match["bots"].items():
+        players[Player(player)] = getattr(agents, name)()
+
+    session = Session(players, match["tileset"], tokens, match["room"])
+    session.match_score = {
+        Player(player): score for player, score in match["match_score"].items()
+    }
+    session.prompts = {
+        Player(player): prompt for player, prompt in match["prompts"].items()
+    }
+    if match["game"] is not None:
+        session.restored_game = Recording.decode(base64.b64decode(match["game"]))
+    return session
@@ -0,0 +1,142 @@
+"""
+Spectators, who watch a running match without playing.
+
+Spectators see the public view of the state plus `State.spectator_view`, so every tile
+is hidden unless it's been revealed to both players.
+
+All the spectators of a match share one stream of messages (see `server.delta`): each
+state change is encoded once and pushed to all of them with `websockets.broadcast`,
+which writes to each connection without waiting.  So the cost per spectator is a write,
+and a slow spectator can't delay the players.  A spectator with more than
+`MAX_BUFFERED_BYTES` waiting to be written is skipped; once they've caught up, they're
+sent a fresh snapshot and carry on with the stream.
+"""
+
+import asyncio
+import json
+from typing import Collection, Optional
+
+from websockets.legacy.protocol import broadcast
+from websockets.server import WebSocketServerProtocol
+
+from server import delta, metrics
+from server.delta import FragmentCache, SentView
+from server.state import State
+
+# skip spectators with more than this waiting to be written
+MAX_BUFFERED_BYTES = 2**16
+
+WATCHING_PROMPT = "⌛⌛⌛<br>Watching<br>⌛⌛⌛"
+
+
+class Audience:
+    """The spectators of one match."""
+
+    def __init__(self) -> None:
+        # the last view in the stream
+        self.sent: Optional[SentView] = None
+        # spectators who were sent everything in the stream so far
+        self.in_sync: set[WebSocketServerProtocol] = set()
+        # spectators who need a snapshot before they can follow the stream
+        self.behind: set[WebSocketServerProtocol] = set()
+
+    def __len__(self) -> int:
+        return len(self.in_sync) + len(self.behind)
+
+    def add(self, websocket: WebSocketServerProtocol, state: Optional[State]) -> None:
+        """Add a spectator, and send them the `state` of the game if it has started."""
+        prompt = {"type": "PROMPT", "choiceId": 0, "prompt": WATCHING_PROMPT}
+        _broadcast([websocket], json.dumps(prompt))
+        self.behind.add(websocket)
+        if state is not None:
+            self.update(state)
+
+    def remove(self, websocket: WebSocketServerProtocol) -> None:
+        self.in_sync.discard(websocket)
+        self.behind.discard(websocket)
+
+    def resync(self, websocket: WebSocketServerProtocol) -> None:
+        """Send the spectator a snapshot, e.g. when they ask for one with RESYNC."""
+        if websocket in self.in_sync:
+            self.in_sync.remove(websocket)
+            self.behind.add(websocket)
+            self._catch_up({})
+
+    def update(self, state: State) -> None:
+        """Send the spectators any change in the state since the last update."""
+        if not self:
+            # nobody's watching; start the stream from a snapshot when they are
+            self.sent = None
+            return
+        cache: FragmentCache = {}
+        message = None
+        if self.sent is None or self.sent.state_version != state.version:
+            self.sent, message = delta.view_message(
+                self.sent,
+                state.version,
+                state.public_view(),
+                state.spectator_view(),
+                cache,
+            )
+        if message is not None:
+            lagging = {ws for ws in self.in_sync if _buffered(ws) > MAX_BUFFERED_BYTES}
+            self.in_sync -= lagging
+            self.behind |= lagging
+            _broadcast(self.in_sync, message)
+        self._catch_up(cache)
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        """
+        Disconnect all the spectators, e.g. when the match ends.
+
+        They're closed at once, so lagging spectators that don't answer the closing
+        handshake hold up the match's end by one close timeout at most, not one each.
+        """
+        spectators = self.in_sync | self.behind
+        self.in_sync, self.behind = set(), set()
+        await asyncio.gather(
+            *(websocket.close(code, reason) for websocket in spectators),
+            return_exceptions=True,
+        )
+
+    def _catch_up(self, cache: FragmentCache) -> None:
+        """Send a snapshot to the spectators who are behind and able to take it."""
+        self.behind = {ws for ws in self.behind if ws.open}
+        ready = {ws for ws in self.behind if _buffered(ws) <= MAX_BUFFERED_BYTES}
+        if self.sent is None or not ready:
+            return
+        _broadcast(ready, delta.snapshot_message(self.sent, cache))
+        self.behind -= ready
+        self.in_sync |= ready
+
+
+def _broadcast(websockets: Collection[WebSocketServerProtocol], message: str) -> None:
+    broadcast(websockets, message)
+    metrics.count("frames_sent", len(websockets))
+    metrics.count("events_sent", len(websockets))
+    metrics.count("bytes_sent", len(websockets) * len(message))
+
+
+def _buffered(websocket: WebSocketServerProtocol) -> int:
+    return websocket.transport.get_write_buffer_size()
+
+
+async def watch(
+    audience: Audience, state: Optional[State], websocket: WebSocketServerProtocol
+) -> None:
+    """
+    Add the websocket to the audience until it disconnects, starting from `state`
+    if the game has started.
+    """
+    audience.add(websocket, state)
+    try:
+        async for message in websocket:
+            metrics.count("messages_received")
+            try:
+                event = json.loads(message)
+            except ValueError:
+                continue
+            if isinstance(event, dict) and event.get("type") == delta.RESYNC:
+                audience.resync(websocket)
+    finally:
+        audience.remove(websocket)
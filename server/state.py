@@ -1,7 +1,10 @@
-from random import shuffle
-from typing import Literal
+from itertools import count
+from random import Random
+from typing import Any, Literal, Optional
 
-from pydantic import BaseModel, computed_field
+from pydantic import BaseModel, PrivateAttr, computed_field
+
+from server import trace
 
 from server.constants import (
     Player,
@@ -22,6 +25,19 @@ from server.config import (
 )
 
 
+# source of `State.version`
+_VERSIONS = count()
+
+# fields of a player view that depend on which player is viewing; see `State.player_view`
+PRIVATE_FIELDS = {
+    "tiles_in_hand",
+    "tiles_on_board",
+    "exchange_tiles",
+    "unused_tiles",
+    "hidden_tiles",
+}
+
+
 class State(BaseModel):
     """
     The between-turn state of the game (board, tiles, coins, log).
@@ -98,6 +114,38 @@ class State(BaseModel):
 
     game_score: dict[Player, int] = {Player.N: 0, Player.S: 0}
 
+    # Index from each occupied square to the owning player and the index into their
+    # `positions`, `tiles_on_board`, and `tiles_on_board_revealed`.
+    # Kept in sync by the methods that move tiles; see `_reindex`.
+    _squares: dict[Square, tuple[Player, int]] = PrivateAttr(default_factory=dict)
+
+    # Replaced by `touch()` whenever the state changes, and the public view cached
+    # at a version.  See `public_view`.
+    _version: int = PrivateAttr(default_factory=lambda: next(_VERSIONS))
+    _public_view: Optional[tuple[int, dict[str, Any]]] = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._reindex()
+
+    def __eq__(self, other: object) -> bool:
+        # compare the fields only; the private attributes are derived or cached
+        if not isinstance(other, State):
+            return NotImplemented
+        return self.__dict__ == other.__dict__
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name == "positions":
+            self._reindex()
+
+    def _reindex(self) -> None:
+        """Rebuild the square index from `positions`."""
+        self._squares = {
+            square: (player, i)
+            for player in Player
+            for i, square in enumerate(self.positions[player])
+        }
+
     @computed_field  # type: ignore[misc]
     @property
     def hidden_tiles(self) -> list[Tile]:
@@ -108,29 +156,14 @@ class State(BaseModel):
         without knowing the other player's tiles.
         """
 
-        # we can assume that any unknown tiles are already replaced by Tile.HIDDEN
-        # so start by finding all non-hidden tiles, and then remove those from the full list
-
-        viewed_tiles = [
-            tile
-            for tile in self.unused_tiles
-            + self.tiles_in_hand[self.current_player]
-            + self.tiles_in_hand[other_player(self.current_player)]
-            + self.tiles_on_board[self.current_player]
-            + self.tiles_on_board[other_player(self.current_player)]
-            + self.exchange_tiles[0]
-            + self.exchange_tiles[1]
-            + self.discard
-        ]
-        assert len(viewed_tiles) == 15
-        visible_tiles = [tile for tile in viewed_tiles if tile != Tile.HIDDEN]
-
-        # make sure to remove the correct number of copies of each visible tile
-        tiles = [tile for tile in self.tiles_in_game for _ in range(3)]
-        for tile in visible_tiles:
-            tiles.remove(tile)
-
-        return sorted(tiles)
+        return _hidden_tiles(
+            self.tiles_in_game,
+            self.tiles_in_hand,
+            self.tiles_on_board,
+            self.exchange_tiles,
+            self.unused_tiles,
+            self.discard,
+        )
 
     def tile_at(self, square: Square) -> Tile:
         """The tile occupying on the board at this square.  Error if there isn't one."""
@@ -140,21 +173,29 @@ class State(BaseModel):
         return maybe_tile
 
     def maybe_tile_at(self, square: Square) -> Tile | None:
-        for player in Player:
-            for s, other_square in enumerate(self.positions[player]):
-                if other_square == square:
-                    return self.tiles_on_board[player][s]
-        return None
+        entry = self._squares.get(square)
+        if entry is None:
+            return None
+        player, i = entry
+        return self.tiles_on_board[player][i]
 
+    def index_at(self, square: Square) -> int:
+        """
+        The index of the tile at square into its player's `positions` and `tiles_on_board`.
+        ValueError if there isn't one.
+        """
+        entry = self._squares.get(square)
+        if entry is None:
+            raise ValueError(f"Expected tile at {square}")
+        return entry[1]
+
+    @trace.traced
     def reveal_at(self, square: Square) -> None:
         """Reveal the tile at square.  Error if there isn't one."""
-        for player in Player:
-            for s, other_square in enumerate(self.positions[player]):
-                if other_square == square:
-                    self.tiles_on_board_revealed[player][s] = True
-                    return
-        raise ValueError(f"Expected tile at {square}")
+        player = self.player_at(square)
+        self.tiles_on_board_revealed[player][self.index_at(square)] = True
 
+    @trace.traced
     def reveal_unused(self) -> bool:
         """
         Reveal 1 unused tile to current player, or do nothing if they are all revealed.
@@ -179,11 +220,45 @@ class State(BaseModel):
         return maybe_player
 
     def maybe_player_at(self, square: Square) -> Player | None:
-        for player in Player:
-            for s, other_square in enumerate(self.positions[player]):
-                if other_square == square:
-                    return player
-        return None
+        entry = self._squares.get(square)
+        return None if entry is None else entry[0]
+
+    @trace.traced
+    def move_tile(self, square: Square, end_square: Square) -> None:
+        """Move the tile at square to end_square, which must be empty or the same square."""
+        player, i = self._squares.pop(square)
+        assert end_square not in self._squares, f"{end_square} is occupied"
+        self.positions[player][i] = end_square
+        self._squares[end_square] = (player, i)
+
+    @trace.traced
+    def swap_positions(self, square: Square, other_square: Square) -> None:
+        """Swap the locations of the tiles on two occupied squares."""
+        player, i = self._squares[square]
+        other, j = self._squares[other_square]
+        self.positions[player][i] = other_square
+        self.positions[other][j] = square
+        self._squares[square] = (other, j)
+        self._squares[other_square] = (player, i)
+
+    @trace.traced
+    def remove_tile(self, square: Square) -> Tile:
+        """Remove the tile at square from the board and return it."""
+        player, i = self._squares[square]
+        tile = self.tiles_on_board[player].pop(i)
+        self.positions[player].pop(i)
+        self.tiles_on_board_revealed[player].pop(i)
+        self._reindex()
+        return tile
+
+    @trace.traced
+    def place_tile(self, player: Player, tile: Tile, square: Square) -> None:
+        """Place a face-down tile for player on the empty square."""
+        assert square not in self._squares, f"{square} is occupied"
+        self.tiles_on_board[player].append(tile)
+        self.positions[player].append(square)
+        self.tiles_on_board_revealed[player].append(False)
+        self._squares[square] = (player, len(self.positions[player]) - 1)
 
     def all_positions(self) -> list[Square]:
         """All squares with a tile on board, regardless of player"""
@@ -193,6 +268,7 @@ class State(BaseModel):
         """All squares with a web on board, regardless of player"""
         return self.webs[Player.N] + self.webs[Player.S]
 
+    @trace.traced
     def log(self, msg: str) -> None:
         self.public_log.append(msg)
 
@@ -217,6 +293,115 @@ class State(BaseModel):
 
         This represents the player's knowledge of the state.
         """
+        return State(
+            tiles_in_game=self.tiles_in_game,
+            **self._private_fields(player),
+            # all tile positions are public knowledge
+            positions=self.positions,
+            # we can see everything else
+            unused_revealed=self.unused_revealed,
+            tiles_on_board_revealed=self.tiles_on_board_revealed,
+            exchange_tiles_revealed=self.exchange_tiles_revealed,
+            discard=self.discard,
+            public_log=self.public_log,
+            current_player=self.current_player,
+            other_player=self.other_player,
+            coins=self.coins,
+            webs=self.webs,
+            skip_next_turn=self.skip_next_turn,
+            go_again=self.go_again,
+            match_score=self.match_score,
+            game_score=self.game_score,
+            bonus_position=self.bonus_position,
+            bonus_amount=self.bonus_amount,
+            bonus_reveal=self.bonus_reveal,
+            smite_cost=self.smite_cost,
+            x2_tile=self.x2_tile,
+            exchange_positions=self.exchange_positions,
+        )
+
+    def public_view(self) -> dict[str, Any]:
+        """
+        The serialized fields of `player_view` that are the same for both players.
+
+        Cached until the next `touch()`, so it's built once per state version
+        however many players see it.
+        """
+        if self._public_view is None or self._public_view[0] != self._version:
+            self._public_view = (self._version, self.model_dump(exclude=PRIVATE_FIELDS))
+        return self._public_view[1]
+
+    def private_view(self, player: Player) -> dict[str, Any]:
+        """
+        The serialized fields of `player_view(player)` that depend on the player.
+
+        Together with `public_view()` this is `player_view(player).model_dump()`, without
+        building a `State` for the view.
+        """
+        fields = self._private_fields(player)
+        fields["hidden_tiles"] = _hidden_tiles(
+            self.tiles_in_game, **fields, discard=self.discard
+        )
+        return {
+            "tiles_in_hand": {
+                p: list(tiles) for p, tiles in fields["tiles_in_hand"].items()
+            },
+            "tiles_on_board": {
+                p: list(tiles) for p, tiles in fields["tiles_on_board"].items()
+            },
+            "exchange_tiles": [list(tiles) for tiles in fields["exchange_tiles"]],
+            "unused_tiles": list(fields["unused_tiles"]),
+            "hidden_tiles": fields["hidden_tiles"],
+        }
+
+    def spectator_view(self) -> dict[str, Any]:
+        """
+        Like `private_view`, for a spectator who is neither player.
+
+        Spectators only see what both players see: no tiles in hand, and no tiles
+        elsewhere unless they've been revealed to both players.
+        """
+        tiles_in_hand = {
+            p: [Tile.HIDDEN for _ in tiles] for p, tiles in self.tiles_in_hand.items()
+        }
+        tiles_on_board = {
+            p: [
+                tile if revealed else Tile.HIDDEN
+                for tile, revealed in zip(
+                    tiles, self.tiles_on_board_revealed[p], strict=True
+                )
+            ]
+            for p, tiles in self.tiles_on_board.items()
+        }
+        exchange_tiles = [
+            (
+                list(tiles)
+                if all(self.exchange_tiles_revealed[p][i] for p in Player)
+                else [Tile.HIDDEN for _ in tiles]
+            )
+            for i, tiles in enumerate(self.exchange_tiles)
+        ]
+        unused_tiles = [
+            tile if all(self.unused_revealed[p][i] for p in Player) else Tile.HIDDEN
+            for i, tile in enumerate(self.unused_tiles)
+        ]
+        return {
+            "tiles_in_hand": tiles_in_hand,
+            "tiles_on_board": tiles_on_board,
+            "exchange_tiles": exchange_tiles,
+            "unused_tiles": unused_tiles,
+            "hidden_tiles": _hidden_tiles(
+                self.tiles_in_game,
+                tiles_in_hand,
+                tiles_on_board,
+                exchange_tiles,
+                unused_tiles,
+                self.discard,
+            ),
+        }
+
+    def _private_fields(self, player: Player) -> dict[str, Any]:
+        """The tile fields of `player_view(player)`, with the hidden tiles replaced."""
         opponent = other_player(player)
 
         # we know the number of tiles in the opponent's hand but not their identity
@@ -241,6 +426,7 @@ class State(BaseModel):
             )
         ]
 
+        # we can't see the unused tiles
         unused_tiles = [
             tile if revealed else Tile.HIDDEN
             for tile, revealed in zip(
@@ -248,42 +434,32 @@ class State(BaseModel):
             )
         ]
 
-        return State(
-            tiles_in_game=self.tiles_in_game,
-            tiles_in_hand={
+        return {
+            "tiles_in_hand": {
                 player: self.tiles_in_hand[player],
                 opponent: opponent_hand,
             },
-            tiles_on_board={
+            "tiles_on_board": {
                 player: self.tiles_on_board[player],
                 opponent: opponent_board,
             },
-            exchange_tiles=exchange_tiles,
-            # all tile positions are public knowledge
-            positions=self.positions,
-            # we can't see the unused tiles
-            unused_tiles=unused_tiles,
-            # we can see everything else
-            unused_revealed=self.unused_revealed,
-            tiles_on_board_revealed=self.tiles_on_board_revealed,
-            exchange_tiles_revealed=self.exchange_tiles_revealed,
-            discard=self.discard,
-            public_log=self.public_log,
-            current_player=self.current_player,
-            other_player=self.other_player,
-            coins=self.coins,
-            webs=self.webs,
-            skip_next_turn=self.skip_next_turn,
-            go_again=self.go_again,
-            match_score=self.match_score,
-            game_score=self.game_score,
-            bonus_position=self.bonus_position,
-            bonus_amount=self.bonus_amount,
-            bonus_reveal=self.bonus_reveal,
-            smite_cost=self.smite_cost,
-            x2_tile=self.x2_tile,
-            exchange_positions=self.exchange_positions,
-        )
+            "exchange_tiles": exchange_tiles,
+            "unused_tiles": unused_tiles,
+        }
+
+    def touch(self) -> None:
+        """Mark the state as changed, invalidating cached views."""
+        self._version = next(_VERSIONS)
+
+    @property
+    def version(self) -> int:
+        """
+        Changed by every `touch()`.
+
+        Versions are unique across all states in the process, so two states with the same
+        version are the same state with the same contents.
+        """
+        return self._version
 
     def check_consistency(self) -> None:
         """
@@ -339,20 +515,30 @@ class State(BaseModel):
         # check tile locations are unique
         assert len(self.all_positions()) == len(set(self.all_positions()))
 
+        # check the square index is in sync with positions
+        assert self._squares == {
+            square: (player, i)
+            for player in Player
+            for i, square in enumerate(self.positions[player])
+        }
+
         if not NEGATIVE_COINS_OK:
             assert all(self.coins[player] >= 0 for player in Player)
 
         assert self.current_player != self.other_player
 
+    @trace.traced
     def next_turn(self) -> None:
         self.current_player = other_player(self.current_player)
         self.other_player = other_player(self.other_player)
 
+    @trace.traced
     def score_point(self, player: Player) -> None:
         """Register that a player has scored a point by making a kill."""
         self.game_score[player] += 1
         self.match_score[player] += 1
 
+    @trace.traced
     def swap_identity(self, start: Square, target: Square) -> None:
         """
         Swap the identities of two tiles at the given positions and make both visible.
@@ -363,8 +549,8 @@ class State(BaseModel):
         assert start_player != target_player
 
         # Get indices of both tiles
-        start_idx = self.positions[start_player].index(start)
-        target_idx = self.positions[target_player].index(target)
+        start_idx = self.index_at(start)
+        target_idx = self.index_at(target)
 
         # Swap the identities
         start_identity = self.tiles_on_board[start_player][start_idx]
@@ -377,23 +563,59 @@ class State(BaseModel):
         self.tiles_on_board_revealed[target_player][target_idx] = True
 
 
+def _hidden_tiles(
+    tiles_in_game: list[Tile],
+    tiles_in_hand: dict[Player, list[Tile]],
+    tiles_on_board: dict[Player, list[Tile]],
+    exchange_tiles: list[list[Tile]],
+    unused_tiles: list[Tile],
+    discard: list[Tile],
+) -> list[Tile]:
+    """See `State.hidden_tiles`."""
+    # we can assume that any unknown tiles are already replaced by Tile.HIDDEN
+    # so start by finding all non-hidden tiles, and then remove those from the full list
+    viewed_tiles = [
+        tile
+        for tile in unused_tiles
+        + tiles_in_hand[Player.N]
+        + tiles_in_hand[Player.S]
+        + tiles_on_board[Player.N]
+        + tiles_on_board[Player.S]
+        + exchange_tiles[0]
+        + exchange_tiles[1]
+        + discard
+    ]
+    assert len(viewed_tiles) == 15
+    visible_tiles = [tile for tile in viewed_tiles if tile != Tile.HIDDEN]
+
+    # make sure to remove the correct number of copies of each visible tile
+    tiles = [tile for tile in tiles_in_game for _ in range(3)]
+    for tile in visible_tiles:
+        tiles.remove(tile)
+
+    return sorted(tiles)
+
+
 def new_state(
     match_score: dict[Player, int],
     tileset: Literal["random", "default", "new"],
+    rng: Random,
 ) -> State:
     """
     Return a new state with the tiles randomly dealt.
+
+    All randomness is drawn from `rng`, so the same seed deals the same game.
     """
     # if the tileset is not default, randomize everything
     randomize = tileset != "default"
 
-    start_coins_per_player = choose_start_coins(randomize)
-    smite_cost = choose_smite_cost(randomize)
-    bonus_amount = choose_bonus_amount(randomize)
-    bonus_reveal = choose_bonus_reveal(randomize)
-    tiles_in_game = choose_tiles_in_game(tileset)
-    start_positions = choose_start_positions()
-    bonus_position, exchange_positions = bonus_and_exchange_positions()
+    start_coins_per_player = choose_start_coins(randomize, rng)
+    smite_cost = choose_smite_cost(randomize, rng)
+    bonus_amount = choose_bonus_amount(randomize, rng)
+    bonus_reveal = choose_bonus_reveal(randomize, rng)
+    tiles_in_game = choose_tiles_in_game(tileset, rng)
+    start_positions = choose_start_positions(rng)
+    bonus_position, exchange_positions = bonus_and_exchange_positions(rng)
 
     start_coins = {
         Player.N: start_coins_per_player,
@@ -407,7 +629,7 @@ def new_state(
     assert len(tiles) == 15
 
     # shuffle, then deal out the cards from fixed indices
-    shuffle(tiles)
+    rng.shuffle(tiles)
 
     x2_tile = None  # TODO: x2 tile no longer supported; remove all references
 
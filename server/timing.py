@@ -0,0 +1,180 @@
+"""
+Optional timing of each phase of a turn, split into server compute and agent wait.
+
+Set `TIMINGS_PATH` to turn it on.  Each game then gets a `GameTimings`, with two
+histograms per phase:
+    - compute: time spent running the phase's own code in the engine, not counting the
+      phases it calls.  "broadcast" is the time spent notifying the players.
+    - wait: time spent waiting for an agent to make a decision the phase asked for.
+So "the server is slow" shows up in compute, and "the human is thinking" in wait.
+
+The engine's phases are marked with `@phase`.  A flow is a generator, so a phase's
+compute time is the time spent inside its `send`s, which the engine makes with the
+game's timings `active`.  When timing is off, `@phase` returns the flow untouched.
+
+Finished games are kept in `RECENT`; `summary()` merges them for a runtime query, and
+the server writes it to `TIMINGS_PATH` on shutdown.
+"""
+
+import json
+import os
+import time
+from collections import deque
+from functools import wraps
+from typing import Any, Callable, Optional, TypeVar
+
+TIMINGS_PATH = os.environ.get("TIMINGS_PATH")
+
+# keep the timings of this many finished games
+MAX_RECENT = 1000
+
+# bucket i counts durations in [2**(i-1), 2**i) microseconds; the last is unbounded
+NUM_BUCKETS = 32
+
+# for decisions asked outside any phase
+OTHER = "other"
+
+
+class Histogram:
+    """Durations in power-of-two microsecond buckets."""
+
+    def __init__(self) -> None:
+        self.buckets = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        bucket = min(int(seconds * 1e6).bit_length(), NUM_BUCKETS - 1)
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "Histogram") -> None:
+        for i, count in enumerate(other.buckets):
+            self.buckets[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """An upper bound on the q-quantile, in seconds; 0 if empty."""
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= q * self.count:
+                return min(2**i / 1e6, self.max)
+        return 0.0
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            # upper bound in microseconds -> count
+            "buckets": {2**i: count for i, count in enumerate(self.buckets) if count},
+        }
+
+
+class GameTimings:
+    """Compute and wait histograms for each phase of one game's turns."""
+
+    def __init__(self) -> None:
+        self.compute: dict[str, Histogram] = {}
+        self.wait: dict[str, Histogram] = {}
+        # compute time recorded by phases within the ones running now
+        self.nested = 0.0
+        # the last decision or event yielded by a phase, and the innermost phase that
+        # yielded it
+        self.request: Any = None
+        self.request_phase = OTHER
+
+    def add_compute(self, phase: str, seconds: float) -> None:
+        self.compute.setdefault(phase, Histogram()).add(seconds)
+
+    def add_wait(self, decision: Any, seconds: float) -> None:
+        """Record the time an agent took to make a decision."""
+        phase = self.request_phase if decision is self.request else OTHER
+        self.wait.setdefault(phase, Histogram()).add(seconds)
+
+    def merge(self, other: "GameTimings") -> None:
+        for mine, theirs in ((self.compute, other.compute), (self.wait, other.wait)):
+            for phase, histogram in theirs.items():
+                mine.setdefault(phase, Histogram()).merge(histogram)
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "compute": {phase: h.to_json() for phase, h in self.compute.items()},
+            "wait": {phase: h.to_json() for phase, h in self.wait.items()},
+        }
+
+
+# the timings of the game whose engine is running now, if it's timed
+active: Optional[GameTimings] = None
+
+RECENT: deque[GameTimings] = deque(maxlen=MAX_RECENT)
+
+
+def finished(timings: GameTimings) -> None:
+    RECENT.append(timings)
+
+
+def summary() -> dict[str, Any]:
+    """All the phases of the recent games' turns, merged."""
+    merged = GameTimings()
+    for timings in RECENT:
+        merged.merge(timings)
+    return {"games": len(RECENT), **merged.to_json()}
+
+
+def dump(path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(summary(), f, indent=2)
+        f.write("\n")
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def phase(name: str) -> Callable[[F], F]:
+    """Time the flows this function returns as the named phase, when timing is on."""
+
+    def decorate(flow_function: F) -> F:
+        @wraps(flow_function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            flow = flow_function(*args, **kwargs)
+            if active is None:
+                return flow
+            return _timed(name, flow, active)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def _timed(name: str, flow: Any, timings: GameTimings) -> Any:
+    """Pass everything through to and from `flow`, timing each step it takes."""
+    value = None
+    while True:
+        nested = timings.nested
+        start = time.perf_counter()
+        try:
+            request = flow.send(value)
+        except StopIteration as e:
+            _record(name, timings, start, nested)
+            return e.value
+        _record(name, timings, start, nested)
+
+        # the innermost phase sees each request first
+        if request is not timings.request:
+            timings.request, timings.request_phase = request, name
+        value = yield request
+
+
+def _record(name: str, timings: GameTimings, start: float, nested: float) -> None:
+    elapsed = time.perf_counter() - start
+    timings.add_compute(name, elapsed - (timings.nested - nested))
+    timings.nested = nested + elapsed
@@ -0,0 +1,132 @@
+"""
+Traces one game's timeline, for finding where a slow turn spent its time.
+
+Send the server SIGUSR1 to trace the next game that starts.  When it ends, the trace is
+written to `TRACE_DIR` as Chrome trace-event JSON; open it in chrome://tracing or
+https://ui.perfetto.dev.
+
+    kill -USR1 $(pgrep -f server.app)
+    ...
+    Saved trace to traces/game-1700000000000000000.json
+
+The trace has a span for:
+    - each prompt, from sending it to getting the player's choice
+    - each state broadcast
+    - each step of the engine, and the `valid_targets` calls and state mutations in it
+
+The game being traced is tracked in a context variable, so only its own task's spans
+are recorded, and everything else pays one lookup per traced call.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+TRACE_DIR = os.environ.get("TRACE_DIR", "traces")
+
+
+class Tracer:
+    """The spans of one game, as Chrome trace events."""
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter_ns()
+        self.events: list[dict[str, Any]] = []
+        self.args: dict[str, Any] = {}
+
+    def add(self, name: str, start: int, end: int, args: dict[str, Any]) -> None:
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": (start - self.start) / 1000,
+            "dur": (end - start) / 1000,
+            "pid": 0,
+            "tid": 0,
+        }
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def save(self, path: str) -> None:
+        metadata = {"name": "process_name", "ph": "M", "pid": 0, "args": self.args}
+        with open(path, "w") as f:
+            json.dump({"traceEvents": [metadata, *self.events]}, f)
+
+
+# the tracer of the game running in the current task, if it's traced
+current: ContextVar[Optional[Tracer]] = ContextVar("trace", default=None)
+
+# how many of the next games to trace
+armed = 0
+
+
+def arm(games: int = 1) -> None:
+    """Trace the next `games` games to start."""
+    global armed
+    armed = games
+    print(f"Tracing the next {games} game(s) to {TRACE_DIR}")
+
+
+@contextmanager
+def game() -> Iterator[None]:
+    """Trace the game played in this block if tracing is armed, and save its trace."""
+    global armed
+    if armed <= 0:
+        yield
+        return
+    armed -= 1
+    tracer = Tracer()
+    token = current.set(tracer)
+    try:
+        yield
+    finally:
+        current.reset(token)
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        path = os.path.join(TRACE_DIR, f"game-{time.time_ns()}.json")
+        tracer.save(path)
+        print(f"Saved trace to {path}")
+
+
+def describe(**args: Any) -> None:
+    """Label the traced game, e.g. with its seed."""
+    tracer = current.get()
+    if tracer is not None:
+        tracer.args.update(args)
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[None]:
+    """Record the block as a span, if the game is traced."""
+    tracer = current.get()
+    if tracer is None:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        tracer.add(name, start, time.perf_counter_ns(), args)
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def traced(function: F) -> F:
+    """Record each call of a hot synchronous function as a span, if the game is traced."""
+    name = function.__qualname__
+
+    @wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        tracer = current.get()
+        if tracer is None:
+            return function(*args, **kwargs)
+        start = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            tracer.add(name, start, time.perf_counter_ns(), {})
+
+    return wrapper  # type: ignore[return-value]
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the rules engine's hot paths.
+
+    python -m test.bench_engine --output bench.json
+    python -m test.bench_engine --baseline test/bench_baseline.json
+
+Each benchmark times one function over realistic positions: the early, mid and late
+game of a few games per tileset, played with random choices from fixed seeds.  So the
+positions are the same on every run, and results are comparable between runs.
+
+Results are written as JSON with the time per call of each benchmark, in microseconds.
+With `--baseline`, each result is compared to the stored one, and the run fails if any
+benchmark got more than `--tolerance` slower.  `--save-baseline` stores the results as
+the new baseline; only compare results from the same machine.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+from functools import partial
+from operator import attrgetter
+from random import Random
+from typing import Any, Callable, NamedTuple, Optional
+
+from server import bitboard
+from server.actions import (
+    _all_distances,
+    grapple_end_square,
+    reflect_action,
+    take_action,
+    valid_targets,
+)
+from server.constants import Action, Player, Square, Tile
+from server.engine import Engine
+from server.recording import TILESETS, Tileset
+from server.state import State, new_state
+
+SEEDS = [1, 2, 3]
+
+# where in the game each phase's position is taken, as a fraction of its turns
+PHASES = {"early": 0.1, "mid": 0.5, "late": 0.9}
+
+# actions the target can reflect back; see `engine._select_response`
+REFLECTABLE = {Tile.HOOK, Tile.THIEF, Tile.KNIVES, Tile.BACKSTABBER, Tile.FIREBALL}
+
+# stop games that haven't finished after this many turns
+MAX_TURNS = 1000
+
+# (start, action, target) of an action
+Move = tuple[Square, Action, Square]
+
+# makes the calls to time in one batch; called outside the timer, so it can copy state
+Prepare = Callable[[], list[Callable[[], Any]]]
+
+
+class Result(NamedTuple):
+    # calls timed in each repeat
+    calls: int
+    # fastest and median time per call over the repeats, in microseconds
+    min_us: float
+    median_us: float
+
+
+def play_positions(tileset: Tileset, seed: int) -> dict[str, State]:
+    """Play a game with random choices, and return its position at each phase."""
+    rng = Random(seed)
+    state = new_state({Player.N: 0, Player.S: 0}, tileset, rng)
+    states = [state.model_copy(deep=True)]
+    engine = Engine(state, rng, record_events=False, keyframe_interval=1)
+    chooser = Random(seed)
+    while not engine.is_terminal() and engine.turns < MAX_TURNS:
+        engine.step(chooser.choice(engine.legal_decisions()))
+    states += [keyframe.state for keyframe in engine.keyframes]
+    return {
+        phase: states[int(fraction * (len(states) - 1))]
+        for phase, fraction in PHASES.items()
+    }
+
+
+def _moves(state: State, rng: Random, per_tile: int = 3) -> list[Move]:
+    """Some valid actions for the current player, chosen at random."""
+    moves = []
+    for start in state.positions[state.current_player]:
+        options = [
+            (start, action, target)
+            for action, targets in valid_targets(start, state).items()
+            for target in targets
+        ]
+        moves += rng.sample(options, min(per_tile, len(options)))
+    return moves
+
+
+def _reflections(state: State) -> list[Move]:
+    """Every action on an enemy that the enemy could reflect."""
+    enemies = set(state.positions[state.other_player])
+    return [
+        (start, action, target)
+        for start in state.positions[state.current_player]
+        for action, targets in valid_targets(start, state).items()
+        if action in REFLECTABLE
+        for target in targets
+        if target in enemies
+    ]
+
+
+def benchmarks(seeds: list[int] = SEEDS) -> dict[str, Prepare]:
+    """Every benchmark by name, e.g. "valid_targets/default/mid"."""
+    found: dict[str, Prepare] = {}
+    for tileset in TILESETS:
+        found[f"new_state/{tileset}"] = _bench_new_state(tileset, seeds)
+
+        games = [play_positions(tileset, seed) for seed in seeds]
+        for phase in PHASES:
+            states = [game[phase] for game in games]
+            for name, prepare in _position_benchmarks(states).items():
+                found[f"{name}/{tileset}/{phase}"] = prepare
+    return found
+
+
+def _bench_new_state(tileset: Tileset, seeds: list[int]) -> Prepare:
+    match_score = {Player.N: 0, Player.S: 0}
+    return lambda: [
+        partial(new_state, match_score, tileset, Random(seed)) for seed in seeds
+    ]
+
+
+def _position_benchmarks(states: list[State]) -> dict[str, Prepare]:
+    """Benchmarks of each function over the same positions."""
+    rng = Random(0)
+    starts = [
+        (state, start)
+        for state in states
+        for start in state.positions[state.current_player]
+    ]
+    distances = [
+        (start, [s for s in state.all_positions() if s != start])
+        for state, start in starts
+    ]
+    grapples = [
+        (
+            start,
+            target,
+            bitboard.occupied_mask(state)
+            & ~bitboard.bit(start)
+            & ~bitboard.bit(target),
+        )
+        for state, start in starts
+        for target in state.positions[state.other_player]
+    ]
+    moves = [(state, move) for state in states for move in _moves(state, rng)]
+    reflections = [(state, move) for state in states for move in _reflections(state)]
+
+    def copies(moves: list[tuple[State, Move]]) -> list[tuple[State, Move]]:
+        # both functions change the state, so each call gets its own copy
+        return [(state.model_copy(deep=True), move) for state, move in moves]
+
+    return {
+        "valid_targets": lambda: [
+            partial(valid_targets, start, state) for state, start in starts
+        ],
+        "_all_distances": lambda: [
+            partial(_all_distances, *args) for args in distances
+        ],
+        "grapple_end_square": lambda: [
+            partial(grapple_end_square, *args) for args in grapples
+        ],
+        "take_action": lambda: [
+            partial(take_action, *move, state, Random(0))
+            for state, move in copies(moves)
+        ],
+        "reflect_action": lambda: [
+            partial(reflect_action, *move, state) for state, move in copies(reflections)
+        ],
+        "player_view": lambda: [
+            partial(state.player_view, state.current_player) for state in states
+        ],
+        "hidden_tiles": lambda: [
+            partial(attrgetter("hidden_tiles"), state) for state in states
+        ],
+        "check_consistency": lambda: [state.check_consistency for state in states],
+    }
+
+
+def measure(prepare: Prepare, min_time: float, repeat: int) -> Optional[Result]:
+    """
+    Time the prepared calls, in batches until each repeat takes at least `min_time`.
+
+    Returns None if there's nothing to call, e.g. no reflectable actions in a position.
+    """
+    if not prepare():
+        return None
+    per_call = []
+    for _ in range(repeat):
+        total, calls = 0.0, 0
+        while total < min_time:
+            batch = prepare()
+            # like timeit, keep the garbage collector from landing in one batch's time
+            gc.disable()
+            start = time.perf_counter()
+            for call in batch:
+                call()
+            total += time.perf_counter() - start
+            gc.enable()
+            calls += len(batch)
+        per_call.append(total / calls * 1e6)
+    return Result(calls, min(per_call), statistics.median(per_call))
+
+
+def run(min_time: float, repeat: int, only: Optional[str] = None) -> dict[str, Result]:
+    """Run the benchmarks whose name contains `only`, or all of them."""
+    results = {}
+    for name, prepare in benchmarks().items():
+        if only is not None and only not in name:
+            continue
+        result = measure(prepare, min_time, repeat)
+        if result is not None:
+            results[name] = result
+    return results
+
+
+def compare(
+    results: dict[str, Result], baseline: dict[str, Result], tolerance: float
+) -> list[str]:
+    """Print each result against its baseline, and return the names of regressions."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:45} {result.min_us:10.2f}us   (new)")
+            continue
+        ratio = result.min_us / before.min_us
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  SLOWER"
+            regressions.append(name)
+        print(
+            f"{name:45} {result.min_us:10.2f}us {before.min_us:10.2f}us "
+            f"{ratio:6.2f}x{flag}"
+        )
+    return regressions
+
+
+def _load(path: str) -> dict[str, Result]:
+    with open(path) as f:
+        data = json.load(f)
+    return {name: Result(**result) for name, result in data["results"].items()}
+
+
+def _dump(path: str, results: dict[str, Result]) -> None:
+    data = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": {name: result._asdict() for name, result in results.items()},
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", help="write the results here as JSON")
+    parser.add_argument("--baseline", help="compare against results stored here")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the new --baseline",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="fail if a benchmark is this fraction slower than the baseline",
+    )
+    parser.add_argument(
+        "--min-time", type=float, default=0.05, help="seconds to time each repeat"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="only run benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    results = run(args.min_time, args.repeat, args.only)
+    if args.output:
+        _dump(args.output, results)
+
+    if args.baseline and args.save_baseline:
+        _dump(args.baseline, results)
+    elif args.baseline:
+        regressions = compare(results, _load(args.baseline), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} benchmarks regressed")
+            sys.exit(1)
+    else:
+        for name, result in results.items():
+            print(f"{name:45} {result.min_us:10.2f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of whole games through the async game loop.
+
+    python -m test.bench_game --games 20 --output bench_game.json
+
+Each game runs through `play_one_game`, as the server would run it, with two seatings:
+    - bots: two RandomBots.  Bots aren't notified, so this is the rules plus the loop.
+    - clients: two Humans on in-process websockets, each answered by a simulated client
+      that clicks a random highlighted option.  This adds the notify and choices layers:
+      building, encoding and queueing every message, and waiting on every choice.
+The difference between the two is what the notification layer costs over the rules.
+
+For each seating it reports turns per second, and per turn: decisions, state broadcasts,
+frames and bytes sent.  Clients make more decisions per turn than bots, since they pick
+a tile, an action and a target one click at a time.  The time the simulated clients
+spend parsing what they're sent is measured and left out.
+
+CPython keeps no count of allocations, so memory is reported as the peak traced by
+`tracemalloc` during a game, in a separate traced run so tracing doesn't slow the
+timed one.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import time
+import tracemalloc
+from typing import NamedTuple
+
+from websockets.server import WebSocketServerProtocol
+
+from server import inbox, outbox
+from server.constants import Player
+from server.engine import Engine
+from server.game import play_one_game
+from server.recording import Tileset
+from server.session import Session
+from test.clients import SEATINGS, ClientWebsocket, seat
+
+
+class Result(NamedTuple):
+    games: int
+    turns: int
+    turns_per_second: float
+    # per turn, summed over both players
+    decisions_per_turn: float
+    broadcasts_per_turn: float
+    frames_per_turn: float
+    bytes_per_turn: float
+    # mean over games, in KB
+    peak_traced_kb: float
+
+
+async def play(
+    seating: str, tileset: Tileset, seed: int
+) -> tuple[Engine, float, list[WebSocketServerProtocol]]:
+    """
+    Play one game, and return its engine, the seconds the server side took,
+    and the players' websockets.
+    """
+    players = seat(seating, seed)
+    session = Session(players, tileset)
+    websockets = [agent.websocket for agent in players.values()]
+    start = time.perf_counter()
+    # `play_one_game` logs each game's seed
+    with contextlib.redirect_stdout(io.StringIO()):
+        await play_one_game(
+            {Player.N: 0, Player.S: 0}, players, tileset, seed=seed, session=session
+        )
+        for websocket in websockets:
+            await outbox.flush(websocket)
+    seconds = time.perf_counter() - start
+    for websocket in websockets:
+        inbox.detach(websocket)
+        if isinstance(websocket, ClientWebsocket):
+            seconds -= websocket.seconds
+    assert session.engine is not None
+    return session.engine, seconds, websockets
+
+
+async def run_seating(seating: str, tileset: Tileset, games: int) -> Result:
+    turns, decisions, seconds, broadcasts, frames, sent = 0, 0, 0.0, 0, 0, 0
+    for seed in range(games):
+        engine, game_seconds, websockets = await play(seating, tileset, seed)
+        turns += engine.turns
+        decisions += len(engine.decisions)
+        seconds += game_seconds
+        for websocket in websockets:
+            if isinstance(websocket, ClientWebsocket):
+                broadcasts += websocket.broadcasts
+                frames += websocket.frames
+                sent += websocket.bytes
+
+    peak = 0
+    tracemalloc.start()
+    for seed in range(games):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        await play(seating, tileset, seed)
+        peak += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    return Result(
+        games=games,
+        turns=turns,
+        turns_per_second=turns / seconds,
+        decisions_per_turn=decisions / turns,
+        broadcasts_per_turn=broadcasts / turns,
+        frames_per_turn=frames / turns,
+        bytes_per_turn=sent / turns,
+        peak_traced_kb=peak / games / 1024,
+    )
+
+
+def _print(seating: str, result: Result) -> None:
+    print(
+        f"{seating:8} {result.turns:6} turns  {result.turns_per_second:8.0f} turns/s  "
+        f"per turn: {result.decisions_per_turn:5.1f} decisions "
+        f"{result.broadcasts_per_turn:5.1f} broadcasts "
+        f"{result.frames_per_turn:5.1f} frames {result.bytes_per_turn:7.0f} bytes "
+        f"peak {result.peak_traced_kb:.0f}KB per game"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--games", type=int, default=20, help="games per seating")
+    parser.add_argument(
+        "--tileset", choices=["random", "default", "new"], default="default"
+    )
+    parser.add_argument(
+        "--seating", choices=SEATINGS, nargs="+", default=SEATINGS, help="who plays"
+    )
+    parser.add_argument("--output", help="write the results here as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for seating in args.seating:
+        results[seating] = asyncio.run(run_seating(seating, args.tileset, args.games))
+        _print(seating, results[seating])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            data = {seating: result._asdict() for seating, result in results.items()}
+            json.dump(data, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Simulated players for tests and benchmarks that run whole games in-process.
+"""
+
+import asyncio
+import json
+import time
+from random import Random
+from typing import AsyncIterable, Iterable
+
+from server import inbox
+from server.agents import Agent, DummyWebsocket, Human, RandomBot
+from server.choices import highlighted_choices
+from server.constants import OutEventType, Player
+
+# who plays both seats: RandomBots, or Humans answered by a `ClientWebsocket`
+SEATINGS = ["bots", "clients"]
+
+STATE_EVENTS = {OutEventType.STATE_CHANGE.value, OutEventType.STATE_DELTA.value}
+
+
+class ClientWebsocket(DummyWebsocket):
+    """An in-process websocket with a simulated client that answers every prompt."""
+
+    def __init__(self, rng: Random):
+        self.rng = rng
+        self.replies: asyncio.Queue[str] = asyncio.Queue()
+        self.highlights: dict = {}
+        self.frames = 0
+        self.bytes = 0
+        self.broadcasts = 0
+        # time spent in the simulated client, to leave out of the game's time
+        self.seconds = 0.0
+
+    async def send(
+        self, message: str | bytes | Iterable[str | bytes] | AsyncIterable[str | bytes]
+    ) -> None:
+        assert isinstance(message, str)
+        start = time.perf_counter()
+        self.frames += 1
+        self.bytes += len(message)
+        frame = json.loads(message)
+        for event in frame["events"] if frame["type"] == "BATCH" else [frame]:
+            if event["type"] in STATE_EVENTS:
+                self.broadcasts += 1
+            elif event["type"] == OutEventType.HIGHLIGHT_CHANGE.value:
+                self.highlights = event
+            elif event["type"] == "PROMPT" and event["choiceId"] > 0:
+                options = highlighted_choices(self.highlights)
+                reply = {
+                    "choiceId": event["choiceId"],
+                    "data": self.rng.choice(options),
+                }
+                self.replies.put_nowait(json.dumps(reply))
+        self.seconds += time.perf_counter() - start
+
+    async def recv(self) -> str:
+        return await self.replies.get()
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        self.open = False
+
+
+def seat(seating: str, seed: int) -> dict[Player, Agent]:
+    """Both players for one of the `SEATINGS`, with generators seeded from `seed`."""
+    if seating == "bots":
+        return {player: RandomBot(Random(seed + i)) for i, player in enumerate(Player)}
+    players: dict[Player, Agent] = {}
+    for i, player in enumerate(Player):
+        websocket = ClientWebsocket(Random(seed + i))
+        # as the server does when a player joins
+        inbox.attach(websocket)
+        players[player] = Human(websocket)
+    return players
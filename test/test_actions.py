@@ -1,5 +1,6 @@
 from server.state import Square
 from server.actions import _all_distances, _fireball_targets
+from server.bitboard import to_mask, squares_in
 
 
 def test_all_distances():
@@ -64,9 +65,9 @@ def test_fireball_targets():
     ]
     obstructions = enemies + allies
 
-    targets = _fireball_targets(start, obstructions, enemies)
+    targets = _fireball_targets(start, to_mask(obstructions), to_mask(enemies))
 
-    assert sorted(targets) == sorted(
+    assert squares_in(targets) == sorted(
         [
             Square(0, 1),
             Square(3, 0),
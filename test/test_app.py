@@ -0,0 +1,90 @@
+import asyncio
+
+from server.agents import DummyWebsocket, Human, RandomBot
+from server.app import (
+    ROOMS,
+    SOLO_MATCHES,
+    close_room,
+    find_match,
+    join_room,
+    leave_room,
+    start_restored,
+)
+from server.constants import Player
+from server.session import Disconnected, Session
+
+
+class ClosedWebsocket(DummyWebsocket):
+    open = False
+
+
+def test_rooms_are_independent():
+    north_a, north_b = Human(DummyWebsocket()), Human(DummyWebsocket())
+
+    room_a = join_room("a", Player.N, north_a)
+    room_b = join_room("b", Player.N, north_b)
+
+    assert room_a is not None and room_b is not None
+    assert room_a is not room_b
+    assert ROOMS["a"].seats == {Player.N: north_a}
+    assert ROOMS["b"].seats == {Player.N: north_b}
+
+    close_room(room_a)
+    close_room(room_b)
+    assert "a" not in ROOMS and "b" not in ROOMS
+
+
+def test_taken_seat():
+    first, second = Human(DummyWebsocket()), Human(DummyWebsocket())
+
+    room = join_room("taken", Player.S, first)
+    assert room is not None
+    assert join_room("taken", Player.S, second) is None
+    assert room.seats[Player.S] is first
+
+    leave_room(room, Player.S, first)
+    assert "taken" not in ROOMS
+
+
+def test_disconnected_seat_retaken():
+    stale, fresh = Human(ClosedWebsocket()), Human(DummyWebsocket())
+
+    room = join_room("retake", Player.N, stale)
+    assert join_room("retake", Player.N, fresh) is room
+    assert room is not None
+
+    # the stale player leaving doesn't remove the new one
+    leave_room(room, Player.N, stale)
+    assert ROOMS["retake"].seats == {Player.N: fresh}
+
+    leave_room(room, Player.N, fresh)
+    assert "retake" not in ROOMS
+
+
+def test_restored_matches_are_registered():
+    async def run():
+        pvp = Session(
+            {Player.N: Human(Disconnected()), Player.S: Human(Disconnected())},
+            "default",
+            room_id="restored",
+        )
+        solo = Session({Player.S: Human(Disconnected()), Player.N: RandomBot()}, "new")
+        pvp_match, solo_match = start_restored(pvp), start_restored(solo)
+
+        room = ROOMS["restored"]
+        assert room.session is pvp and room.match is pvp_match
+        # a new pair can't open a second match in the room
+        assert join_room("restored", Player.N, Human(DummyWebsocket())) is None
+        assert solo.room_id is not None
+        assert find_match(solo.room_id) is solo
+        assert find_match("restored") is pvp
+
+        for match in (pvp_match, solo_match):
+            match.cancel()
+        await asyncio.gather(pvp_match, solo_match, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert "restored" not in ROOMS
+        assert solo.room_id not in SOLO_MATCHES
+        assert find_match("restored") is None
+
+    asyncio.run(run())
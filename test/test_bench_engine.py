@@ -0,0 +1,18 @@
+from test.bench_engine import compare, run
+
+
+def test_benchmarks_run():
+    results = run(min_time=1e-6, repeat=1, only="default")
+
+    assert {name.split("/")[0] for name in results} == {
+        "new_state",
+        "valid_targets",
+        "_all_distances",
+        "grapple_end_square",
+        "take_action",
+        "reflect_action",
+        "player_view",
+        "hidden_tiles",
+        "check_consistency",
+    }
+    assert compare(results, results, tolerance=0) == []
@@ -0,0 +1,11 @@
+import asyncio
+
+from test.bench_game import run_seating
+
+
+def test_bots_and_clients_finish_games():
+    bots = asyncio.run(run_seating("bots", "default", games=2))
+    clients = asyncio.run(run_seating("clients", "default", games=2))
+
+    assert bots.turns > 0 and bots.frames_per_turn == 0
+    assert clients.turns > 0 and clients.broadcasts_per_turn > 0
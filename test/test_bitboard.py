@@ -0,0 +1,34 @@
+import random
+
+from server.state import Square
+from server.actions import _bfs_distances
+from server.bitboard import distance_layers, index, to_mask, squares_in, SQUARES
+
+
+def test_distance_layers_match_all_distances():
+    # compare the bitboard BFS against the list-based BFS on random boards
+    rng = random.Random(0)
+    for _ in range(200):
+        start, *obstructions = rng.sample(SQUARES, rng.randint(1, 6))
+
+        layers = distance_layers(index(start), to_mask(obstructions))
+
+        dists = {s: d for d, layer in enumerate(layers) for s in squares_in(layer)}
+        assert dists == _bfs_distances(start, obstructions, rows=5, cols=5)
+
+
+def test_distance_layers_cached():
+    distance_layers.cache_clear()
+    start, obstruction = Square(0, 0), Square(1, 1)
+
+    first = distance_layers(index(start), to_mask([obstruction]))
+    second = distance_layers(index(start), to_mask([obstruction]))
+
+    assert first == second
+    info = distance_layers.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_squares_in_round_trip():
+    squares = [Square(4, 4), Square(0, 0), Square(2, 3)]
+    assert squares_in(to_mask(squares)) == sorted(squares)
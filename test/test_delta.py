@@ -0,0 +1,122 @@
+import json
+from random import Random
+
+from server.agents import DummyWebsocket
+from server.constants import Player
+from server.delta import forget, is_current, merge, state_change_message
+from server.engine import Engine
+from server.state import new_state
+
+
+def _apply(view, event):
+    # same as applyDelta in docs/main.js
+    assert event["type"] == "STATE_DELTA"
+    patched = {**view, **event["changes"]}
+    patched["public_log"] = patched["public_log"] + event["logAppend"]
+    return patched
+
+
+def test_deltas_rebuild_view():
+    rng = Random(0)
+    engine = Engine(new_state({Player.N: 0, Player.S: 0}, "new", rng), rng)
+    websockets = {player: DummyWebsocket() for player in Player}
+
+    client_views = {}
+    versions = {}
+    full_bytes = delta_bytes = 0
+    while not engine.is_terminal():
+        engine.step(rng.choice(engine.legal_decisions()))
+
+        state = engine.state
+        public = state.public_view()
+        cache = {}
+        for player in Player:
+            private = state.private_view(player)
+            message = state_change_message(
+                state.version, public, private, websockets[player], cache
+            )
+            view = json.loads(json.dumps(state.player_view(player).model_dump()))
+            full_bytes += len(json.dumps(view))
+            if message is None:
+                # nothing changed
+                assert client_views[player] == view
+                continue
+            event = json.loads(message)
+
+            if player not in client_views:
+                assert event["type"] == "STATE_CHANGE"
+                client_views[player] = event["playerView"]
+            else:
+                assert event["baseVersion"] == versions[player]
+                client_views[player] = _apply(client_views[player], event)
+            versions[player] = event["version"]
+
+            assert client_views[player] == view
+            delta_bytes += len(message)
+
+    assert delta_bytes * 5 < full_bytes
+
+
+def test_unchanged_state_sends_nothing():
+    rng = Random(0)
+    state = new_state({Player.N: 0, Player.S: 0}, "default", rng)
+    websocket = DummyWebsocket()
+
+    public, private = state.public_view(), state.private_view(Player.S)
+    assert state_change_message(state.version, public, private, websocket, {})
+
+    # touched but not changed
+    state.touch()
+    public, private = state.public_view(), state.private_view(Player.S)
+    assert not is_current(websocket, state.version)
+    assert state_change_message(state.version, public, private, websocket, {}) is None
+    assert is_current(websocket, state.version)
+
+
+def test_forget_sends_snapshot():
+    rng = Random(0)
+    state = new_state({Player.N: 0, Player.S: 0}, "default", rng)
+    websocket = DummyWebsocket()
+    public, private = state.public_view(), state.private_view(Player.S)
+
+    def message():
+        return state_change_message(state.version, public, private, websocket, {})
+
+    assert json.loads(message())["type"] == "STATE_CHANGE"
+    assert message() is None
+    forget(websocket)
+    assert json.loads(message())["type"] == "STATE_CHANGE"
+
+
+def test_merged_messages_rebuild_view():
+    rng = Random(1)
+    engine = Engine(new_state({Player.N: 0, Player.S: 0}, "default", rng), rng)
+    websocket = DummyWebsocket()
+
+    # the client only gets the first message and then every merged pair
+    client_view = None
+    queued = None
+    while not engine.is_terminal():
+        engine.step(rng.choice(engine.legal_decisions()))
+        state = engine.state
+        message = state_change_message(
+            state.version,
+            state.public_view(),
+            state.private_view(Player.S),
+            websocket,
+            {},
+        )
+        if message is None:
+            continue
+        if queued is None:
+            queued = message
+            continue
+
+        event = json.loads(merge(queued, message))
+        queued = None
+        if event["type"] == "STATE_CHANGE":
+            client_view = event["playerView"]
+        else:
+            client_view = _apply(client_view, event)
+        view = json.loads(json.dumps(state.player_view(Player.S).model_dump()))
+        assert client_view == view
@@ -0,0 +1,51 @@
+from random import Random
+
+import pytest
+
+from server.constants import GameResult, Player
+from server.engine import Engine, DecisionKind
+from server.state import new_state
+
+
+@pytest.mark.parametrize("tileset", ["default", "new", "random"])
+def test_random_games_finish(tileset):
+    # play games to completion by choosing uniformly among the legal decisions
+    rng = Random(0)
+    for _ in range(20):
+        engine = Engine(new_state({Player.N: 0, Player.S: 0}, tileset, rng), rng)
+        while not engine.is_terminal():
+            engine.step(rng.choice(engine.legal_decisions()))
+
+        assert engine.state.game_result() != GameResult.ONGOING
+        assert engine.legal_decisions() == []
+
+
+def test_illegal_decision_rejected():
+    rng = Random(0)
+    engine = Engine(new_state({Player.N: 0, Player.S: 0}, "default", rng), rng)
+
+    # south goes first and has 2 tiles, so chooses a start tile
+    assert engine.pending is not None
+    assert engine.pending.kind == DecisionKind.ACTION
+    assert engine.pending.player == Player.S
+    north_square = engine.state.positions[Player.N][0]
+
+    with pytest.raises(ValueError):
+        engine.step(north_square)
+
+
+def _play_seeded_game(seed: int) -> Engine:
+    rng = Random(seed)
+    engine = Engine(new_state({Player.N: 0, Player.S: 0}, "random", rng), rng)
+    # choices come from a separate generator so they don't shift the game's draws
+    choices = Random(seed)
+    while not engine.is_terminal():
+        engine.step(choices.choice(engine.legal_decisions()))
+    return engine
+
+
+def test_same_seed_same_game():
+    first, second = _play_seeded_game(3), _play_seeded_game(3)
+
+    assert first.state == second.state
+    assert first.turns == second.turns
@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+import pytest
+from websockets.exceptions import ConnectionClosed
+
+from server import inbox
+from server.agents import DummyWebsocket
+from server.delta import SENT_VIEWS, SentView
+
+
+class QueueWebsocket(DummyWebsocket):
+    """Receives the messages put on its queue; None closes it."""
+
+    def __init__(self):
+        self.received = asyncio.Queue()
+
+    async def recv(self):
+        message = await self.received.get()
+        if message is None:
+            raise ConnectionClosed(None, None)
+        return message
+
+
+def _choice(choice_id, data):
+    return json.dumps({"choiceId": choice_id, "data": data})
+
+
+def test_only_current_choice_delivered():
+    async def run():
+        websocket = QueueWebsocket()
+        inbox.attach(websocket)
+        # spam from before the prompt
+        for _ in range(100):
+            websocket.received.put_nowait(_choice(1, {"button": "stale"}))
+        websocket.received.put_nowait("not json")
+        await asyncio.sleep(0)
+
+        waiting = asyncio.create_task(inbox.get_choice(websocket, 2))
+        await asyncio.sleep(0)
+        websocket.received.put_nowait(_choice(3, {"button": "early"}))
+        websocket.received.put_nowait(_choice(2, {"button": "current"}))
+        websocket.received.put_nowait(_choice(2, {"button": "double click"}))
+        assert await waiting == {"button": "current"}
+
+        await asyncio.sleep(0)
+        # the socket is drained between prompts
+        assert websocket.received.empty()
+        assert inbox.INBOXES[websocket].dropped == 101 + 1 + 1
+
+    asyncio.run(run())
+
+
+def test_resync_and_close():
+    async def run():
+        websocket = QueueWebsocket()
+        inbox.attach(websocket)
+        SENT_VIEWS[websocket] = SentView(1, 1, {}, {})
+        waiting = asyncio.create_task(inbox.get_choice(websocket, 1))
+        await asyncio.sleep(0)
+
+        websocket.received.put_nowait(json.dumps({"type": "RESYNC"}))
+        websocket.received.put_nowait(None)
+        with pytest.raises(ConnectionClosed):
+            await waiting
+        assert websocket not in SENT_VIEWS
+
+        # later waits fail straight away
+        with pytest.raises(ConnectionClosed):
+            await inbox.get_choice(websocket, 2)
+
+        # and so do waits on a websocket that was never attached
+        with pytest.raises(ConnectionClosed):
+            await inbox.get_choice(QueueWebsocket(), 1)
+
+    asyncio.run(run())
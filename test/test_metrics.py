@@ -0,0 +1,74 @@
+import asyncio
+import contextlib
+import io
+import json
+
+from server import inbox, metrics, session
+from server.agents import DummyWebsocket
+from server.game import play_one_match
+from test.clients import seat
+
+
+def test_inbox_counts_dropped_messages():
+    async def run():
+        websocket = DummyWebsocket()
+        reader = inbox.Inbox(websocket)
+        reader.reader.cancel()
+        before = metrics.COUNTERS.copy()
+
+        reader.route("junk")
+        reader.route(json.dumps({"choiceId": 3, "data": {}}))
+        return metrics.COUNTERS - before
+
+    counted = asyncio.run(run())
+    assert counted == {
+        "messages_received": 2,
+        "invalid_messages": 1,
+        "stale_choices": 1,
+    }
+
+
+def test_serves_snapshot(monkeypatch):
+    monkeypatch.setitem(metrics.GAUGES, "answer", lambda: 42)
+
+    async def run():
+        server = await asyncio.start_server(metrics._handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+        server.close()
+        return response
+
+    head, body = asyncio.run(run()).split(b"\r\n\r\n", 1)
+    assert head.startswith(b"HTTP/1.1 200")
+    assert json.loads(body)["gauges"]["answer"] == 42
+
+
+def test_each_match_has_its_own_latency():
+    async def run():
+        sessions = [
+            session.open_session(seat("clients", seed), "default", room_id)
+            for seed, room_id in enumerate(["a", "b"])
+        ]
+        matches = [
+            asyncio.create_task(play_one_match(match.players, "default", match))
+            for match in sessions
+        ]
+        while min(match.latency.count for match in sessions) < 10:
+            await asyncio.sleep(0.01)
+        snapshot = metrics.snapshot()["match_latency"]
+
+        for match in matches:
+            match.cancel()
+        await asyncio.gather(*matches, return_exceptions=True)
+        return sessions, snapshot
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sessions, snapshot = asyncio.run(run())
+    assert set(snapshot) >= {"a", "b"}
+    assert snapshot["a"]["count"] >= 10 and snapshot["b"]["count"] >= 10
+    assert sessions[0].latency is not sessions[1].latency
+    assert "a" not in metrics.MATCH_LATENCY and "b" not in metrics.MATCH_LATENCY
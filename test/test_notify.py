@@ -0,0 +1,46 @@
+import asyncio
+import json
+from random import Random
+
+from server.agents import DummyWebsocket, Human, RandomBot
+from server.constants import Player
+from server.notify import broadcast_selection_changed, broadcast_state_changed
+from server.state import new_state
+
+
+class RecordingWebsocket(DummyWebsocket):
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(message)
+
+
+class FailingWebsocket(DummyWebsocket):
+    async def send(self, message):
+        raise AssertionError("bots shouldn't be sent anything")
+
+
+def test_bots_not_notified():
+    human = Human(RecordingWebsocket())
+    bot = RandomBot()
+    bot.websocket = FailingWebsocket()
+    players = {Player.S: human, Player.N: bot}
+    state = new_state({Player.N: 0, Player.S: 0}, "default", Random(0))
+
+    async def broadcast():
+        await broadcast_state_changed(state, players)
+        await broadcast_selection_changed(None, None, None, None, players)
+        # let the outbox flush
+        await asyncio.sleep(0)
+
+    asyncio.run(broadcast())
+
+    # both events are batched into one frame
+    (frame,) = human.websocket.sent
+    batch = json.loads(frame)
+    assert batch["type"] == "BATCH"
+    assert [event["type"] for event in batch["events"]] == [
+        "STATE_CHANGE",
+        "SELECTION_CHANGE",
+    ]
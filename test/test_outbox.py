@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+from server import outbox
+from server.agents import DummyWebsocket
+
+
+class SlowWebsocket(DummyWebsocket):
+    """Takes a frame only when `ready` is set."""
+
+    def __init__(self):
+        self.ready = asyncio.Event()
+        self.sent = []
+        self.closed_with = None
+
+    async def send(self, message):
+        await self.ready.wait()
+        self.sent.append(message)
+
+    async def close(self, code=1000, reason=""):
+        self.closed_with = code
+        self.open = False
+
+
+def _merge(older, newer):
+    return json.dumps({"type": "STATE", "n": json.loads(older)["n"] + 1})
+
+
+def test_queued_events_superseded():
+    async def run():
+        websocket = SlowWebsocket()
+        outbox.send(websocket, json.dumps({"type": "FIRST"}))
+        # the first frame is stuck sending
+        await asyncio.sleep(0)
+
+        outbox.send(websocket, json.dumps({"type": "STATE", "n": 1}), "STATE", _merge)
+        outbox.send(websocket, json.dumps({"type": "PROMPT", "n": 1}), "PROMPT")
+        outbox.send(websocket, json.dumps({"type": "STATE", "n": 1}), "STATE", _merge)
+        outbox.send(websocket, json.dumps({"type": "OTHER"}))
+        outbox.send(websocket, json.dumps({"type": "PROMPT", "n": 2}), "PROMPT")
+
+        websocket.ready.set()
+        await outbox.flush(websocket)
+        first, second = [json.loads(frame) for frame in websocket.sent]
+        assert first == {"type": "FIRST"}
+        assert second["events"] == [
+            {"type": "STATE", "n": 2},
+            {"type": "OTHER"},
+            {"type": "PROMPT", "n": 2},
+        ]
+
+    asyncio.run(run())
+
+
+def test_slow_client_disconnected():
+    async def run():
+        websocket = SlowWebsocket()
+        event = json.dumps({"type": "OTHER"})
+        for _ in range(outbox.MAX_QUEUED_EVENTS + 2):
+            outbox.send(websocket, event)
+            await asyncio.sleep(0)
+
+        await asyncio.sleep(0)
+        assert websocket.closed_with == outbox.SLOW_CLIENT_CODE
+        assert outbox.OUTBOXES[websocket].events == []
+        assert websocket.sent == []
+
+    asyncio.run(run())
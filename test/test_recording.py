@@ -0,0 +1,60 @@
+from random import Random
+
+from server.constants import Player
+from server.engine import Engine
+from server.recording import Recording, record, replay
+from server.state import new_state
+
+
+def _play(seed: int, tileset, keyframe_interval=0) -> tuple[Engine, Recording]:
+    match_score = {Player.N: 1, Player.S: 2}
+    rng = Random(seed)
+    state = new_state(match_score.copy(), tileset, rng)
+    engine = Engine(state, rng, keyframe_interval=keyframe_interval)
+    choices = Random(-seed)
+    while not engine.is_terminal():
+        engine.step(choices.choice(engine.legal_decisions()))
+    return engine, record(engine, seed, tileset, match_score)
+
+
+def test_encode_round_trip():
+    _, recording = _play(1, "new", keyframe_interval=4)
+    assert recording.keyframes
+    assert Recording.decode(recording.encode()) == recording
+
+
+def test_replay_reproduces_game():
+    for seed, tileset in enumerate(["default", "new", "random"] * 5):
+        engine, recording = _play(seed, tileset)
+
+        replayed = replay(Recording.decode(recording.encode()))
+
+        assert replayed.is_terminal()
+        assert replayed.state == engine.state
+
+
+def test_replay_to_turn():
+    engine, recording = _play(2, "default")
+    assert engine.turns > 3
+
+    replayed = replay(recording, turn=3)
+
+    assert replayed.turns == 3
+    assert not replayed.is_terminal()
+    assert len(replayed.decisions) < len(recording.decisions)
+
+
+def test_seek_from_keyframes():
+    for seed in range(10):
+        engine, recording = _play(seed, "random", keyframe_interval=3)
+        without_keyframes = recording._replace(keyframes=[])
+
+        for turn in [0, 2, 3, 7, engine.turns, None]:
+            seeked = replay(recording, turn)
+            replayed = replay(without_keyframes, turn)
+
+            assert seeked.state == replayed.state
+            assert seeked.turns == replayed.turns
+            assert seeked.decisions == replayed.decisions
+
+        assert replay(recording).state == engine.state
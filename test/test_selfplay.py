@@ -0,0 +1,23 @@
+from server.constants import GameResult
+from server.selfplay import GameSpec, game_seed, play_game, play_games
+
+
+def test_play_games_finish():
+    specs = [GameSpec(i, "default", "RandomBot", "RandomBot", 1000) for i in range(10)]
+    results = list(play_games(specs, workers=1))
+
+    assert sorted(r.seed for r in results) == list(range(10))
+    assert all(r.result != GameResult.ONGOING.value for r in results)
+
+
+def test_same_seed_same_game():
+    spec = GameSpec(7, "new", "RandomBot", "RandomBot", 1000)
+    first, second = play_game(spec), play_game(spec)
+    assert first._replace(seconds=0) == second._replace(seconds=0)
+
+
+def test_batches_dont_overlap():
+    first = {game_seed(0, i) for i in range(10)}
+    second = {game_seed(1, i) for i in range(5)}
+    assert len(first) == 10 and len(second) == 5
+    assert not first & second
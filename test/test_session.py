@@ -0,0 +1,156 @@
+import asyncio
+import json
+from random import Random
+
+import pytest
+from websockets.exceptions import ConnectionClosed
+
+from server import inbox, outbox, recording, session
+from server.agents import DummyWebsocket, Human, RandomBot
+from server.constants import Player
+from server.engine import Engine
+from server.notify import broadcast_state_changed
+from server.state import new_state
+
+
+class FakeWebsocket(DummyWebsocket):
+    def __init__(self):
+        self.sent = []
+        self.received = asyncio.Queue()
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    async def recv(self):
+        return await self.received.get()
+
+    async def close(self, code=1000, reason=""):
+        self.open = False
+
+    def events(self):
+        events = []
+        for frame in self.sent:
+            message = json.loads(frame)
+            events += message["events"] if message["type"] == "BATCH" else [message]
+        return events
+
+
+def test_resume_takes_over_seat():
+    async def run():
+        old, new = FakeWebsocket(), FakeWebsocket()
+        human = Human(old)
+        players = {Player.S: human, Player.N: RandomBot()}
+        match = session.open_session(players, "default")
+        rng = Random(0)
+        match.engine = Engine(
+            new_state({Player.N: 0, Player.S: 0}, "default", rng), rng
+        )
+        match.prompts[Player.S] = "Waiting for north"
+        (token,) = match.tokens.values()
+
+        # south is deciding when their connection drops
+        choice = asyncio.create_task(inbox.get_choice(old, 1))
+        await asyncio.sleep(0)
+
+        assert not await session.resume("wrong token", new)
+        assert await session.resume(token, new)
+        with pytest.raises(ConnectionClosed):
+            await choice
+        assert human.websocket is new
+        assert not old.open
+        assert await match.wait_for(Player.S)
+
+        await outbox.flush(new)
+        assert [event["type"] for event in new.events()] == [
+            "SESSION",
+            "STATE_CHANGE",
+            "PROMPT",
+        ]
+        assert new.events()[0]["token"] == token
+
+        session.close_session(match)
+        assert not await session.resume(token, FakeWebsocket())
+
+    asyncio.run(run())
+
+
+def test_gives_up_waiting(monkeypatch):
+    monkeypatch.setattr(session, "RECONNECT_TIMEOUT", 0.01)
+
+    async def run():
+        websocket = FakeWebsocket()
+        websocket.open = False
+        match = session.open_session({Player.S: Human(websocket)}, "default")
+        assert not await match.wait_for(Player.S)
+        session.close_session(match)
+
+    asyncio.run(run())
+
+
+def test_checkpoint_and_restore(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+
+    async def run():
+        players = {Player.S: Human(FakeWebsocket()), Player.N: RandomBot()}
+        match = session.open_session(players, "new", "lobby")
+        match.match_score = {Player.N: 3, Player.S: 1}
+        match.task = asyncio.current_task()
+
+        # play part of a game
+        rng = Random(0)
+        match.seed = 0
+        match.start_match_score = match.match_score.copy()
+        engine = Engine(
+            new_state(match.start_match_score.copy(), "new", rng),
+            Random(0),
+            interactive=[Player.S],
+        )
+        match.engine = engine
+        for _ in range(30):
+            engine.step(rng.choice(engine.legal_decisions()))
+
+        # checkpointing stops the match
+        assert session.checkpoint(path) == 1
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.sleep(0)
+        assert match.close_reason[0] == session.SERVICE_RESTART
+        session.close_session(match)
+
+        (restored,) = session.restore(path)
+        assert restored.tokens == match.tokens
+        assert restored.room_id == "lobby"
+        assert restored.match_score == match.match_score
+        assert isinstance(restored.players[Player.N], RandomBot)
+        assert not restored.players[Player.S].websocket.open
+
+        replayed = recording.replay(restored.restored_game)
+        assert replayed.state == engine.state
+        assert replayed.pending == engine.pending
+        session.close_session(restored)
+
+    asyncio.run(run())
+
+
+def test_resync_sends_snapshot_straight_away():
+    async def run():
+        websocket = FakeWebsocket()
+        players = {Player.S: Human(websocket), Player.N: RandomBot()}
+        match = session.open_session(players, "default")
+        rng = Random(0)
+        match.engine = Engine(
+            new_state({Player.N: 0, Player.S: 0}, "default", rng), rng
+        )
+        await broadcast_state_changed(match.engine.state, players)
+        await outbox.flush(websocket)
+        websocket.sent.clear()
+
+        # the client missed a delta while the game waits on a decision
+        websocket.received.put_nowait(json.dumps({"type": "RESYNC"}))
+        await asyncio.sleep(0)
+        await outbox.flush(websocket)
+        assert [event["type"] for event in websocket.events()] == ["STATE_CHANGE"]
+
+        inbox.detach(websocket)
+        session.close_session(match)
+
+    asyncio.run(run())
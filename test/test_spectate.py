@@ -0,0 +1,136 @@
+import asyncio
+import json
+from random import Random
+
+from websockets.connection import State as ConnectionState
+
+from server import spectate
+from server.agents import DummyWebsocket
+from server.constants import Player, Tile
+from server.engine import Engine
+from server.spectate import Audience
+from server.state import new_state
+
+
+class Transport:
+    def __init__(self):
+        self.buffered = 0
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+
+class BroadcastWebsocket(DummyWebsocket):
+    """Just enough of a connection for `websockets.broadcast`."""
+
+    def __init__(self):
+        self.state = ConnectionState.OPEN
+        self._fragmented_message_waiter = None
+        self.transport = Transport()
+        self.frames = []
+
+    def write_frame_sync(self, fin, opcode, data):
+        self.frames.append(json.loads(data))
+
+
+def _flatten(tiles):
+    if isinstance(tiles, dict):
+        tiles = [tiles[player] for player in Player]
+    if tiles and isinstance(tiles[0], list):
+        return [tile for row in tiles for tile in row]
+    return tiles
+
+
+def test_spectators_only_see_public_tiles():
+    rng = Random(0)
+    engine = Engine(new_state({Player.N: 0, Player.S: 0}, "random", rng), rng)
+    while not engine.is_terminal():
+        engine.step(rng.choice(engine.legal_decisions()))
+        state = engine.state
+        spectator = state.spectator_view()
+        views = [state.private_view(player) for player in Player]
+
+        assert all(
+            tile == Tile.HIDDEN
+            for tiles in spectator["tiles_in_hand"].values()
+            for tile in tiles
+        )
+        for field in ["unused_tiles", "exchange_tiles", "tiles_on_board"]:
+            # a spectator sees a tile only if both players see it
+            for tile, *seen in zip(
+                _flatten(spectator[field]), *(_flatten(view[field]) for view in views)
+            ):
+                both_see = Tile.HIDDEN not in seen
+                assert tile == (seen[0] if both_see else Tile.HIDDEN)
+
+
+def test_encoded_once_and_slow_spectators_skipped(monkeypatch):
+    encoded = []
+    view_message = spectate.delta.view_message
+
+    def counting_view_message(*args):
+        sent, message = view_message(*args)
+        encoded.append(message)
+        return sent, message
+
+    monkeypatch.setattr(spectate.delta, "view_message", counting_view_message)
+
+    rng = Random(0)
+    engine = Engine(new_state({Player.N: 0, Player.S: 0}, "default", rng), rng)
+    audience = Audience()
+    spectators = [BroadcastWebsocket() for _ in range(100)]
+    for websocket in spectators:
+        audience.add(websocket, engine.state)
+    slow = spectators[0]
+
+    for _ in range(10):
+        engine.step(rng.choice(engine.legal_decisions()))
+        audience.update(engine.state)
+    slow.transport.buffered = spectate.MAX_BUFFERED_BYTES + 1
+    for _ in range(10):
+        engine.step(rng.choice(engine.legal_decisions()))
+        audience.update(engine.state)
+    slow.transport.buffered = 0
+    engine.step(rng.choice(engine.legal_decisions()))
+    audience.update(engine.state)
+
+    # one encoding per update, however many spectators
+    assert len(encoded) == 1 + 21
+    deltas = sum(message is not None for message in encoded[1:])
+    for websocket in spectators[1:]:
+        types = [frame["type"] for frame in websocket.frames]
+        assert types[:2] == ["PROMPT", "STATE_CHANGE"]
+        assert types[2:] == ["STATE_DELTA"] * deltas
+    # the slow spectator missed some deltas and caught up with a snapshot
+    assert len(slow.frames) < len(spectators[1].frames)
+    assert slow.frames[-1]["type"] == "STATE_CHANGE"
+    assert slow.frames[-1]["version"] == spectators[1].frames[-1]["version"]
+
+
+class HangingWebsocket(BroadcastWebsocket):
+    """A lagging spectator that never finishes the closing handshake."""
+
+    def __init__(self):
+        super().__init__()
+        self.closing = False
+
+    async def close(self, code=1000, reason=""):
+        self.closing = True
+        await asyncio.Event().wait()
+
+
+def test_spectators_closed_at_once():
+    async def run():
+        audience = Audience()
+        spectators = [HangingWebsocket() for _ in range(3)]
+        for websocket in spectators:
+            audience.add(websocket, None)
+
+        closing = asyncio.create_task(audience.close())
+        await asyncio.sleep(0.01)
+        # one hanging spectator doesn't keep the others from being closed
+        assert all(websocket.closing for websocket in spectators)
+        assert not audience
+        closing.cancel()
+
+    asyncio.run(run())
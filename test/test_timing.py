@@ -0,0 +1,52 @@
+import asyncio
+import time
+from collections import deque
+from random import Random
+
+from server import timing
+from server.agents import RandomBot
+from server.constants import Player
+from server.engine import Engine
+from server.game import play_one_game
+from server.state import new_state
+
+
+def test_histogram_quantiles():
+    histogram = timing.Histogram()
+    for micros in [1, 2, 3, 100, 1000]:
+        histogram.add(micros / 1e6)
+
+    assert histogram.count == 5
+    assert histogram.quantile(0.5) == 4 / 1e6
+    assert histogram.quantile(1) == histogram.max == 1000 / 1e6
+
+
+def test_phases_split_engine_time():
+    rng, chooser = Random(3), Random(3)
+    timings = timing.GameTimings()
+    start = time.perf_counter()
+    state = new_state({Player.N: 0, Player.S: 0}, "default", rng)
+    engine = Engine(state, rng, timings=timings)
+    while not engine.is_terminal():
+        engine.step(chooser.choice(engine.legal_decisions()))
+    seconds = time.perf_counter() - start
+
+    assert {"bonus", "select_action", "resolve_action"} <= timings.compute.keys()
+    # nested phases aren't counted twice
+    assert sum(h.total for h in timings.compute.values()) < seconds
+    assert all(h.total >= 0 for h in timings.compute.values())
+    assert timing.active is None
+
+
+def test_games_record_waits(monkeypatch):
+    monkeypatch.setattr(timing, "TIMINGS_PATH", "unused")
+    monkeypatch.setattr(timing, "RECENT", deque())
+    players = {Player.N: RandomBot(Random(1)), Player.S: RandomBot(Random(2))}
+
+    asyncio.run(play_one_game({Player.N: 0, Player.S: 0}, players, "default", 5))
+
+    summary = timing.summary()
+    assert summary["games"] == 1
+    assert summary["compute"]["broadcast"]["count"] > 0
+    assert summary["wait"]["select_action"]["count"] > 0
+    assert "other" not in summary["wait"]
@@ -0,0 +1,30 @@
+import asyncio
+import json
+
+from server import trace
+from server.constants import Player
+from server.game import play_one_game
+from test.clients import seat
+
+
+def test_traces_one_game(tmp_path, monkeypatch):
+    monkeypatch.setattr(trace, "TRACE_DIR", str(tmp_path))
+    trace.arm()
+
+    async def run():
+        for seed in range(2):
+            with trace.game():
+                await play_one_game(
+                    {Player.N: 0, Player.S: 0}, seat("clients", seed), "default", seed
+                )
+
+    asyncio.run(run())
+
+    (path,) = tmp_path.iterdir()
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+    assert events[0]["args"] == {"seed": 0, "tileset": "default"}
+    names = {event["name"] for event in events[1:]}
+    assert {"prompt", "broadcast", "step", "valid_targets", "State.log"} <= names
+    assert all(event["dur"] >= 0 for event in events[1:])
+    assert trace.current.get() is None